@@ -14,12 +14,19 @@
 // with this program; if not, write to the Free Software Foundation, Inc.,
 // 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+#include <thread>
+
+#include "absl/container/flat_hash_map.h"
+#include "absl/strings/str_cat.h"
 #include "absl/strings/str_format.h"
+#include "absl/synchronization/mutex.h"
 #include "absl/types/span.h"
 #include "binaryninjaapi.h"
 #include "glog/logging.h"
 #include "lowlevelilinstruction.h"
+#include "plugin/decoder.h"
 #include "plugin/hex_regs.h"
+#include "plugin/hex_regs_info.h"
 #include "plugin/il_util.h"
 #include "plugin/insn_util.h"
 #include "plugin/packet_db.h"
@@ -27,6 +34,11 @@
 
 using namespace BinaryNinja;
 
+constexpr char kPacketCacheSizeSetting[] = "arch.hexagon.packetCacheSize";
+constexpr char kPacketCacheDirectorySetting[] =
+    "arch.hexagon.packetCacheDirectory";
+constexpr char kDecoderMemoSizeSetting[] = "arch.hexagon.decoderMemoSize";
+
 class HexagonCallingConvention : public CallingConvention {
 public:
   HexagonCallingConvention(Architecture *arch)
@@ -131,10 +143,137 @@ public:
   }
 };
 
+// Identifies binary views in the packet database. A view's object may be
+// reused by a view opened after it is destroyed, so each view gets an id of
+// its own until Remove() is called.
+class ViewIds {
+public:
+  // Returns the id of |view|, assigning a new one if it has none.
+  uint64_t Get(BinaryView *view) ABSL_LOCKS_EXCLUDED(mu_) {
+    absl::MutexLock lock(&mu_);
+    auto [it, added] = ids_.try_emplace(view->GetObject(), next_id_);
+    if (added) {
+      next_id_++;
+    }
+    return it->second;
+  }
+
+  // Forgets |view|, and sets |id| to its id. Returns false if |view| has no
+  // id.
+  bool Remove(BinaryView *view, uint64_t &id) ABSL_LOCKS_EXCLUDED(mu_) {
+    absl::MutexLock lock(&mu_);
+    auto it = ids_.find(view->GetObject());
+    if (it == ids_.end()) {
+      return false;
+    }
+    id = it->second;
+    ids_.erase(it);
+    return true;
+  }
+
+private:
+  absl::Mutex mu_;
+  absl::flat_hash_map<BNBinaryView *, uint64_t> ids_ ABSL_GUARDED_BY(mu_);
+  uint64_t next_id_ ABSL_GUARDED_BY(mu_) = 1;
+};
+
+// Calls |fn| with the address and bytes of each executable segment of
+// |view|. Packets are word aligned, so are the bytes.
+template <typename Fn> void ForEachExecutableSegment(BinaryView *view, Fn fn) {
+  for (const auto &segment : view->GetSegments()) {
+    if (!(segment->GetFlags() & SegmentExecutable)) {
+      continue;
+    }
+    const uint64_t start = (segment->GetStart() + 3) & ~3ULL;
+    const uint64_t end = segment->GetEnd() & ~3ULL;
+    if (end <= start) {
+      continue;
+    }
+    DataBuffer buffer = view->ReadBuffer(start, end - start);
+    fn(start,
+       absl::MakeConstSpan(static_cast<const uint8_t *>(buffer.GetData()),
+                           buffer.GetLength() & ~3ULL));
+  }
+}
+
+// Drops decoded packets when bytes of a binary view change, and refreshes
+// the view's section bytes. Packets that other views still hold are kept.
+class PacketDbInvalidator : public BinaryDataNotification {
+public:
+  PacketDbInvalidator(PacketDb *packet_db, ViewIds *view_ids)
+      : packet_db_(packet_db), view_ids_(view_ids) {}
+
+  void OnBinaryDataWritten(BinaryView *view, uint64_t offset,
+                           size_t len) override {
+    const uint64_t start = offset & ~3ULL;
+    const uint64_t end = (offset + len + 3) & ~3ULL;
+    DataBuffer buffer = view->ReadBuffer(start, end - start);
+    packet_db_->UpdateSectionBytes(
+        view_ids_->Get(view),
+        absl::MakeConstSpan(static_cast<const uint8_t *>(buffer.GetData()),
+                            buffer.GetLength()),
+        start);
+    packet_db_->InvalidateRange(view_ids_->Get(view), offset, offset + len);
+  }
+
+  // Inserting or removing bytes moves all bytes that follow, up to the end
+  // of the view.
+  void OnBinaryDataInserted(BinaryView *view, uint64_t offset,
+                            size_t len) override {
+    ReadSectionBytes(view);
+    packet_db_->InvalidateRange(view_ids_->Get(view), offset, view->GetEnd());
+  }
+
+  void OnBinaryDataRemoved(BinaryView *view, uint64_t offset,
+                           uint64_t len) override {
+    ReadSectionBytes(view);
+    packet_db_->InvalidateRange(view_ids_->Get(view), offset,
+                                view->GetEnd() + len);
+  }
+
+private:
+  void ReadSectionBytes(BinaryView *view) {
+    const uint64_t view_id = view_ids_->Get(view);
+    packet_db_->RemoveSectionBytes(view_id);
+    ForEachExecutableSegment(
+        view, [&](uint64_t start, absl::Span<const uint8_t> bytes) {
+          packet_db_->AddSectionBytes(view_id, bytes, start);
+        });
+  }
+
+  PacketDb *packet_db_;
+  ViewIds *view_ids_;
+};
+
+// Releases the section bytes of binary views when they are destroyed, and
+// the packets that no other view holds.
+class PacketDbReleaser : public ObjectDestructor {
+public:
+  PacketDbReleaser(PacketDb *packet_db, ViewIds *view_ids)
+      : packet_db_(packet_db), view_ids_(view_ids) {}
+
+  void DestructBinaryView(BinaryView *view) override {
+    uint64_t view_id;
+    if (view_ids_->Remove(view, view_id)) {
+      packet_db_->RemoveView(view_id);
+    }
+  }
+
+private:
+  PacketDb *packet_db_;
+  ViewIds *view_ids_;
+};
+
 class HexagonArchitecture : public Architecture {
 protected:
 public:
-  HexagonArchitecture(const std::string &name) : Architecture(name) {}
+  HexagonArchitecture(const std::string &name, size_t packet_db_capacity)
+      : Architecture(name), packet_db_(packet_db_capacity),
+        invalidator_(&packet_db_, &view_ids_),
+        releaser_(&packet_db_, &view_ids_),
+        // A bounded database would evict most of the packets before they
+        // are used.
+        predecode_(packet_db_capacity == 0) {}
 
   size_t GetAddressSize() const override { return 4; }
   BNEndianness GetEndianness() const override { return LittleEndian; }
@@ -145,13 +284,10 @@ public:
 
   bool GetInstructionInfo(const uint8_t *data, uint64_t addr, size_t maxLen,
                           InstructionInfo &result) override {
-    auto match_or = packet_db_.Lookup(addr);
+    auto match_or =
+        packet_db_.LookupOrAddBytes(absl::MakeConstSpan(data, maxLen), addr);
     if (!match_or.ok()) {
-      if (!packet_db_.AddBytes(absl::MakeConstSpan(data, maxLen), addr).ok()) {
-        return false;
-      }
-      match_or = packet_db_.Lookup(addr);
-      CHECK(match_or.ok()) << "Lookup() failed after AddBytes()";
+      return false;
     }
     auto status = FillBnInstructionInfo(match_or.value(), result);
     if (!status.ok()) {
@@ -163,13 +299,10 @@ public:
 
   bool GetInstructionText(const uint8_t *data, uint64_t addr, size_t &len,
                           std::vector<InstructionTextToken> &result) override {
-    auto match_or = packet_db_.Lookup(addr);
+    auto match_or =
+        packet_db_.LookupOrAddBytes(absl::MakeConstSpan(data, len), addr);
     if (!match_or.ok()) {
-      if (!packet_db_.AddBytes(absl::MakeConstSpan(data, len), addr).ok()) {
-        return false;
-      }
-      match_or = packet_db_.Lookup(addr);
-      CHECK(match_or.ok()) << "Lookup() failed after AddBytes()";
+      return false;
     }
     auto status = FillBnInstructionTextTokens(match_or.value(), len, result);
     if (!status.ok()) {
@@ -181,13 +314,10 @@ public:
 
   bool GetInstructionLowLevelIL(const uint8_t *data, uint64_t addr, size_t &len,
                                 LowLevelILFunction &il) override {
-    auto match_or = packet_db_.Lookup(addr);
+    auto match_or =
+        packet_db_.LookupOrAddBytes(absl::MakeConstSpan(data, len), addr);
     if (!match_or.ok()) {
-      if (!packet_db_.AddBytes(absl::MakeConstSpan(data, len), addr).ok()) {
-        return false;
-      }
-      match_or = packet_db_.Lookup(addr);
-      CHECK(match_or.ok()) << "Lookup() failed after AddBytes()";
+      return false;
     }
     auto status = FillBnInstructionLowLevelIL(this, match_or.value(), len, il);
     if (!status.ok()) {
@@ -198,41 +328,12 @@ public:
   }
 
   std::vector<uint32_t> GetFullWidthRegisters() override {
-    // TODO: add VRegs, QRegs.
-    return std::vector<uint32_t>{
-        HEX_REG_R00, HEX_REG_R01, HEX_REG_R02, HEX_REG_R03, HEX_REG_R04,
-        HEX_REG_R05, HEX_REG_R06, HEX_REG_R07, HEX_REG_R08, HEX_REG_R09,
-        HEX_REG_R10, HEX_REG_R11, HEX_REG_R12, HEX_REG_R13, HEX_REG_R14,
-        HEX_REG_R15, HEX_REG_R16, HEX_REG_R17, HEX_REG_R18, HEX_REG_R19,
-        HEX_REG_R20, HEX_REG_R21, HEX_REG_R22, HEX_REG_R23, HEX_REG_R24,
-        HEX_REG_R25, HEX_REG_R26, HEX_REG_R27, HEX_REG_R28, HEX_REG_R29,
-        HEX_REG_R30, HEX_REG_R31, HEX_REG_C00, HEX_REG_C01, HEX_REG_C02,
-        HEX_REG_C03, HEX_REG_C04, HEX_REG_C05, HEX_REG_C06, HEX_REG_C07,
-        HEX_REG_C08, HEX_REG_C09, HEX_REG_C10, HEX_REG_C11, HEX_REG_C12,
-        HEX_REG_C13, HEX_REG_C14, HEX_REG_C15, HEX_REG_C16, HEX_REG_C17,
-        HEX_REG_C18, HEX_REG_C19, HEX_REG_C20, HEX_REG_C21, HEX_REG_C22,
-        HEX_REG_C23, HEX_REG_C24, HEX_REG_C25, HEX_REG_C26, HEX_REG_C27,
-        HEX_REG_C28, HEX_REG_C29, HEX_REG_C30, HEX_REG_C31,
-    };
+    return std::vector<uint32_t>(kHexFullWidthRegs.begin(),
+                                 kHexFullWidthRegs.end());
   }
 
   std::vector<uint32_t> GetAllRegisters() override {
-    // TODO: add VRegs, QRegs.
-    return std::vector<uint32_t>{
-        HEX_REG_R00, HEX_REG_R01, HEX_REG_R02, HEX_REG_R03,      HEX_REG_R04,
-        HEX_REG_R05, HEX_REG_R06, HEX_REG_R07, HEX_REG_R08,      HEX_REG_R09,
-        HEX_REG_R10, HEX_REG_R11, HEX_REG_R12, HEX_REG_R13,      HEX_REG_R14,
-        HEX_REG_R15, HEX_REG_R16, HEX_REG_R17, HEX_REG_R18,      HEX_REG_R19,
-        HEX_REG_R20, HEX_REG_R21, HEX_REG_R22, HEX_REG_R23,      HEX_REG_R24,
-        HEX_REG_R25, HEX_REG_R26, HEX_REG_R27, HEX_REG_R28,      HEX_REG_R29,
-        HEX_REG_R30, HEX_REG_R31, HEX_REG_C00, HEX_REG_C01,      HEX_REG_C02,
-        HEX_REG_C03, HEX_REG_C04, HEX_REG_C05, HEX_REG_C06,      HEX_REG_C07,
-        HEX_REG_C08, HEX_REG_C09, HEX_REG_C10, HEX_REG_C11,      HEX_REG_C12,
-        HEX_REG_C13, HEX_REG_C14, HEX_REG_C15, HEX_REG_C16,      HEX_REG_C17,
-        HEX_REG_C18, HEX_REG_C19, HEX_REG_C20, HEX_REG_C21,      HEX_REG_C22,
-        HEX_REG_C23, HEX_REG_C24, HEX_REG_C25, HEX_REG_C26,      HEX_REG_C27,
-        HEX_REG_C28, HEX_REG_C29, HEX_REG_C30, HEX_REG_C31,      HEX_REG_P0,
-        HEX_REG_P1,  HEX_REG_P2,  HEX_REG_P3,  HEX_REG_USR_LPCFG};
+    return std::vector<uint32_t>(kHexAllRegs.begin(), kHexAllRegs.end());
   }
 
   std::vector<uint32_t> GetAllFlags() override {
@@ -240,58 +341,10 @@ public:
   }
 
   std::string GetRegisterName(uint32_t reg) override {
-    switch (reg) {
-    case HEX_REG_R00 ... HEX_REG_R28:
-      return absl::StrFormat("R%d", reg - HEX_REG_R00);
-    case HEX_REG_SP: // R29
-      return "SP";
-    case HEX_REG_FP: // R30
-      return "FP";
-    case HEX_REG_LR: // R31
-      return "LR";
-    case HEX_REG_SA0: // C00
-      return "SA0";
-    case HEX_REG_LC0: // C01
-      return "LC0";
-    case HEX_REG_SA1: // C02
-      return "SA1";
-    case HEX_REG_LC1: // C03
-      return "LC1";
-    case HEX_REG_P3_0: // C04
-      return "P3:0";
-    case HEX_REG_C05:
-      return "C5";
-    case HEX_REG_M0: // C06
-      return "M0";
-    case HEX_REG_M1: // C07
-      return "M1";
-    case HEX_REG_USR: // C08
-      return "USR";
-    case HEX_REG_PC: // C09
-      return "PC";
-    case HEX_REG_UGP: // C10
-      return "UGP";
-    case HEX_REG_GP: // C11
-      return "GP";
-    case HEX_REG_CS0: // C12
-      return "CS0";
-    case HEX_REG_CS1: // C13
-      return "CS1";
-    case HEX_REG_C14 ... HEX_REG_C31:
-      return absl::StrFormat("C%d", reg - HEX_REG_C00);
-    case HEX_REG_P0: // Subreg of HEX_REG_P3_0
-      return "P0";
-    case HEX_REG_P1: // Subreg of HEX_REG_P3_0
-      return "P1";
-    case HEX_REG_P2: // Subreg of HEX_REG_P3_0
-      return "P2";
-    case HEX_REG_P3: // Subreg of HEX_REG_P3_0
-      return "P3";
-    case HEX_REG_USR_LPCFG: // Subreg of HEX_REG_USR
-      return "LPCFG";
-    default:
-      LOG(ERROR) << "Unexpected GetRegisterName for reg " << reg;
+    if (reg < kHexRegs.size() && !kHexRegs[reg].name.empty()) {
+      return std::string(kHexRegs[reg].name);
     }
+    LOG(ERROR) << "Unexpected GetRegisterName for reg " << reg;
     return "??";
   }
 
@@ -303,40 +356,17 @@ public:
   virtual BNRegisterInfo GetRegisterInfo(uint32_t reg) override {
     // Skip temp registers.
     if (LLIL_REG_IS_TEMP(reg)) {
-      // TODO: map single 32b registers to 64b pairs in LLIL_TEMP register
-      // space.
-      switch (LLIL_GET_TEMP_REG_INDEX(reg)) {
-      case HEX_REG_P0:
-      case HEX_REG_P1:
-      case HEX_REG_P2:
-      case HEX_REG_P3:
-        return BNRegisterInfo{reg, 0, 1, NoExtend};
-      default:
-        return BNRegisterInfo{reg, 0, 4, NoExtend};
-      }
+      const uint32_t index = LLIL_GET_TEMP_REG_INDEX(reg);
+      return BNRegisterInfo{reg, 0, HexTempRegSize(index), NoExtend};
     }
 
-    // All registers are 32bit long.
     // TODO: add support for ".L", ".H" sub registers.
-    switch (reg) {
-    case HEX_REG_P0:
-      return BNRegisterInfo{HEX_REG_P3_0, 0, 1, NoExtend};
-    case HEX_REG_P1:
-      return BNRegisterInfo{HEX_REG_P3_0, 1, 1, NoExtend};
-    case HEX_REG_P2:
-      return BNRegisterInfo{HEX_REG_P3_0, 2, 1, NoExtend};
-    case HEX_REG_P3:
-      return BNRegisterInfo{HEX_REG_P3_0, 3, 1, NoExtend};
-    case HEX_REG_USR_LPCFG:
-      CHECK_EQ(reg_field_info[REG_FIELD_USR_LPCFG].offset, 8);
-      return BNRegisterInfo{HEX_REG_USR, 1, 1, NoExtend};
-    case HEX_REG_R00 ... HEX_REG_R31:
-      return BNRegisterInfo{reg, 0, 4, NoExtend};
-    case HEX_REG_C00 ... HEX_REG_C31:
-      return BNRegisterInfo{reg, 0, 4, NoExtend};
-    default:
-      LOG(ERROR) << "Unexpected GetRegisterInfo for reg " << reg;
+    if (reg < kHexRegs.size() && kHexRegs[reg].size != 0) {
+      const HexRegInfo &info = kHexRegs[reg];
+      return BNRegisterInfo{info.full_width_reg, info.offset, info.size,
+                            NoExtend};
     }
+    LOG(ERROR) << "Unexpected GetRegisterInfo for reg " << reg;
     return BNRegisterInfo{reg, 0, 4, NoExtend};
   }
 
@@ -344,8 +374,97 @@ public:
 
   uint32_t GetLinkRegister() override { return HEX_REG_LR; }
 
+  // Adds the bytes of all executable segments of |view| to the packet
+  // database, and decodes them ahead of analysis if the database is
+  // unbounded. If a cache directory is configured, packets are loaded from,
+  // or saved to, files keyed by the segment contents.
+  void AddSegments(BinaryView *view) {
+    if (view->GetDefaultArchitecture().GetPtr() != this) {
+      return;
+    }
+    const std::string cache_dir =
+        Settings::Instance()->Get<std::string>(kPacketCacheDirectorySetting,
+                                               view);
+    ForEachExecutableSegment(view, [&](uint64_t start,
+                                       absl::Span<const uint8_t> bytes) {
+      packet_db_.AddSectionBytes(view_ids_.Get(view), bytes, start);
+      if (!predecode_) {
+        return;
+      }
+      std::string path;
+      if (!cache_dir.empty()) {
+        path = absl::StrCat(
+            cache_dir, "/",
+            absl::Hex(PacketDb::SectionKey(bytes, start), absl::kZeroPad16),
+            ".pktdb");
+        auto status = packet_db_.LoadSection(bytes, start, path);
+        if (status.ok()) {
+          return;
+        }
+        if (!absl::IsNotFound(status)) {
+          LOG(WARNING) << "Rebuilding packet cache file: " << status;
+        }
+      }
+      auto status = packet_db_.AddSection(bytes, start,
+                                          std::thread::hardware_concurrency());
+      if (!status.ok()) {
+        LOG(WARNING) << "AddSection failed at " << std::hex << start << " "
+                     << status;
+        return;
+      }
+      if (!path.empty()) {
+        status = packet_db_.SaveSection(bytes, start, path);
+        if (!status.ok()) {
+          LOG(WARNING) << "SaveSection failed " << status;
+        }
+      }
+    });
+  }
+
+  // Invalidates decoded packets when bytes of |view| change, e.g. when they
+  // are patched.
+  void WatchDataChanges(BinaryView *view) {
+    if (view->GetDefaultArchitecture().GetPtr() != this) {
+      return;
+    }
+    view->RegisterNotification(&invalidator_);
+  }
+
+  // Logs packet database, decoder and cache counters, e.g. after initial
+  // analysis of |view|.
+  void LogPacketDbStats(BinaryView *view) {
+    if (view->GetDefaultArchitecture().GetPtr() != this) {
+      return;
+    }
+    PacketDb::Stats stats = packet_db_.GetStats();
+    const uint64_t searches =
+        stats.thread_cache_hits + stats.thread_cache_misses;
+    LOG(INFO) << "Packet database: " << stats.hits << " hits, " << stats.misses
+              << " misses, " << stats.evictions << " evictions, "
+              << stats.mismatches << " mismatches, thread cache hit rate "
+              << absl::StrFormat("%.1f%%",
+                                 searches == 0 ? 0.0
+                                               : 100.0 *
+                                                     stats.thread_cache_hits /
+                                                     searches);
+    // Shared by all views, see arch.hexagon.decoderMemoSize.
+    Decoder::MemoStats memo_stats = Decoder::Get().GetMemoStats();
+    const uint64_t decodes = memo_stats.hits + memo_stats.misses;
+    LOG(INFO) << "Decoder memo: " << memo_stats.hits << " hits, "
+              << memo_stats.misses << " misses, hit rate "
+              << absl::StrFormat("%.1f%%",
+                                 decodes == 0
+                                     ? 0.0
+                                     : 100.0 * memo_stats.hits / decodes);
+  }
+
 private:
   PacketDb packet_db_;
+  ViewIds view_ids_;
+  PacketDbInvalidator invalidator_;
+  // Registered on construction, so it is constructed after what it uses.
+  PacketDbReleaser releaser_;
+  const bool predecode_;
 };
 
 extern "C" {
@@ -356,9 +475,47 @@ BINARYNINJAPLUGIN void CorePluginDependencies() {
 }
   
 BINARYNINJAPLUGIN bool CorePluginInit() {
-  Architecture *hexagon = new HexagonArchitecture("hexagon");
+  Ref<Settings> settings = Settings::Instance();
+  settings->RegisterGroup("arch", "Architecture");
+  settings->RegisterSetting(kPacketCacheSizeSetting,
+                            R"({
+      "title" : "Hexagon Packet Cache Size",
+      "type" : "number",
+      "default" : 0,
+      "description" : "Maximum number of decoded Hexagon packets kept in memory. Least recently used packets are evicted, and decoded again on demand. Copies of executable segment bytes are bounded to the words these packets can hold. Zero means unbounded. Segment bytes and packets of a binary view are released when it is closed, unless another view holds them. Takes effect on restart.",
+      "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    })");
+  settings->RegisterSetting(kPacketCacheDirectorySetting,
+                            R"({
+      "title" : "Hexagon Packet Cache Directory",
+      "type" : "string",
+      "default" : "",
+      "description" : "Directory that holds decoded Hexagon packets of executable segments, keyed by segment contents. Reopening the same binary loads packets instead of decoding them again. Empty disables the cache."
+    })");
+  settings->RegisterSetting(kDecoderMemoSizeSetting,
+                            R"({
+      "title" : "Hexagon Decoder Memo Size",
+      "type" : "number",
+      "default" : 4096,
+      "description" : "Maximum number of decoded Hexagon packets remembered per thread by their encoding, so that recurring packets are not decoded again. Zero disables memoization. The hit rate is logged after initial analysis. Takes effect on restart.",
+      "ignore" : ["SettingsProjectScope", "SettingsResourceScope"]
+    })");
+  Decoder::Get().SetMemoCapacity(
+      settings->Get<uint64_t>(kDecoderMemoSizeSetting));
+  const uint64_t packet_db_capacity =
+      settings->Get<uint64_t>(kPacketCacheSizeSetting);
+  HexagonArchitecture *hexagon =
+      new HexagonArchitecture("hexagon", packet_db_capacity);
   Architecture::Register(hexagon);
 
+  // Warm up the packet database before initial analysis.
+  BinaryViewType::RegisterBinaryViewFinalizationEvent(
+      [hexagon](BinaryView *view) { hexagon->AddSegments(view); });
+  BinaryViewType::RegisterBinaryViewFinalizationEvent(
+      [hexagon](BinaryView *view) { hexagon->WatchDataChanges(view); });
+  BinaryViewType::RegisterBinaryViewInitialAnalysisCompletionEvent(
+      [hexagon](BinaryView *view) { hexagon->LogPacketDbStats(view); });
+
   // Register calling convention.
   Ref<CallingConvention> conv;
   conv = new HexagonCallingConvention(hexagon);
@@ -16,16 +16,56 @@
 
 #include "plugin/decoder.h"
 
+#include <array>
+
+#include "absl/container/flat_hash_map.h"
 #include "absl/status/status.h"
 #include "absl/strings/str_cat.h"
+#include "third_party/qemu-hexagon/cpu_bits.h"
 #include "third_party/qemu-hexagon/decode.h"
 #include "third_party/qemu-hexagon/opcodes.h"
 
-Decoder::Decoder() {
-  // Initialize decoding tables.
-  decode_init();
-  opcode_init();
+namespace {
+
+// Packet words up to, and including, the end-of-packet marker.
+using MemoKey = std::array<uint32_t, PACKET_WORDS_MAX>;
+
+// Maps packet words to decoded packets. Decoded packets depend only on their
+// words: PC-relative immediates hold the encoded offset, and are resolved by
+// users against the packet address.
+// Each thread has its own memo, so that hits take no locks.
+struct ThreadMemo {
+  uint64_t generation = 0;
+  absl::flat_hash_map<MemoKey, Packet> packets;
+};
+
+thread_local ThreadMemo thread_memo;
+
+// Fills |key| with the packet words at the start of |words|. Returns false if
+// there is no end-of-packet marker within PACKET_WORDS_MAX words.
+bool GetMemoKey(absl::Span<const uint32_t> words, MemoKey &key) {
+  key = {};
+  for (size_t i = 0; i < words.size() && i < key.size(); i++) {
+    key[i] = words[i];
+    if (is_packet_end(words[i])) {
+      return true;
+    }
+  }
+  return false;
+}
+
+// Converts a failed decode_packet_safe() result to status.
+absl::Status DecodeStatus(int res) {
+  if (res < 0) {
+    return absl::InternalError(absl::StrFormat("Failed to decode, res = %x", res));
+  }
+  return absl::FailedPreconditionError("Insufficient words in packet");
 }
+
+} // namespace
+
+// The decoding tables are static, so there is nothing to initialize.
+Decoder::Decoder() {}
 Decoder::~Decoder() {}
 
 Decoder &Decoder::Get() {
@@ -36,16 +76,96 @@ Decoder &Decoder::Get() {
 
 absl::StatusOr<Packet> Decoder::DecodePacket(absl::Span<const uint32_t> words) {
   Packet pkt;
-  int res = decode_packet_safe(words.size(), words.data(), &pkt, true);
-  if (res < 0) {
-    return absl::InternalError(absl::StrFormat("Failed to decode, res = %x", res));
-  }
-  if (res == 0) {
-    return absl::FailedPreconditionError("Insufficient words in packet");
+  int res = DecodePacketMemoized(words, &pkt);
+  if (res <= 0) {
+    return DecodeStatus(res);
   }
   return pkt;
 }
 
+Decoder::DecodeResult Decoder::DecodePackets(absl::Span<const uint32_t> words,
+                                             absl::Span<Packet> packets) {
+  DecodeResult result = {.num_packets = 0, .num_words = 0};
+  const bool memoize = memo_capacity_.load(std::memory_order_relaxed) > 0;
+  while (result.num_packets < packets.size() &&
+         result.num_words < words.size()) {
+    auto rest = words.subspan(result.num_words);
+    Packet *pkt = &packets[result.num_packets];
+    int res;
+    if (memoize) {
+      res = DecodePacketMemoized(rest, pkt);
+      if (res > 0) {
+        result.num_packets++;
+        result.num_words += res;
+      }
+    } else {
+      // Decode the rest in one go, without setting up error recovery for each
+      // packet.
+      int num_words = 0;
+      result.num_packets += decode_packets_safe(
+          rest.size(), rest.data(), pkt, packets.size() - result.num_packets,
+          true, &num_words, &res);
+      result.num_words += num_words;
+    }
+    if (res <= 0) {
+      result.status = DecodeStatus(res);
+      break;
+    }
+  }
+  return result;
+}
+
+int Decoder::DecodePacketMemoized(absl::Span<const uint32_t> words,
+                                  Packet *pkt) {
+  const size_t memo_capacity = memo_capacity_.load(std::memory_order_relaxed);
+  MemoKey key;
+  ThreadMemo *memo = nullptr;
+  if (memo_capacity > 0 && GetMemoKey(words, key)) {
+    memo = &thread_memo;
+    const uint64_t generation =
+        memo_generation_.load(std::memory_order_relaxed);
+    if (memo->generation != generation) {
+      memo->packets.clear();
+      memo->generation = generation;
+    }
+    auto it = memo->packets.find(key);
+    if (it != memo->packets.end()) {
+      memo_hits_.fetch_add(1, std::memory_order_relaxed);
+      *pkt = it->second;
+      return pkt->encod_pkt_size_in_bytes / 4;
+    }
+    memo_misses_.fetch_add(1, std::memory_order_relaxed);
+  }
+  int res = decode_packet_safe(words.size(), words.data(), pkt, true);
+  if (res > 0 && memo != nullptr) {
+    if (memo->packets.size() >= memo_capacity) {
+      memo->packets.clear();
+    }
+    memo->packets.emplace(key, *pkt);
+  }
+  return res;
+}
+
+void Decoder::SetMemoCapacity(size_t capacity) {
+  memo_capacity_ = capacity;
+  memo_generation_++;
+}
+
+Decoder::MemoStats Decoder::GetMemoStats() const {
+  return MemoStats{
+      .hits = memo_hits_.load(),
+      .misses = memo_misses_.load(),
+  };
+}
+
+Packet PreparePacketForLifting(const Packet &src) {
+  Packet copy = src;
+  decode_remove_extenders(&copy);
+  decode_shuffle_for_execution(&copy);
+  decode_split_cmpjump(&copy);
+  return copy;
+}
+
 bool operator==(const Insn &lhs, const Insn &rhs) {
   bool ok = (memcmp(lhs.regno, rhs.regno, sizeof(lhs.regno)) == 0);
   ok &= (lhs.opcode == rhs.opcode && lhs.iclass == rhs.iclass &&
@@ -18,6 +18,8 @@
 
 #pragma once
 
+#include <atomic>
+
 #include "absl/status/statusor.h"
 #include "absl/types/span.h"
 #include "third_party/qemu-hexagon/attribs.h"
@@ -28,15 +30,59 @@
 
 class Decoder {
 public:
+  struct MemoStats {
+    uint64_t hits;
+    uint64_t misses;
+  };
+
+  struct DecodeResult {
+    // Number of packets written to the output.
+    size_t num_packets;
+    // Number of words in the decoded packets. If |status| is not OK, this is
+    // the offset of the first packet that failed to decode.
+    size_t num_words;
+    absl::Status status;
+  };
+
+  // Bump whenever decoded packets change for the same input words, e.g. on
+  // decoding tables or Packet layout updates. Invalidates persisted packets.
+  static constexpr uint32_t kVersion = 1;
+
   ~Decoder();
   static Decoder &Get();
 
   absl::StatusOr<Packet> DecodePacket(absl::Span<const uint32_t> words);
 
+  // Decodes consecutive packets at the start of |words| into |packets|, as
+  // calling DecodePacket() at each packet would. Stops when all words are
+  // decoded, when |packets| is full, or at the first packet that fails to
+  // decode.
+  DecodeResult DecodePackets(absl::Span<const uint32_t> words,
+                             absl::Span<Packet> packets);
+
+  // Memoizes up to |capacity| decoded packets per thread, keyed by their
+  // words. Zero disables memoization.
+  void SetMemoCapacity(size_t capacity);
+  MemoStats GetMemoStats() const;
+
 private:
   Decoder();
+
+  // Returns the decode_packet_safe() result of decoding the packet at the
+  // start of |words| into |pkt|, using memoized packets.
+  int DecodePacketMemoized(absl::Span<const uint32_t> words, Packet *pkt);
+
+  std::atomic<size_t> memo_capacity_{0};
+  // Bumped to invalidate all threads' memoized packets.
+  std::atomic<uint64_t> memo_generation_{0};
+  std::atomic<uint64_t> memo_hits_{0};
+  std::atomic<uint64_t> memo_misses_{0};
 };
 
+// Prepares packet for il lifting by removing no-op extender instructions,
+// moving dotnew instructions to the end and splitting cmpjump instructions.
+Packet PreparePacketForLifting(const Packet &src);
+
 bool operator==(const Insn &lhs, const Insn &rhs);
 bool operator!=(const Insn &lhs, const Insn &rhs);
 bool operator==(const Packet &lhs, const Packet &rhs);
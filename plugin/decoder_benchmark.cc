@@ -0,0 +1,233 @@
+// Copyright (C) 2020 Google LLC
+//
+// This program is free software; you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation; either version 2 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License along
+// with this program; if not, write to the Free Software Foundation, Inc.,
+// 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+// Measures decoder throughput on the executable sections of Hexagon ELF
+// files. For example:
+//
+//   $ ./plugin/decoder_benchmark ../test_binaries/prebuilt/bn_hlil_test_app
+//
+// Each section is swept linearly, as PacketDb::AddSection() does.
+//
+// With --opcode_profile=<file>, writes the number of decoded instructions
+// of each opcode to <file> instead, for HEXAGON_DECODER_PROFILE.
+
+#include <elf.h>
+
+#include <algorithm>
+#include <chrono>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+#include <iterator>
+#include <string>
+#include <vector>
+
+#include "absl/strings/match.h"
+#include "absl/strings/str_format.h"
+#include "absl/types/span.h"
+#include "plugin/decoder.h"
+#include "third_party/qemu-hexagon/cpu_bits.h"
+#include "third_party/qemu-hexagon/decode.h"
+
+namespace {
+
+using Section = std::vector<uint32_t>;
+
+// Returns the words of all executable sections in ELF file |path|.
+std::vector<Section> ReadExecutableSections(const char *path) {
+  std::ifstream in(path, std::ios::binary);
+  std::vector<char> file((std::istreambuf_iterator<char>(in)),
+                         std::istreambuf_iterator<char>());
+  std::vector<Section> sections;
+  if (file.size() < sizeof(Elf32_Ehdr) ||
+      memcmp(file.data(), ELFMAG, SELFMAG) != 0) {
+    std::cerr << path << ": not an ELF file\n";
+    return sections;
+  }
+  Elf32_Ehdr ehdr;
+  memcpy(&ehdr, file.data(), sizeof(ehdr));
+  for (int i = 0; i < ehdr.e_shnum; i++) {
+    Elf32_Shdr shdr;
+    size_t offset = ehdr.e_shoff + i * sizeof(shdr);
+    if (offset + sizeof(shdr) > file.size()) {
+      break;
+    }
+    memcpy(&shdr, file.data() + offset, sizeof(shdr));
+    if (shdr.sh_type != SHT_PROGBITS || !(shdr.sh_flags & SHF_EXECINSTR) ||
+        shdr.sh_offset + shdr.sh_size > file.size()) {
+      continue;
+    }
+    Section section(shdr.sh_size / 4);
+    memcpy(section.data(), file.data() + shdr.sh_offset, section.size() * 4);
+    sections.push_back(std::move(section));
+  }
+  return sections;
+}
+
+// Decodes all packets in |words|, skipping words that fail to decode up to
+// the next end-of-packet boundary. Returns the number of decoded packets.
+size_t Sweep(absl::Span<const uint32_t> words) {
+  size_t num_packets = 0;
+  while (!words.empty()) {
+    auto result = Decoder::Get().DecodePacket(words);
+    size_t num_words = 0;
+    if (result.ok()) {
+      num_words = result->encod_pkt_size_in_bytes / 4;
+      num_packets++;
+    } else {
+      while (num_words < words.size() && !is_packet_end(words[num_words])) {
+        num_words++;
+      }
+      num_words = std::min(num_words + 1, words.size());
+    }
+    words = words.subspan(num_words);
+  }
+  return num_packets;
+}
+
+// Same as Sweep(), using Decoder::DecodePackets().
+size_t SweepBatched(absl::Span<const uint32_t> words) {
+  std::vector<Packet> packets(64);
+  size_t num_packets = 0;
+  while (!words.empty()) {
+    auto result =
+        Decoder::Get().DecodePackets(words, absl::MakeSpan(packets));
+    num_packets += result.num_packets;
+    size_t num_words = result.num_words;
+    if (!result.status.ok()) {
+      while (num_words < words.size() && !is_packet_end(words[num_words])) {
+        num_words++;
+      }
+      num_words = std::min(num_words + 1, words.size());
+    }
+    words = words.subspan(num_words);
+  }
+  return num_packets;
+}
+
+// Writes the number of instructions of each opcode in |sections| to |path|,
+// with a line "<opcode> <count>" per opcode.
+bool WriteOpcodeProfile(const std::string &path,
+                        const std::vector<Section> &sections) {
+  std::vector<uint64_t> counts(XX_LAST_OPCODE);
+  for (const auto &section : sections) {
+    absl::Span<const uint32_t> words = section;
+    while (!words.empty()) {
+      auto result = Decoder::Get().DecodePacket(words);
+      size_t num_words = 0;
+      if (result.ok()) {
+        for (int i = 0; i < result->num_insns; i++) {
+          counts[result->insn[i].opcode]++;
+        }
+        num_words = result->encod_pkt_size_in_bytes / 4;
+      } else {
+        while (num_words < words.size() && !is_packet_end(words[num_words])) {
+          num_words++;
+        }
+        num_words = std::min(num_words + 1, words.size());
+      }
+      words = words.subspan(num_words);
+    }
+  }
+  std::ofstream out(path);
+  for (int opcode = 0; opcode < XX_LAST_OPCODE; opcode++) {
+    if (counts[opcode] != 0) {
+      out << opcode_names[opcode] << " " << counts[opcode] << "\n";
+    }
+  }
+  return out.good();
+}
+
+// Sweeps all |sections| repeatedly for about a second, and prints the
+// decoding rate.
+void Run(const std::string &name, size_t (*sweep)(absl::Span<const uint32_t>),
+         const std::vector<Section> &sections) {
+  using Clock = std::chrono::steady_clock;
+  const auto start = Clock::now();
+  size_t num_packets = 0;
+  std::chrono::duration<double> elapsed;
+  do {
+    for (const auto &section : sections) {
+      num_packets += sweep(section);
+    }
+    elapsed = Clock::now() - start;
+  } while (elapsed.count() < 1.0);
+  std::cout << absl::StrFormat("%-24s %12.0f packets/s\n", name,
+                               num_packets / elapsed.count());
+}
+
+} // namespace
+
+int main(int argc, char **argv) {
+  constexpr char kProfileFlag[] = "--opcode_profile=";
+  std::string profile_path;
+  std::vector<Section> sections;
+  for (int i = 1; i < argc; i++) {
+    if (absl::StartsWith(argv[i], kProfileFlag)) {
+      profile_path = argv[i] + strlen(kProfileFlag);
+      continue;
+    }
+    auto file_sections = ReadExecutableSections(argv[i]);
+    sections.insert(sections.end(), file_sections.begin(),
+                    file_sections.end());
+  }
+  if (sections.empty()) {
+    std::cerr << "Usage: " << argv[0]
+              << " [--opcode_profile=<file>] <elf file>...\n";
+    return 1;
+  }
+  if (!profile_path.empty()) {
+    return WriteOpcodeProfile(profile_path, sections) ? 0 : 1;
+  }
+
+  // The first decode includes any setup of the Decoder singleton.
+  {
+    using Clock = std::chrono::steady_clock;
+    const auto start = Clock::now();
+    Decoder::Get().DecodePacket(sections[0]).IgnoreError();
+    std::chrono::duration<double, std::micro> elapsed = Clock::now() - start;
+    std::cout << absl::StrFormat("%-24s %12.1f us\n", "first decode",
+                                 elapsed.count());
+  }
+
+  // Duplexes always end their packet, so these are single-word packets.
+  Section duplexes;
+  for (const auto &section : sections) {
+    std::copy_if(section.begin(), section.end(), std::back_inserter(duplexes),
+                 [](uint32_t word) { return parse_bits(word) == 0; });
+  }
+
+  const DecodeBackend default_backend = decode_get_backend();
+  decode_set_backend(DECODE_BACKEND_TABLEWALK);
+  Run("decode (tablewalk)", Sweep, sections);
+  Run("duplexes (tablewalk)", Sweep, {duplexes});
+  decode_set_backend(DECODE_BACKEND_SWITCH);
+  Run("decode (switch)", Sweep, sections);
+  Run("duplexes (switch)", Sweep, {duplexes});
+  decode_set_backend(default_backend);
+
+  Run("decode", Sweep, sections);
+  Run("decode (batched)", SweepBatched, sections);
+
+  Decoder::Get().SetMemoCapacity(4096);
+  Run("decode (memo)", Sweep, sections);
+  Decoder::MemoStats stats = Decoder::Get().GetMemoStats();
+  std::cout << absl::StrFormat(
+      "  memo hit rate: %.2f%%\n",
+      100.0 * stats.hits / std::max<uint64_t>(stats.hits + stats.misses, 1));
+  Decoder::Get().SetMemoCapacity(0);
+  return 0;
+}
@@ -16,11 +16,17 @@
 
 #include "plugin/decoder.h"
 
+#include <random>
+
 #include "plugin/status_matchers.h"
 #include "gtest/gtest.h"
+#include "third_party/qemu-hexagon/cpu_bits.h"
+#include "third_party/qemu-hexagon/decode.h"
 
 namespace {
 
+using absl::IsOk;
+
 TEST(DecoderTest, DecodesSingleAluInstruction) {
   // 00 e0 00 78 7800e000 {  r0 = #256 }
   // alu.idef:
@@ -167,4 +173,155 @@ TEST(DecoderTest, FailsSafeOnInvalidAsciiStringRegression2) {
               absl::StatusIs(absl::StatusCode::kInternal));
 }
 
+TEST(DecoderTest, MemoizesPackets) {
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint32_t> words = {0x0dea76c0, 0x28b32811, 0x5bffff5c};
+  ASSERT_OK_AND_ASSIGN(Packet expected, Decoder::Get().DecodePacket(words));
+
+  Decoder::Get().SetMemoCapacity(16);
+  Decoder::MemoStats before = Decoder::Get().GetMemoStats();
+  ASSERT_OK_AND_ASSIGN(Packet pkt0, Decoder::Get().DecodePacket(words));
+  ASSERT_OK_AND_ASSIGN(Packet pkt1, Decoder::Get().DecodePacket(words));
+  // Trailing words are not part of the key.
+  ASSERT_OK_AND_ASSIGN(
+      Packet pkt2,
+      Decoder::Get().DecodePacket(absl::MakeConstSpan(words).first(2)));
+  Decoder::MemoStats after = Decoder::Get().GetMemoStats();
+  Decoder::Get().SetMemoCapacity(0);
+
+  EXPECT_EQ(pkt0, expected);
+  EXPECT_EQ(pkt1, expected);
+  EXPECT_EQ(pkt2, expected);
+  EXPECT_EQ(after.misses - before.misses, 1);
+  EXPECT_EQ(after.hits - before.hits, 2);
+}
+
+TEST(DecoderTest, DoesNotMemoizeFailures) {
+  Decoder::Get().SetMemoCapacity(16);
+  // ASCII string: "ub-ID:%d".
+  std::vector<uint32_t> words = {0x492D6275, 0x64253A44};
+  EXPECT_THAT(Decoder::Get().DecodePacket(words),
+              absl::StatusIs(absl::StatusCode::kInternal));
+  EXPECT_THAT(Decoder::Get().DecodePacket(words),
+              absl::StatusIs(absl::StatusCode::kInternal));
+  // 154:       ff 7f ff 0f 0fff7fff {  immext(#4294967232)
+  // 158:       28 60 03 10 10036028    p0 = cmp.eq(r3,#0); if (p0.new) jump:t
+  std::vector<uint32_t> short_words = {0x0fff7fff, 0x10036028};
+  EXPECT_THAT(Decoder::Get().DecodePacket(short_words),
+              absl::StatusIs(absl::StatusCode::kFailedPrecondition));
+  Decoder::Get().SetMemoCapacity(0);
+}
+
+// Decodes |words| one packet at a time with DecodePacket().
+std::vector<Packet> DecodeOneByOne(absl::Span<const uint32_t> words) {
+  std::vector<Packet> packets;
+  while (!words.empty()) {
+    auto pkt = Decoder::Get().DecodePacket(words);
+    if (!pkt.ok()) {
+      break;
+    }
+    packets.push_back(pkt.value());
+    words = words.subspan(pkt->encod_pkt_size_in_bytes / 4);
+  }
+  return packets;
+}
+
+TEST(DecoderTest, DecodePacketsMatchesDecodePacket) {
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  // 02 28 01 28 28012802 {  r1 = #0;        r2 = #0 }
+  // c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint32_t> words = {0x7800e000, 0x28012802, 0x0dea76c0,
+                                 0x28b32811, 0x5bffff5c};
+  std::vector<Packet> expected = DecodeOneByOne(words);
+  ASSERT_EQ(expected.size(), 4);
+
+  for (size_t memo_capacity : {0, 16}) {
+    Decoder::Get().SetMemoCapacity(memo_capacity);
+    std::vector<Packet> packets(8);
+    auto result = Decoder::Get().DecodePackets(words, absl::MakeSpan(packets));
+    EXPECT_THAT(result.status, IsOk());
+    EXPECT_EQ(result.num_packets, 4);
+    EXPECT_EQ(result.num_words, 5);
+    packets.resize(result.num_packets);
+    EXPECT_EQ(packets, expected);
+  }
+  Decoder::Get().SetMemoCapacity(0);
+}
+
+TEST(DecoderTest, DecodePacketsReportsFirstFailure) {
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  // 02 28 01 28 28012802 {  r1 = #0;        r2 = #0 }
+  // ASCII string: "ub-ID:%d".
+  std::vector<uint32_t> words = {0x7800e000, 0x28012802, 0x492D6275,
+                                 0x64253A44};
+  std::vector<Packet> packets(8);
+  auto result = Decoder::Get().DecodePackets(words, absl::MakeSpan(packets));
+  EXPECT_THAT(result.status, absl::StatusIs(absl::StatusCode::kInternal));
+  EXPECT_EQ(result.num_packets, 2);
+  EXPECT_EQ(result.num_words, 2);
+  packets.resize(result.num_packets);
+  EXPECT_EQ(packets, DecodeOneByOne(words));
+}
+
+TEST(DecoderTest, DecodePacketsReportsIncompletePacket) {
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  // ff 7f ff 0f 0fff7fff {  immext(#4294967232)
+  // 28 60 03 10 10036028    p0 = cmp.eq(r3,#0); if (p0.new) jump:t
+  std::vector<uint32_t> words = {0x7800e000, 0x0fff7fff, 0x10036028};
+  std::vector<Packet> packets(8);
+  auto result = Decoder::Get().DecodePackets(words, absl::MakeSpan(packets));
+  EXPECT_THAT(result.status,
+              absl::StatusIs(absl::StatusCode::kFailedPrecondition));
+  EXPECT_EQ(result.num_packets, 1);
+  EXPECT_EQ(result.num_words, 1);
+}
+
+TEST(DecoderTest, DecodePacketsStopsWhenOutputIsFull) {
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  // 02 28 01 28 28012802 {  r1 = #0;        r2 = #0 }
+  // ASCII string: "ub-ID:%d".
+  std::vector<uint32_t> words = {0x7800e000, 0x28012802, 0x492D6275};
+  std::vector<Packet> packets(1);
+  auto result = Decoder::Get().DecodePackets(words, absl::MakeSpan(packets));
+  EXPECT_THAT(result.status, IsOk());
+  EXPECT_EQ(result.num_packets, 1);
+  EXPECT_EQ(result.num_words, 1);
+  EXPECT_EQ(packets[0], DecodeOneByOne(words)[0]);
+}
+
+TEST(DecoderTest, SwitchBackendMatchesTableWalk) {
+  std::mt19937 rng(1);
+  std::vector<uint32_t> words(1 << 18);
+  for (auto &word : words) {
+    word = rng();
+  }
+  // Decodes at every word, so that most packets are invalid.
+  auto decode_all = [&words](DecodeBackend backend) {
+    decode_set_backend(backend);
+    std::vector<absl::StatusOr<Packet>> packets;
+    for (size_t i = 0; i < words.size(); i++) {
+      packets.push_back(Decoder::Get().DecodePacket(
+          absl::MakeConstSpan(words).subspan(i, PACKET_WORDS_MAX)));
+    }
+    return packets;
+  };
+  const DecodeBackend default_backend = decode_get_backend();
+  auto expected = decode_all(DECODE_BACKEND_TABLEWALK);
+  auto packets = decode_all(DECODE_BACKEND_SWITCH);
+  decode_set_backend(default_backend);
+  size_t num_valid = 0;
+  for (size_t i = 0; i < words.size(); i++) {
+    ASSERT_EQ(packets[i].status(), expected[i].status()) << i;
+    if (expected[i].ok()) {
+      ASSERT_EQ(packets[i].value(), expected[i].value()) << i;
+      num_valid++;
+    }
+  }
+  EXPECT_GT(num_valid, 0);
+}
+
 } // namespace
@@ -2131,6 +2131,63 @@ def gen_il_func(tag, regs, imms):
   return '\n'.join(lines)
 
 
+# Maps a register operand to its RegAccess, see packet_context.h. Follows
+# genptr_decl_opn().
+def reg_access(tag, regtype, regid):
+  if is_single(regid) and not is_old_val(regtype, regid, tag):
+    assert (is_new_val(regtype, regid, tag))
+    return 'kReadNew'
+  if regid in {'ss', 'tt'}:
+    return 'kReadPair'
+  if regid in {'dd', 'ee'}:
+    return 'kWritePair'
+  if regid in {'xx', 'yy'}:
+    return 'kReadWritePair'
+  if regid in {'s', 't', 'u', 'v'}:
+    return 'kRead'
+  if regid in {'d', 'e'}:
+    return 'kWrite'
+  if regid in {'x', 'y'}:
+    return 'kReadWrite'
+  assert (0)
+
+
+fixed_read_re = re.compile(
+    r'il\.Register(?:Split)?\(\d+,\s*(HEX_REG_\w+)(?:,\s*(HEX_REG_\w+))?')
+fixed_write_re = re.compile(
+    r'il\.SetRegister(?:Split)?\(\d+,\s*(HEX_REG_\w+)(?:,\s*(HEX_REG_\w+))?')
+fixed_pred_re = re.compile(r"AddDestReadWritePredReg\(MapRegNum\('P', (\d)\)\)")
+
+
+# Returns the registers that |func|, a generated lift function body, names
+# with |regex|, in order of first appearance. See
+# InsnRegAccess::kMaxFixedRegs.
+def find_fixed_regs(regex, func):
+  regs = []
+  for m in regex.finditer(func):
+    for reg in m.groups():
+      if reg is not None and reg not in regs:
+        regs.append(reg)
+  assert (len(regs) <= 6)
+  return regs
+
+
+# Returns an InsnRegAccess initializer for |tag|, lifted by |func|.
+def gen_reg_access(tag, regs, func):
+  access = [reg_access(tag, regtype, regid) for regtype, regid, _, _ in regs]
+  regtypes = [regtype for regtype, _, _, _ in regs]
+  fixed_reads = find_fixed_regs(fixed_read_re, func)
+  fixed_writes = find_fixed_regs(fixed_write_re, func)
+  fixed_preds = 0
+  for m in fixed_pred_re.finditer(func):
+    fixed_preds |= 1 << int(m.group(1))
+  return '{{{{{0}}}, {{{1}}}, {2}, {{{3}}}, {4}, {{{5}}}, {6}}}'.format(
+      ', '.join('A::' + a for a in access),
+      ', '.join("'{0}'".format(t) for t in regtypes), len(fixed_reads),
+      ', '.join(fixed_reads), len(fixed_writes), ', '.join(fixed_writes),
+      fixed_preds)
+
+
 def main():
   read_semantics_file(sys.argv[1])
   read_attribs_file(sys.argv[2])
@@ -2164,6 +2221,7 @@ using namespace BinaryNinja;
 
 ''')
 
+  reg_access_inits = {}
   for tag in SUPPORTED_TAGS:
     f.write('''/*\n{0}:\n{1}\n{2}\n*/\n'''.format(tag, behdict[tag],
                                                   semdict[tag]))
@@ -2174,7 +2232,9 @@ using namespace BinaryNinja;
                              int insn_num,
                              PacketContext &ctx) {{
                 LowLevelILFunction &il = ctx.IL();\n'''.format(tag))
-    f.write(gen_il_func(tag, tagregs[tag], tagimms[tag]))
+    func = gen_il_func(tag, tagregs[tag], tagimms[tag])
+    reg_access_inits[tag] = gen_reg_access(tag, tagregs[tag], func)
+    f.write(func)
     f.write('}\n\n')
 
   f.write('''typedef void (*IlLiftFunc)(Architecture *arch,
@@ -2190,6 +2250,13 @@ using namespace BinaryNinja;
       f.write('[{0}] = lift_{0},\n'.format(tag))
     else:
       f.write('[{0}] = nullptr,\n'.format(tag))
+  f.write('};\n\n')
+
+  # Register operands of all lifted instructions, for FindDirectDestRegs().
+  f.write('using A = RegAccess;\n')
+  f.write('extern const InsnRegAccess opcode_reg_access[XX_LAST_OPCODE] = {\n')
+  for tag in tags:
+    f.write('[{0}] = {1},\n'.format(tag, reg_access_inits.get(tag, '{}')))
   f.write('};\n')
 
   realf = open(sys.argv[3], 'w')
@@ -48,9 +48,11 @@ immext_casere = re.compile(r'IMMEXT\(([A-Za-z])')
 #        reg   Rt.H32
 #        None
 #
-# Then a transformer visits all nodes, and generates BinaryNinja calls.
+# Then a transformer visits all nodes, and generates tokens. The tokens of each
+# opcode are emitted as a template of InsnTextOps, that RenderInsnText()
+# interprets.
 #
-#   insn token "jump:nt" => add(InstructionToken, "jump:nt");
+#   insn token "jump:nt" => {K::kLiteral, T::kInstruction, ...} => "jump:nt"
 
 insn_grammar = r"""
     ?exp: [not_sign] call [res_hint]      -> call_exp
@@ -167,13 +169,21 @@ insn_parser = Lark(
     propagate_positions=True,
     maybe_placeholders=True)
 
+# Tokens with a static string expression |arg1|.
 TextToken = namedtuple('TextToken', ['arg1'])
 InstructionToken = namedtuple('InstructionToken', ['arg1'])
 RegisterToken = namedtuple('RegisterToken', ['arg1'])
 GPRegisterToken = namedtuple('GPRegisterToken', ['arg1'])
-CodeRelativeAddressToken = namedtuple('CodeRelativeAddressToken',
-                                      ['arg1', 'arg2'])
-IntegerToken = namedtuple('IntegerToken', ['arg1', 'arg2'])
+# Register of |reg_type| in operand |operand|, plus |offset|. See
+# GetRegisterName().
+RegisterNameToken = namedtuple('RegisterNameToken',
+                               ['reg_type', 'modifier', 'operand', 'offset'])
+# pc plus immediate |immed|.
+CodeRelativeAddressToken = namedtuple('CodeRelativeAddressToken', ['immed'])
+# Immediate |immed|.
+IntegerToken = namedtuple('IntegerToken', ['immed'])
+# Constant |value|.
+ConstIntegerToken = namedtuple('ConstIntegerToken', ['value'])
 
 
 class InsnTreeTransformer(Transformer):
@@ -372,20 +382,16 @@ class InsnTreeTransformer(Transformer):
     if len(b) == 1:
       # Single register.
       return [
-          RegisterToken('GetRegisterName("{0}", "{1}", insn.regno[{2}])'.format(
-              a, c, regno))
+          RegisterNameToken(a, c, regno, 0),
       ]
 
     if len(b) == 2:
       # Register pair.
       assert (not c)
       return [
-          RegisterToken(
-              'GetRegisterName("{0}", "{1}", insn.regno[{2}]+1)'.format(
-                  a, c, regno)),
+          RegisterNameToken(a, c, regno, 1),
           TextToken('":"'),
-          RegisterToken('GetRegisterName("{0}", "{1}", insn.regno[{2}])'.format(
-              a, c, regno)),
+          RegisterNameToken(a, c, regno, 0),
       ]
 
     assert (0)
@@ -419,9 +425,7 @@ class InsnTreeTransformer(Transformer):
 
     if place_addr_token:
       res += [
-          CodeRelativeAddressToken(
-              'StrCat("0x", Hex(pc + insn.immed[{0}]))'.format(ii),
-              'pc + insn.immed[{0}]'.format(ii)),
+          CodeRelativeAddressToken(ii),
       ]
     else:
       if ((immlett.isupper() and self.extendable_upper_imm) or
@@ -434,8 +438,7 @@ class InsnTreeTransformer(Transformer):
             TextToken('"#"'),
         ]
       res += [
-          IntegerToken('StrCat("0x", Hex(insn.immed[{0}]))'.format(ii),
-                       'insn.immed[{0}]'.format(ii)),
+          IntegerToken(ii),
       ]
     return res
 
@@ -471,7 +474,7 @@ class InsnTreeTransformer(Transformer):
   def const(self, num):
     return [
         TextToken('"#"'),
-        IntegerToken('StrCat("0x", Hex({}))'.format(num), '{}'.format(num)),
+        ConstIntegerToken(int(num)),
     ]
 
   # pred_reg: "p" DIGIT
@@ -565,60 +568,156 @@ class InsnTreeTransformer(Transformer):
   subreg = wrap_reg_terminal
 
 
-def wrap_call(tok):
-  if isinstance(tok, TextToken):
-    return 'result.emplace_back(TextToken, {0.arg1});'.format(tok)
-  if isinstance(tok, InstructionToken):
-    return 'result.emplace_back(InstructionToken, {0.arg1});'.format(tok)
-  if isinstance(tok, RegisterToken):
-    return 'result.emplace_back(RegisterToken, {0.arg1});'.format(tok)
-  if isinstance(tok, GPRegisterToken):
-    # Global pointer relative addressing has different semantics when there's
-    # a valid immediate extension.
-    # #define fREAD_GP() \
-    #     (insn->extension_valid ? 0 : READ_REG(HEX_REG_GP))
-    return '''if (insn.extension_valid) {{
-                result.emplace_back(IntegerToken, "0", 0);
-            }} else {{
-                result.emplace_back(RegisterToken, {0.arg1});
-            }}'''.format(tok)
-  if isinstance(tok, CodeRelativeAddressToken):
-    return 'result.emplace_back(CodeRelativeAddressToken, {0.arg1}, {0.arg2});'.format(
-        tok)
-  if isinstance(tok, IntegerToken):
-    return 'result.emplace_back(IntegerToken, {0.arg1}, {0.arg2});'.format(tok)
-  raise ValueError(tok)
+# TextToken expressions that coalesce: a string literal, or a string literal
+# picked by a condition.
+text_literal_re = re.compile(r'^"([^"\\]*)"$')
+text_conditional_re = re.compile(r'^\((.+) \? "([^"\\]*)" : "([^"\\]*)"\)$')
+
+
+# Returns (cond, if_true, if_false) of a TextToken expression, with cond None
+# for string literals. Returns None for any other expression.
+def parse_text_expr(expr):
+  m = text_literal_re.match(expr)
+  if m:
+    return (None, m.group(1), m.group(1))
+  m = text_conditional_re.match(expr)
+  if m:
+    return m.groups()
+  return None
+
+
+# Returns a TextToken expression for expression |a| followed by |b|, or None
+# when they can't be joined.
+def join_text_exprs(a, b):
+  a = parse_text_expr(a)
+  b = parse_text_expr(b)
+  if a is None or b is None:
+    return None
+  if a[0] is not None and b[0] is not None and a[0] != b[0]:
+    return None
+  cond = a[0] if a[0] is not None else b[0]
+  if_true = a[1] + b[1]
+  if_false = a[2] + b[2]
+  if cond is None:
+    return '"{}"'.format(if_true)
+  return '({} ? "{}" : "{}")'.format(cond, if_true, if_false)
+
+
+# Merges runs of consecutive TextTokens into single tokens.
+#
+# For example, "Rd32=add(Rs32,#s16)" yields
+#     [R, " = ", add, "(", R, ",", "#", imm, ")"]
+# which becomes
+#     [R, " = ", add, "(", R, ",#", imm, ")"]
+# InstructionTokens are left alone, BN highlights them as mnemonics.
+def coalesce_text_tokens(tokens):
+  res = []
+  for tok in tokens:
+    if (isinstance(tok, TextToken) and res and
+        isinstance(res[-1], TextToken)):
+      joined = join_text_exprs(res[-1].arg1, tok.arg1)
+      if joined is not None:
+        res[-1] = TextToken(joined)
+        continue
+    res.append(tok)
+  return res
 
 
-def process_insn_tokens(tag, regs, imms):
+def parse_insn_tokens(tag, regs, imms):
   beh = behdict[tag]
   tree = insn_parser.parse(beh)
   tokens = InsnTreeTransformer(tag, regs, imms).transform(tree)
   return tokens
 
 
-def gen_insn_text_func(tag, regs, imms):
-  tokens = process_insn_tokens(tag, regs, imms)
-  return "\n".join(map(wrap_call, tokens))
+def process_insn_tokens(tag, regs, imms):
+  return coalesce_text_tokens(parse_insn_tokens(tag, regs, imms))
+
+
+# Text literals of the templates, in order of first use.
+class LiteralPool:
+
+  def __init__(self):
+    self.ids = OrderedDict()
+
+  def id(self, expr):
+    m = text_literal_re.match(expr)
+    assert m, expr
+    return self.ids.setdefault(m.group(1), len(self.ids))
+
+
+def format_op(kind, token_type='kText', reg_type=None, modifier=None, arg=0,
+              arg2=0):
+  assert -(1 << 15) <= arg < (1 << 15)
+  return "{{K::{}, T::{}, {}, {}, {}, {}}}".format(
+      kind, token_type, "'{}'".format(reg_type) if reg_type else 0,
+      "'{}'".format(modifier) if modifier else 0, arg, arg2)
+
+
+# Returns the InsnTextOp initializers of |tokens|, without the terminating
+# kEnd. Adds text literals to |literals|.
+def gen_insn_text_ops(tokens, literals):
+  ops = []
+  for tok in tokens:
+    if isinstance(tok, TextToken):
+      cond, if_true, if_false = parse_text_expr(tok.arg1)
+      if cond is None:
+        ops.append(format_op('kLiteral', arg=literals.id(tok.arg1)))
+      else:
+        assert cond == 'insn.extension_valid', tok
+        ops.append(
+            format_op('kExtLiteral',
+                      arg=literals.id('"{}"'.format(if_true)),
+                      arg2=literals.id('"{}"'.format(if_false))))
+    elif isinstance(tok, InstructionToken):
+      ops.append(
+          format_op('kLiteral', 'kInstruction', arg=literals.id(tok.arg1)))
+    elif isinstance(tok, RegisterToken):
+      ops.append(format_op('kLiteral', 'kRegister', arg=literals.id(tok.arg1)))
+    elif isinstance(tok, GPRegisterToken):
+      # Global pointer relative addressing has different semantics when
+      # there's a valid immediate extension.
+      # #define fREAD_GP() \
+      #     (insn->extension_valid ? 0 : READ_REG(HEX_REG_GP))
+      ops.append(
+          format_op('kGpRegister', 'kRegister', arg=literals.id(tok.arg1)))
+    elif isinstance(tok, RegisterNameToken):
+      ops.append(
+          format_op('kRegister',
+                    'kRegister',
+                    reg_type=tok.reg_type,
+                    modifier=tok.modifier,
+                    arg=tok.operand,
+                    arg2=tok.offset))
+    elif isinstance(tok, CodeRelativeAddressToken):
+      ops.append(
+          format_op('kPcRelative', 'kCodeRelativeAddress', arg=tok.immed))
+    elif isinstance(tok, IntegerToken):
+      ops.append(format_op('kImmediate', 'kInteger', arg=tok.immed))
+    elif isinstance(tok, ConstIntegerToken):
+      ops.append(format_op('kConstant', 'kInteger', arg=tok.value))
+    else:
+      raise ValueError(tok)
+  return ops
 
 
 def process_all_tags(tagregs, tagimms):
-  tag_to_fbody = OrderedDict({tag: '' for tag in tags})
+  tag_to_tokens = OrderedDict({tag: None for tag in tags})
   print('Processing %d tags in parallel' % (len(tags)))
   with concurrent.futures.ProcessPoolExecutor(max_workers=5) as executor:
     future_to_tag = {}
     for i, tag in enumerate(tags):
       if not behdict[tag]:
         continue
-      future_to_tag[executor.submit(gen_insn_text_func, tag, tagregs[tag],
+      future_to_tag[executor.submit(process_insn_tokens, tag, tagregs[tag],
                                     tagimms[tag])] = tag
 
     for i, future in enumerate(concurrent.futures.as_completed(future_to_tag)):
       if i % 100 == 0:
         print('Done processing tag #', i)
       tag = future_to_tag[future]
-      tag_to_fbody[tag] = future.result()
-  return tag_to_fbody
+      tag_to_tokens[tag] = future.result()
+  return tag_to_tokens
 
 
 def main():
@@ -630,42 +729,39 @@ def main():
 
   f = StringIO()
   f.write('''
-#include <vector>
-
-#include "binaryninjaapi.h"
-#include "absl/strings/str_cat.h"
 #include "plugin/text_util.h"
-#include "third_party/qemu-hexagon/attribs.h"
-#include "third_party/qemu-hexagon/iclass.h"
-#include "third_party/qemu-hexagon/insn.h"
 #include "third_party/qemu-hexagon/opcodes.h"
 
-using namespace BinaryNinja;
-using absl::Hex;
-using absl::StrCat;
+using K = InsnTextOpKind;
+using T = InsnTextTokenType;
 
 ''')
 
-  tag_to_fbody = process_all_tags(tagregs, tagimms)
-  for tag, fbody in tag_to_fbody.items():
-    f.write('''/*\n{0}:  "{1}"\n*/'''.format(tag, behdict[tag]))
-    f.write('''void tokenize_{0}(uint64_t pc,
-                             const Packet &pkt,
-                             const Insn &insn,
-                             std::vector<InstructionTextToken> &result) {{\n'''
-            .format(tag))
-    f.write(fbody)
-    f.write('}\n\n')
-
-  f.write('''typedef void (*InsnTextFunc)(uint64_t pc,
-                            const Packet &pkt,
-                            const Insn &insn,
-                            std::vector<InstructionTextToken> &result);\n\n''')
-  f.write('extern const InsnTextFunc opcode_textptr[XX_LAST_OPCODE] = {\n')
+  tag_to_tokens = process_all_tags(tagregs, tagimms)
+  literals = LiteralPool()
+  tag_to_offset = {}
+  offset = 0
+  f.write('extern const InsnTextOp insn_text_ops[] = {\n')
+  for tag, tokens in tag_to_tokens.items():
+    if tokens is None:
+      continue
+    ops = gen_insn_text_ops(tokens, literals) + ['{K::kEnd}']
+    f.write('// {0}: "{1}"\n'.format(tag, behdict[tag]))
+    f.write(',\n'.join(ops))
+    f.write(',\n')
+    tag_to_offset[tag] = offset
+    offset += len(ops)
+  f.write('};\n\n')
+
+  f.write('extern const absl::string_view insn_text_literals[] = {\n')
+  for text in literals.ids:
+    f.write('"{}",\n'.format(text))
+  f.write('};\n\n')
+
+  # Offset of each opcode's template in insn_text_ops, -1 if it has none.
+  f.write('extern const int32_t opcode_text_ops[XX_LAST_OPCODE] = {\n')
   for tag in tags:
-    if not behdict[tag]:
-      return
-    f.write('[{0}] = tokenize_{0},\n'.format(tag))
+    f.write('[{0}] = {1},\n'.format(tag, tag_to_offset.get(tag, -1)))
   f.write('};\n')
 
   realf = open(sys.argv[3], 'w')
@@ -326,6 +326,50 @@ class TestGenInsnTextFuncs(unittest.TestCase):
                  enumerate(tokens)))
       self.assertEqual(len(addresses), 1)
 
+  def test_join_text_exprs(self):
+    self.assertEqual(join_text_exprs('"("', '"#"'), '"(#"')
+    self.assertEqual(
+        join_text_exprs('","', '(insn.extension_valid ? "##" : "#")'),
+        '(insn.extension_valid ? ",##" : ",#")')
+    self.assertEqual(
+        join_text_exprs('(insn.extension_valid ? "##" : "#")', '")"'),
+        '(insn.extension_valid ? "##)" : "#)")')
+    self.assertIsNone(join_text_exprs('"("', 'name'))
+
+  def test_coalesces_text_tokens(self):
+    tag = "A4_combineii"
+    tokens = parse_insn_tokens(tag, TestGenInsnTextFuncs.tagregs[tag],
+                               TestGenInsnTextFuncs.tagimms[tag])
+    coalesced = process_insn_tokens(tag, TestGenInsnTextFuncs.tagregs[tag],
+                                    TestGenInsnTextFuncs.tagimms[tag])
+    self.assertLess(len(coalesced), len(tokens))
+    for a, b in zip(coalesced, coalesced[1:]):
+      self.assertFalse(isinstance(a, TextToken) and isinstance(b, TextToken))
+    texts = [tok.arg1 for tok in coalesced if isinstance(tok, TextToken)]
+    self.assertIn('"(#"', texts)
+    self.assertIn('(insn.extension_valid ? ",##" : ",#")', texts)
+
+  def test_gen_insn_text_ops(self):
+    tag = "A4_combineii"
+    tokens = process_insn_tokens(tag, TestGenInsnTextFuncs.tagregs[tag],
+                                 TestGenInsnTextFuncs.tagimms[tag])
+    literals = LiteralPool()
+    ops = gen_insn_text_ops(tokens, literals)
+    self.assertEqual(ops, [
+        "{K::kRegister, T::kRegister, 'R', 0, 0, 1}",
+        "{K::kLiteral, T::kText, 0, 0, 0, 0}",
+        "{K::kRegister, T::kRegister, 'R', 0, 0, 0}",
+        "{K::kLiteral, T::kText, 0, 0, 1, 0}",
+        "{K::kLiteral, T::kInstruction, 0, 0, 2, 0}",
+        "{K::kLiteral, T::kText, 0, 0, 3, 0}",
+        "{K::kImmediate, T::kInteger, 0, 0, 0, 0}",
+        "{K::kExtLiteral, T::kText, 0, 0, 4, 5}",
+        "{K::kImmediate, T::kInteger, 0, 0, 1, 0}",
+        "{K::kLiteral, T::kText, 0, 0, 6, 0}",
+    ])
+    self.assertEqual(list(literals.ids),
+                     [":", " = ", "combine", "(#", ",##", ",#", ")"])
+
   def test_process_tags(self):
     for tag in [
         "J2_jump",
@@ -350,8 +394,9 @@ class TestGenInsnTextFuncs(unittest.TestCase):
         "S2_storerf_io",
     ]:
       # print(tag, behdict[tag])
-      out = gen_insn_text_func(tag, TestGenInsnTextFuncs.tagregs[tag],
-                               TestGenInsnTextFuncs.tagimms[tag])
+      tokens = process_insn_tokens(tag, TestGenInsnTextFuncs.tagregs[tag],
+                                   TestGenInsnTextFuncs.tagimms[tag])
+      out = gen_insn_text_ops(tokens, LiteralPool())
       # print(out)
 
 
@@ -0,0 +1,204 @@
+/*
+ * Copyright (C) 2020 Google LLC
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License along
+ * with this program; if not, write to the Free Software Foundation, Inc.,
+ * 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+#pragma once
+
+#include <array>
+#include <cstdint>
+
+#include "absl/strings/string_view.h"
+#include "plugin/hex_regs.h"
+
+// Register metadata, built at compile time from the HEX_REG_* and
+// HEX_SREG_* enums.
+
+struct HexRegInfo {
+  // Display name, empty for unused register numbers.
+  absl::string_view name;
+  // Full width register that holds this register, and the byte offset and
+  // size within it.
+  uint32_t full_width_reg;
+  uint8_t offset;
+  uint8_t size;
+};
+
+namespace hex_regs_internal {
+
+inline constexpr absl::string_view kGeneralRegNames[] = {
+    "R0",  "R1",  "R2",  "R3",  "R4",  "R5",  "R6",  "R7",
+    "R8",  "R9",  "R10", "R11", "R12", "R13", "R14", "R15",
+    "R16", "R17", "R18", "R19", "R20", "R21", "R22", "R23",
+    "R24", "R25", "R26", "R27", "R28", "SP",  "FP",  "LR",
+};
+
+inline constexpr absl::string_view kControlRegNames[] = {
+    "SA0", "LC0", "SA1", "LC1", "P3:0", "C5",  "M0",  "M1",
+    "USR", "PC",  "UGP", "GP",  "CS0",  "CS1", "C14", "C15",
+    "C16", "C17", "C18", "C19", "C20",  "C21", "C22", "C23",
+    "C24", "C25", "C26", "C27", "C28",  "C29", "C30", "C31",
+};
+
+constexpr std::array<HexRegInfo, NUM_HEX_REGS> MakeHexRegs() {
+  std::array<HexRegInfo, NUM_HEX_REGS> regs = {};
+  for (uint32_t i = 0; i < 32; i++) {
+    regs[HEX_REG_R00 + i] = {kGeneralRegNames[i], HEX_REG_R00 + i, 0, 4};
+    regs[HEX_REG_C00 + i] = {kControlRegNames[i], HEX_REG_C00 + i, 0, 4};
+  }
+  // Predicate registers are the bytes of HEX_REG_P3_0.
+  regs[HEX_REG_P0] = {"P0", HEX_REG_P3_0, 0, 1};
+  regs[HEX_REG_P1] = {"P1", HEX_REG_P3_0, 1, 1};
+  regs[HEX_REG_P2] = {"P2", HEX_REG_P3_0, 2, 1};
+  regs[HEX_REG_P3] = {"P3", HEX_REG_P3_0, 3, 1};
+  // USR bits 8-9, see REG_FIELD_USR_LPCFG.
+  regs[HEX_REG_USR_LPCFG] = {"LPCFG", HEX_REG_USR, 1, 1};
+  return regs;
+}
+
+// Number of HEX_SREG_* registers.
+inline constexpr uint32_t kNumSystemRegs = HEX_SREG_S85 + 1;
+
+constexpr std::array<absl::string_view, kNumSystemRegs> MakeSystemRegNames() {
+  std::array<absl::string_view, kNumSystemRegs> names = {};
+  names[HEX_SREG_SGP0] = "SGP0";
+  names[HEX_SREG_SGP1] = "SGP1";
+  names[HEX_SREG_STID] = "STID";
+  names[HEX_SREG_ELR] = "ELR";
+  names[HEX_SREG_BADVA0] = "BADVA0";
+  names[HEX_SREG_BADVA1] = "BADVA1";
+  names[HEX_SREG_SSR] = "SSR";
+  names[HEX_SREG_CCR] = "CCR";
+  names[HEX_SREG_HTID] = "HTID";
+  names[HEX_SREG_BADVA] = "BADVA";
+  names[HEX_SREG_IMASK] = "IMASK";
+  names[HEX_SREG_GEVB] = "GEVB";
+  names[HEX_SREG_EVB] = "EVB";
+  names[HEX_SREG_MODECTL] = "MODECTL";
+  names[HEX_SREG_SYSCFG] = "SYSCFG";
+  names[HEX_SREG_IPENDAD] = "IPENDAD";
+  names[HEX_SREG_VID] = "VID";
+  names[HEX_SREG_VID1] = "VID1";
+  names[HEX_SREG_BESTWAIT] = "BESTWAIT";
+  names[HEX_SREG_IEL] = "IEL";
+  names[HEX_SREG_SCHEDCFG] = "SCHEDCFG";
+  names[HEX_SREG_IAHL] = "IAHL";
+  names[HEX_SREG_CFGBASE] = "CFGBASE";
+  names[HEX_SREG_DIAG] = "DIAG";
+  names[HEX_SREG_REV] = "REV";
+  names[HEX_SREG_PCYCLELO] = "PCYCLELO";
+  names[HEX_SREG_PCYCLEHI] = "PCYCLEHI";
+  names[HEX_SREG_ISDBST] = "ISDBST";
+  names[HEX_SREG_ISDBCFG0] = "ISDBCFG0";
+  names[HEX_SREG_ISDBCFG1] = "ISDBCFG1";
+  names[HEX_SREG_LIVELOCK] = "LIVELOCK";
+  names[HEX_SREG_BRKPTPC0] = "BRKPTPC0";
+  names[HEX_SREG_BRKPTCFG0] = "BRKPTCFG0";
+  names[HEX_SREG_BRKPTPC1] = "BRKPTPC1";
+  names[HEX_SREG_BRKPTCFG1] = "BRKPTCFG1";
+  names[HEX_SREG_ISDBMBXIN] = "ISDBMBXIN";
+  names[HEX_SREG_ISDBMBXOUT] = "ISDBMBXOUT";
+  names[HEX_SREG_ISDBEN] = "ISDBEN";
+  names[HEX_SREG_ISDBGPR] = "ISDBGPR";
+  names[HEX_SREG_PMUCNT4] = "PMUCNT4";
+  names[HEX_SREG_PMUCNT5] = "PMUCNT5";
+  names[HEX_SREG_PMUCNT6] = "PMUCNT6";
+  names[HEX_SREG_PMUCNT7] = "PMUCNT7";
+  names[HEX_SREG_PMUCNT0] = "PMUCNT0";
+  names[HEX_SREG_PMUCNT1] = "PMUCNT1";
+  names[HEX_SREG_PMUCNT2] = "PMUCNT2";
+  names[HEX_SREG_PMUCNT3] = "PMUCNT3";
+  names[HEX_SREG_PMUEVTCFG] = "PMUEVTCFG";
+  names[HEX_SREG_PMUSTID0] = "PMUSTID0";
+  names[HEX_SREG_PMUEVTCFG1] = "PMUEVTCFG1";
+  names[HEX_SREG_PMUSTID1] = "PMUSTID1";
+  names[HEX_SREG_TIMERLO] = "TIMERLO";
+  names[HEX_SREG_TIMERHI] = "TIMERHI";
+  names[HEX_SREG_PMUCFG] = "PMUCFG";
+  names[HEX_SREG_S59] = "S59";
+  names[HEX_SREG_S60] = "S60";
+  names[HEX_SREG_S61] = "S61";
+  names[HEX_SREG_S62] = "S62";
+  names[HEX_SREG_S63] = "S63";
+  names[HEX_SREG_COMMIT1T] = "COMMIT1T";
+  names[HEX_SREG_COMMIT2T] = "COMMIT2T";
+  names[HEX_SREG_COMMIT3T] = "COMMIT3T";
+  names[HEX_SREG_COMMIT4T] = "COMMIT4T";
+  names[HEX_SREG_COMMIT5T] = "COMMIT5T";
+  names[HEX_SREG_COMMIT6T] = "COMMIT6T";
+  names[HEX_SREG_PCYCLE1T] = "PCYCLE1T";
+  names[HEX_SREG_PCYCLE2T] = "PCYCLE2T";
+  names[HEX_SREG_PCYCLE3T] = "PCYCLE3T";
+  names[HEX_SREG_PCYCLE4T] = "PCYCLE4T";
+  names[HEX_SREG_PCYCLE5T] = "PCYCLE5T";
+  names[HEX_SREG_PCYCLE6T] = "PCYCLE6T";
+  names[HEX_SREG_STFINST] = "STFINST";
+  names[HEX_SREG_ISDBCMD] = "ISDBCMD";
+  names[HEX_SREG_ISDBVER] = "ISDBVER";
+  names[HEX_SREG_BRKPTINFO] = "BRKPTINFO";
+  names[HEX_SREG_RGDR3] = "RGDR3";
+  names[HEX_SREG_COMMIT7T] = "COMMIT7T";
+  names[HEX_SREG_COMMIT8T] = "COMMIT8T";
+  names[HEX_SREG_PCYCLE7T] = "PCYCLE7T";
+  names[HEX_SREG_PCYCLE8T] = "PCYCLE8T";
+  names[HEX_SREG_S85] = "S85";
+  return names;
+}
+
+template <size_t N> constexpr std::array<uint32_t, N> RegRange(uint32_t first) {
+  std::array<uint32_t, N> regs = {};
+  for (size_t i = 0; i < N; i++) {
+    regs[i] = first + i;
+  }
+  return regs;
+}
+
+} // namespace hex_regs_internal
+
+// Indexed by HEX_REG_*.
+inline constexpr std::array<HexRegInfo, NUM_HEX_REGS> kHexRegs =
+    hex_regs_internal::MakeHexRegs();
+
+// Names of HEX_SREG_* registers, indexed by register number.
+inline constexpr std::array<absl::string_view,
+                            hex_regs_internal::kNumSystemRegs>
+    kHexSystemRegNames = hex_regs_internal::MakeSystemRegNames();
+
+// General and control registers.
+// TODO: add VRegs, QRegs.
+inline constexpr std::array<uint32_t, 64> kHexFullWidthRegs =
+    hex_regs_internal::RegRange<64>(HEX_REG_R00);
+
+// Full width registers, followed by their sub registers.
+inline constexpr std::array<uint32_t, 69> kHexAllRegs = [] {
+  std::array<uint32_t, 69> regs = {};
+  for (size_t i = 0; i < kHexFullWidthRegs.size(); i++) {
+    regs[i] = kHexFullWidthRegs[i];
+  }
+  regs[64] = HEX_REG_P0;
+  regs[65] = HEX_REG_P1;
+  regs[66] = HEX_REG_P2;
+  regs[67] = HEX_REG_P3;
+  regs[68] = HEX_REG_USR_LPCFG;
+  return regs;
+}();
+
+// Returns the size of a register in the LLIL_TEMP register space, indexed as
+// PacketContext does: predicate registers are a byte, others are 32bit.
+// TODO: map single 32b registers to 64b pairs in LLIL_TEMP register space.
+constexpr uint8_t HexTempRegSize(uint32_t temp_index) {
+  return (temp_index >= HEX_REG_P0 && temp_index <= HEX_REG_P3) ? 1 : 4;
+}
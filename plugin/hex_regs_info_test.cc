@@ -0,0 +1,73 @@
+// Copyright (C) 2020 Google LLC
+//
+// This program is free software; you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation; either version 2 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License along
+// with this program; if not, write to the Free Software Foundation, Inc.,
+// 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#include "plugin/hex_regs_info.h"
+
+#include "gmock/gmock.h"
+#include "gtest/gtest.h"
+#include "third_party/qemu-hexagon/reg_fields.h"
+
+namespace {
+
+static_assert(kHexRegs[HEX_REG_LR].name == "LR");
+static_assert(kHexRegs[HEX_REG_P2].full_width_reg == HEX_REG_P3_0);
+
+TEST(HexRegsInfoTest, Names) {
+  EXPECT_EQ(kHexRegs[HEX_REG_R00].name, "R0");
+  EXPECT_EQ(kHexRegs[HEX_REG_R28].name, "R28");
+  EXPECT_EQ(kHexRegs[HEX_REG_SP].name, "SP");
+  EXPECT_EQ(kHexRegs[HEX_REG_P3_0].name, "P3:0");
+  EXPECT_EQ(kHexRegs[HEX_REG_C05].name, "C5");
+  EXPECT_EQ(kHexRegs[HEX_REG_C31].name, "C31");
+  EXPECT_EQ(kHexRegs[HEX_REG_P1].name, "P1");
+  EXPECT_EQ(kHexRegs[HEX_REG_USR_LPCFG].name, "LPCFG");
+  EXPECT_EQ(kHexSystemRegNames[HEX_SREG_GEVB], "GEVB");
+  EXPECT_EQ(kHexSystemRegNames[HEX_SREG_EVB], "EVB");
+  EXPECT_EQ(kHexSystemRegNames[HEX_SREG_IPENDAD], "IPENDAD");
+  EXPECT_TRUE(kHexSystemRegNames[19].empty());
+}
+
+TEST(HexRegsInfoTest, AllRegistersHaveInfo) {
+  for (uint32_t reg : kHexAllRegs) {
+    EXPECT_FALSE(kHexRegs[reg].name.empty()) << reg;
+    EXPECT_NE(kHexRegs[reg].size, 0) << reg;
+  }
+  for (uint32_t reg : kHexFullWidthRegs) {
+    EXPECT_EQ(kHexRegs[reg].full_width_reg, reg);
+    EXPECT_EQ(kHexRegs[reg].offset, 0);
+    EXPECT_EQ(kHexRegs[reg].size, 4);
+  }
+}
+
+TEST(HexRegsInfoTest, SubRegisters) {
+  EXPECT_EQ(kHexRegs[HEX_REG_P3].full_width_reg, HEX_REG_P3_0);
+  EXPECT_EQ(kHexRegs[HEX_REG_P3].offset, 3);
+  EXPECT_EQ(kHexRegs[HEX_REG_P3].size, 1);
+
+  const HexRegInfo &lpcfg = kHexRegs[HEX_REG_USR_LPCFG];
+  EXPECT_EQ(lpcfg.full_width_reg, HEX_REG_USR);
+  EXPECT_EQ(lpcfg.offset * 8, reg_field_info[REG_FIELD_USR_LPCFG].offset);
+  EXPECT_LE(reg_field_info[REG_FIELD_USR_LPCFG].width, lpcfg.size * 8);
+}
+
+TEST(HexRegsInfoTest, TempRegSize) {
+  EXPECT_EQ(HexTempRegSize(HEX_REG_P0), 1);
+  EXPECT_EQ(HexTempRegSize(HEX_REG_P3), 1);
+  EXPECT_EQ(HexTempRegSize(HEX_REG_R05), 4);
+  EXPECT_EQ(HexTempRegSize(HEX_REG_USR_LPCFG), 4);
+}
+
+} // namespace
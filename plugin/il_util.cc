@@ -16,15 +16,16 @@
 
 #include "plugin/il_util.h"
 
-#include "absl/memory/memory.h"
 #include "absl/strings/str_cat.h"
+#include "absl/strings/string_view.h"
+#include "absl/types/optional.h"
 #include "binaryninjaapi.h"
 #include "glog/logging.h"
 #include "plugin/hex_regs.h"
 #include "plugin/insn_util.h"
 #include "plugin/packet_context.h"
 #include "plugin/status_macros.h"
-#include "third_party/qemu-hexagon/decode.h"
+#include "third_party/qemu-hexagon/attribs.h"
 
 // Defined in il_funcs_generated.cc.
 typedef void (*IlLiftFunc)(BinaryNinja::Architecture *arch, uint64_t pc,
@@ -55,16 +56,90 @@ absl::Status FillBnInstructionLowLevelImpl(Architecture *arch, uint64_t pc,
   return absl::OkStatus();
 }
 
-} // namespace
+// Predicate bit tested by a conditional direct branch.
+struct BranchCond {
+  int pred_reg;
+  // Branch is taken if the predicate LSB is set, or clear.
+  bool if_set;
+  // Tests the '.new' predicate value.
+  bool dot_new;
+};
 
-Packet PreparePacketForLifting(const Packet &src) {
-  Packet copy = src;
-  decode_remove_extenders(&copy);
-  decode_shuffle_for_execution(&copy);
-  decode_split_cmpjump(&copy);
-  return copy;
+absl::optional<BranchCond> GetBranchCond(const Insn &insn) {
+  switch (insn.opcode) {
+  case J2_jumpt:
+  case J2_jumptpt:
+  case J2_callt:
+    return BranchCond{MapRegNum('P', insn.regno[0]), true, false};
+  case J2_jumpf:
+  case J2_jumpfpt:
+  case J2_callf:
+    return BranchCond{MapRegNum('P', insn.regno[0]), false, false};
+  case J2_jumptnew:
+  case J2_jumptnewpt:
+    return BranchCond{MapRegNum('P', insn.regno[0]), true, true};
+  case J2_jumpfnew:
+  case J2_jumpfnewpt:
+    return BranchCond{MapRegNum('P', insn.regno[0]), false, true};
+  default:
+    break;
+  }
+  if (GET_ATTRIB(insn.opcode, A_NEWCMPJUMP)) {
+    // Compound compare-jumps are named J4_<cmp>_{t,f}p{0,1}_jump_{t,nt}.
+    const absl::string_view name = opcode_names[insn.opcode];
+    const size_t pos = name.rfind("_jump");
+    CHECK(pos != absl::string_view::npos && pos >= 3 && name[pos - 2] == 'p')
+        << "Unexpected compare-jump " << name;
+    return BranchCond{HEX_REG_P0 + (name[pos - 1] - '0'), name[pos - 3] == 't',
+                      true};
+  }
+  return absl::nullopt;
 }
 
+// Returns the index of the only branch in |pkt| if it is a conditional direct
+// branch that can be lowered to an If on its predicate, after write-back.
+// This holds when the branch tests a '.new' predicate, which write-back
+// stores in the predicate register, or a predicate that no instruction in the
+// packet writes. Otherwise, returns -1.
+int FindPredicateBranch(const Packet &pkt, BranchCond &cond) {
+  int branch = -1;
+  for (int i = 0; i < pkt.num_insns; i++) {
+    const Insn &insn = pkt.insn[i];
+    if (insn.part1 || !(IsJump(insn) || IsCall(insn))) {
+      continue;
+    }
+    if (branch != -1) {
+      return -1;
+    }
+    branch = i;
+  }
+  if (branch == -1) {
+    return -1;
+  }
+  const Insn &insn = pkt.insn[branch];
+  if (!IsCondJump(insn) || IsIndirect(insn)) {
+    return -1;
+  }
+  const absl::optional<BranchCond> branch_cond = GetBranchCond(insn);
+  if (!branch_cond.has_value() ||
+      (!branch_cond->dot_new && PacketWritesReg(pkt, branch_cond->pred_reg))) {
+    return -1;
+  }
+  cond = *branch_cond;
+  return branch;
+}
+
+// Returns an IL expression that is true if |cond| holds.
+ExprId BranchCondExpr(LowLevelILFunction &il, const BranchCond &cond) {
+  const ExprId lsb = il.And(1, il.Register(1, cond.pred_reg), il.Const(1, 1));
+  if (cond.if_set) {
+    return lsb;
+  }
+  return il.CompareEqual(1, lsb, il.Const(1, 0));
+}
+
+} // namespace
+
 absl::Status FillBnInstructionLowLevelIL(Architecture *arch,
                                          const PacketDb::InsnInfo &input,
                                          size_t &len, LowLevelILFunction &il) {
@@ -78,8 +153,9 @@ absl::Status FillBnInstructionLowLevelIL(Architecture *arch,
     return absl::OkStatus();
   }
 
-  // Re-order instructions for easier processing.
-  Packet pkt = PreparePacketForLifting(input.pkt);
+  // Instructions were re-ordered for easier processing when the packet was
+  // added to PacketDb.
+  const Packet &pkt = input.prepared_pkt;
   len = pkt.encod_pkt_size_in_bytes;
 
   // There are many types of branches:
@@ -167,27 +243,51 @@ absl::Status FillBnInstructionLowLevelIL(Architecture *arch,
   // Note the 'goto 10' at line 8: this skips the second, direct jump in the
   // packet (like 9).
   //
+  // Most packets with a conditional branch have no other branch, and test a
+  // predicate that stays valid after write-back. There, BRANCH_TAKEN is not
+  // needed: the branch lifter is skipped, and the branch tests the predicate
+  // register directly. For example, the following packet:
+  //
+  //   { R1 = add(R1,R1)
+  //     if (P0) jump:t 0x104 }
+  //
+  // Has this LLIL representation:
+  //
+  //   0: temp1.d = R1 + R1
+  //   1: R1 = temp1.d
+  //   2: if (P0 & 1) then 3 else 4
+  //   3: jump(0x104 => 5 @ 0x104)
+  //
+  BranchCond pred_branch_cond;
+  const int pred_branch =
+      pkt.pkt_has_cof ? FindPredicateBranch(pkt, pred_branch_cond) : -1;
+
   if (pkt.pkt_has_cof) {
     for (int i = 0; i < pkt.num_insns; i++) {
       const Insn &insn = pkt.insn[i];
-      if (!insn.part1 && IsCondJump(insn)) {
+      if (!insn.part1 && IsCondJump(insn) && i != pred_branch) {
         il.AddInstruction(
             il.SetRegister(1, BRANCH_TAKEN_ARRAY + i, il.Const(1, 0)));
       }
     }
   }
 
-  // Process packet instructions, in order.
-  auto ctx = absl::make_unique<PacketContext>(il);
-  for (int i = 0; i < pkt.num_insns; i++) {
-    const Insn &insn = pkt.insn[i];
-    RETURN_IF_ERROR(
-        FillBnInstructionLowLevelImpl(arch, input.pc, pkt, insn, i, *ctx));
-  }
+  // Process packet instructions, in order. Dest registers that no later
+  // instruction reads are written directly, without LLIL_TEMP copies.
+  {
+    PacketContext ctx(il, FindDirectDestRegs(pkt));
+    for (int i = 0; i < pkt.num_insns; i++) {
+      const Insn &insn = pkt.insn[i];
+      if (i == pred_branch) {
+        continue;
+      }
+      RETURN_IF_ERROR(
+          FillBnInstructionLowLevelImpl(arch, input.pc, pkt, insn, i, ctx));
+    }
 
-  // Write back all clobbered registers, and clear context.
-  ctx->WriteClobberedRegs();
-  ctx.reset(nullptr);
+    // Write back all clobbered registers.
+    ctx.WriteClobberedRegs();
+  }
 
   // Branch semantics. See comment above.
   if (pkt.pkt_has_cof) {
@@ -199,7 +299,11 @@ absl::Status FillBnInstructionLowLevelIL(Architecture *arch,
       }
       if (IsJump(insn) || IsCall(insn)) {
         LowLevelILLabel branch_case, next_insn;
-        if (IsCondJump(insn)) {
+        if (i == pred_branch) {
+          il.AddInstruction(il.If(BranchCondExpr(il, pred_branch_cond),
+                                  branch_case, next_insn));
+          il.MarkLabel(branch_case);
+        } else if (IsCondJump(insn)) {
           il.AddInstruction(
               il.If(il.CompareEqual(1, il.Register(1, BRANCH_TAKEN_ARRAY + i),
                                     il.Const(1, 1)),
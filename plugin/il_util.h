@@ -23,11 +23,6 @@
 #include "plugin/decoder.h"
 #include "plugin/packet_db.h"
 
-// Prepares packet for il lifting by removing no-op extender instructions,
-// moving dotnew instructions to the end and splitting cmpjump instructions.
-// Exported for testing.
-Packet PreparePacketForLifting(const Packet &src);
-
 absl::Status FillBnInstructionLowLevelIL(BinaryNinja::Architecture *arch,
                                          const PacketDb::InsnInfo &input,
                                          size_t &len,
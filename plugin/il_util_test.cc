@@ -17,6 +17,7 @@
 #include "plugin/il_util.h"
 
 #include "absl/status/status.h"
+#include "plugin/packet_context.h"
 #include "plugin/status_matchers.h"
 #include "gtest/gtest.h"
 
@@ -100,4 +101,47 @@ TEST(IlUtilTest, KeepsDualJumpOrder) {
   EXPECT_EQ(pkt.insn[2].opcode, A2_add);
 }
 
+TEST(IlUtilTest, FindsDirectDestRegs) {
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint32_t> words = {0x0dea76c0, 0x28b32811};
+  ASSERT_OK_AND_ASSIGN(Packet src, Decoder::Get().DecodePacket(words));
+  HexRegSet regs = FindDirectDestRegs(PreparePacketForLifting(src));
+  EXPECT_TRUE(regs.Contains(HEX_REG_R01));
+  EXPECT_TRUE(regs.Contains(HEX_REG_R03));
+  EXPECT_FALSE(regs.Contains(HEX_REG_R00));
+}
+
+TEST(IlUtilTest, KeepsNewValueDestRegsInTemp) {
+  // 20338:     00 40 40 85 85404000 {  P0 = R0
+  // 2033c:     61 e0 00 7e 7e00e061    if (P0.new) R1 = #0x3 }
+  std::vector<uint32_t> words = {0x85404000, 0x7e00e061};
+  ASSERT_OK_AND_ASSIGN(Packet src, Decoder::Get().DecodePacket(words));
+  HexRegSet regs = FindDirectDestRegs(PreparePacketForLifting(src));
+  EXPECT_FALSE(regs.Contains(HEX_REG_P0));
+  EXPECT_TRUE(regs.Contains(HEX_REG_R01));
+}
+
+TEST(IlUtilTest, KeepsReadDestRegsInTemp) {
+  // 000000b4  0650005c           { if (P0) jump:t data_c0    {data_c4}
+  // 000000b8  08400058             jump data_c4
+  // 000000bc  01c101f3             R1 = add(R1,R1) }
+  std::vector<uint32_t> words = {0x5c005006, 0x58004008, 0xf301c101};
+  ASSERT_OK_AND_ASSIGN(Packet src, Decoder::Get().DecodePacket(words));
+  HexRegSet regs = FindDirectDestRegs(PreparePacketForLifting(src));
+  EXPECT_FALSE(regs.Contains(HEX_REG_R01));
+}
+
+TEST(IlUtilTest, FindsPacketRegWrites) {
+  // 20338:     00 40 40 85 85404000 {  P0 = R0
+  // 2033c:     61 e0 00 7e 7e00e061    if (P0.new) R1 = #0x3 }
+  std::vector<uint32_t> words = {0x85404000, 0x7e00e061};
+  ASSERT_OK_AND_ASSIGN(Packet pkt, Decoder::Get().DecodePacket(words));
+  EXPECT_TRUE(PacketWritesReg(pkt, HEX_REG_P0));
+  EXPECT_TRUE(PacketWritesReg(pkt, HEX_REG_P3_0));
+  EXPECT_TRUE(PacketWritesReg(pkt, HEX_REG_R01));
+  EXPECT_FALSE(PacketWritesReg(pkt, HEX_REG_P1));
+  EXPECT_FALSE(PacketWritesReg(pkt, HEX_REG_R00));
+}
+
 } // namespace
@@ -22,11 +22,9 @@
 #include "plugin/status_macros.h"
 
 // Defined in insn_text_funcs_generated.cc.
-typedef void (*InsnTextFunc)(
-    uint64_t pc, const Packet &pkt, const Insn &insn,
-    std::vector<BinaryNinja::InstructionTextToken> &result);
-
-extern const InsnTextFunc opcode_textptr[XX_LAST_OPCODE];
+extern const InsnTextOp insn_text_ops[];
+extern const absl::string_view insn_text_literals[];
+extern const int32_t opcode_text_ops[XX_LAST_OPCODE];
 
 namespace {
 
@@ -42,18 +40,34 @@ int GetLastInsn(const Packet &pkt) {
   return last_insn;
 }
 
-absl::Status
-FillBnInstructionTextTokensImpl(uint64_t pc, const Packet &pkt,
-                                const Insn &insn,
-                                std::vector<InstructionTextToken> &result) {
-  if (opcode_textptr[insn.opcode] == nullptr) {
+absl::Status FillInsnTextTokensImpl(uint64_t pc, const Insn &insn,
+                                    InsnTextTokens &result) {
+  if (opcode_text_ops[insn.opcode] < 0) {
     return absl::InvalidArgumentError(
         StrCat("Unsupported opcode ", insn.opcode));
   }
-  opcode_textptr[insn.opcode](pc, pkt, insn, result);
+  RenderInsnText(&insn_text_ops[opcode_text_ops[insn.opcode]],
+                 insn_text_literals, pc, insn, result);
   return absl::OkStatus();
 }
 
+BNInstructionTextTokenType GetBnTokenType(InsnTextTokenType type) {
+  switch (type) {
+  case InsnTextTokenType::kText:
+    return TextToken;
+  case InsnTextTokenType::kInstruction:
+    return InstructionToken;
+  case InsnTextTokenType::kRegister:
+    return RegisterToken;
+  case InsnTextTokenType::kInteger:
+    return IntegerToken;
+  case InsnTextTokenType::kCodeRelativeAddress:
+    return CodeRelativeAddressToken;
+  }
+  LOG(FATAL) << "Unknown token type " << static_cast<int>(type);
+  return TextToken;
+}
+
 } // namespace
 
 bool IsSubInsn(const Insn &insn) { return GET_ATTRIB(insn.opcode, A_SUBINSN); }
@@ -138,9 +152,8 @@ absl::Status FillBnInstructionInfo(const PacketDb::InsnInfo &input,
   return absl::OkStatus();
 }
 
-absl::Status FillBnInstructionTextTokens(
-    const PacketDb::InsnInfo &input, size_t &len,
-    std::vector<BinaryNinja::InstructionTextToken> &result) {
+absl::Status FillInsnTextTokens(const PacketDb::InsnInfo &input, size_t &len,
+                                InsnTextTokens &result) {
   if (input.insn_addr & 3) {
     return absl::InvalidArgumentError(
         StrCat("Got unaligned insn address ", Hex(input.insn_addr)));
@@ -150,33 +163,47 @@ absl::Status FillBnInstructionTextTokens(
   const Insn &insn = pkt.insn[insn_num];
   // Sub instructions (2B) are printed as a single instruction.
   len = 4;
-  result.emplace_back(TextToken, (input.insn_num == 0 ? "{ " : "  "));
-  RETURN_IF_ERROR(FillBnInstructionTextTokensImpl(input.pc, pkt, insn, result));
+  result.AddStatic(InsnTextTokenType::kText,
+                   (input.insn_num == 0 ? "{ " : "  "));
+  RETURN_IF_ERROR(FillInsnTextTokensImpl(input.pc, insn, result));
   if (IsSubInsn(insn)) {
     CHECK_LT(++insn_num, pkt.num_insns);
     const Insn &next = pkt.insn[insn_num];
-    result.emplace_back(TextToken, "; ");
-    RETURN_IF_ERROR(
-        FillBnInstructionTextTokensImpl(input.pc, pkt, next, result));
+    result.AddStatic(InsnTextTokenType::kText, "; ");
+    RETURN_IF_ERROR(FillInsnTextTokensImpl(input.pc, next, result));
   }
   int last_insn = GetLastInsn(pkt);
   if (insn_num == last_insn) {
-    result.emplace_back(TextToken, " }");
+    result.AddStatic(InsnTextTokenType::kText, " }");
     if (pkt.pkt_has_endloop) {
       switch (pkt.insn[last_insn + 1].opcode) {
       case J2_endloop0:
-        result.emplace_back(TextToken, "  :endloop0");
+        result.AddStatic(InsnTextTokenType::kText, "  :endloop0");
         break;
       case J2_endloop1:
-        result.emplace_back(TextToken, "  :endloop1");
+        result.AddStatic(InsnTextTokenType::kText, "  :endloop1");
         break;
       case J2_endloop01:
-        result.emplace_back(TextToken, "  :endloop01");
+        result.AddStatic(InsnTextTokenType::kText, "  :endloop01");
         break;
       }
     }
   } else {
-    result.emplace_back(TextToken, "  ");
+    result.AddStatic(InsnTextTokenType::kText, "  ");
+  }
+  return absl::OkStatus();
+}
+
+absl::Status FillBnInstructionTextTokens(
+    const PacketDb::InsnInfo &input, size_t &len,
+    std::vector<BinaryNinja::InstructionTextToken> &result) {
+  // Tokens are converted to BN's string-owning tokens only once, here.
+  InsnTextTokens tokens;
+  RETURN_IF_ERROR(FillInsnTextTokens(input, len, tokens));
+  result.reserve(result.size() + tokens.size());
+  for (const auto &token : tokens) {
+    result.emplace_back(GetBnTokenType(token.type()),
+                        std::string(token.text()), token.value());
   }
   return absl::OkStatus();
 }
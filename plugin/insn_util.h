@@ -23,10 +23,16 @@
 #include "absl/status/status.h"
 #include "binaryninjaapi.h"
 #include "plugin/packet_db.h"
+#include "plugin/text_util.h"
 
 absl::Status FillBnInstructionInfo(const PacketDb::InsnInfo &input,
                                    BinaryNinja::InstructionInfo &result);
 
+// Tokenizes the disassembly line of |input|, and sets |len| to the number of
+// bytes it covers.
+absl::Status FillInsnTextTokens(const PacketDb::InsnInfo &input, size_t &len,
+                                InsnTextTokens &result);
+
 absl::Status FillBnInstructionTextTokens(
     const PacketDb::InsnInfo &input, size_t &len,
     std::vector<BinaryNinja::InstructionTextToken> &result);
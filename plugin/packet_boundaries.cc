@@ -0,0 +1,87 @@
+// Copyright (C) 2020 Google LLC
+//
+// This program is free software; you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation; either version 2 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License along
+// with this program; if not, write to the Free Software Foundation, Inc.,
+// 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#include "plugin/packet_boundaries.h"
+
+#ifdef __SSE2__
+#include <emmintrin.h>
+#endif
+
+#include "third_party/qemu-hexagon/cpu_bits.h"
+
+namespace {
+
+// Sets bit |i| of |ends| for each end-of-packet word |i|, and of |duplexes|
+// for each duplex word |i|.
+void ClassifyWords(absl::Span<const uint32_t> words,
+                   std::vector<uint64_t> &ends,
+                   std::vector<uint64_t> &duplexes) {
+  ends.assign((words.size() + 63) / 64, 0);
+  duplexes.assign((words.size() + 63) / 64, 0);
+  size_t i = 0;
+#ifdef __SSE2__
+  // Classify 4 words at a time. Bit offsets of a group never straddle
+  // bitmap elements.
+  const __m128i parse_mask = _mm_set1_epi32(3 << 14);
+  const __m128i zero = _mm_setzero_si128();
+  for (; i + 4 <= words.size(); i += 4) {
+    __m128i bits = _mm_and_si128(
+        _mm_loadu_si128(reinterpret_cast<const __m128i *>(&words[i])),
+        parse_mask);
+    __m128i duplex = _mm_cmpeq_epi32(bits, zero);
+    __m128i end = _mm_or_si128(duplex, _mm_cmpeq_epi32(bits, parse_mask));
+    uint64_t end_mask = _mm_movemask_ps(_mm_castsi128_ps(end));
+    uint64_t duplex_mask = _mm_movemask_ps(_mm_castsi128_ps(duplex));
+    ends[i / 64] |= end_mask << (i % 64);
+    duplexes[i / 64] |= duplex_mask << (i % 64);
+  }
+#endif
+  for (; i < words.size(); i++) {
+    uint32_t bits = parse_bits(words[i]);
+    ends[i / 64] |= static_cast<uint64_t>(bits == 0 || bits == 3) << (i % 64);
+    duplexes[i / 64] |= static_cast<uint64_t>(bits == 0) << (i % 64);
+  }
+}
+
+// Calls |fn| with the index of each set bit in |bitmap|, in increasing order.
+template <typename Fn>
+void ForEachBit(const std::vector<uint64_t> &bitmap, Fn fn) {
+  for (size_t i = 0; i < bitmap.size(); i++) {
+    for (uint64_t bits = bitmap[i]; bits != 0; bits &= bits - 1) {
+      fn(i * 64 + __builtin_ctzll(bits));
+    }
+  }
+}
+
+} // namespace
+
+PacketBoundaries ScanPacketBoundaries(absl::Span<const uint32_t> words) {
+  std::vector<uint64_t> ends;
+  std::vector<uint64_t> duplexes;
+  ClassifyWords(words, ends, duplexes);
+
+  PacketBoundaries boundaries;
+  size_t start = 0;
+  ForEachBit(ends, [&](size_t end) {
+    if (end - start < PACKET_WORDS_MAX) {
+      boundaries.packet_starts.push_back(start);
+    }
+    start = end + 1;
+  });
+  ForEachBit(duplexes,
+             [&](size_t offset) { boundaries.duplexes.push_back(offset); });
+  return boundaries;
+}
@@ -0,0 +1,39 @@
+/*
+ * Copyright (C) 2020 Google LLC
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License along
+ * with this program; if not, write to the Free Software Foundation, Inc.,
+ * 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+#pragma once
+
+#include <cstdint>
+#include <vector>
+
+#include "absl/types/span.h"
+
+// Packet boundaries of a word buffer, found from parse bits alone.
+struct PacketBoundaries {
+  // Word offsets where a packet may start: the first word, and each word that
+  // follows an end-of-packet word, as long as the packet ends within
+  // PACKET_WORDS_MAX words. Offsets in longer runs of words can't start a
+  // packet, and such data regions don't need to be decoded.
+  std::vector<size_t> packet_starts;
+  // Word offsets of duplex words, i.e. words with parse bits 00. A duplex
+  // always ends its packet.
+  std::vector<size_t> duplexes;
+};
+
+// Scans the parse bits of all |words|.
+PacketBoundaries ScanPacketBoundaries(absl::Span<const uint32_t> words);
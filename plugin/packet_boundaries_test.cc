@@ -0,0 +1,91 @@
+// Copyright (C) 2020 Google LLC
+//
+// This program is free software; you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation; either version 2 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License along
+// with this program; if not, write to the Free Software Foundation, Inc.,
+// 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#include "plugin/packet_boundaries.h"
+
+#include <random>
+
+#include "gmock/gmock.h"
+#include "gtest/gtest.h"
+#include "third_party/qemu-hexagon/cpu_bits.h"
+
+namespace {
+
+using testing::ElementsAre;
+using testing::IsEmpty;
+
+TEST(PacketBoundariesTest, FindsPacketStartsAndDuplexes) {
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint32_t> words = {0x0dea76c0, 0x28b32811, 0x5bffff5c,
+                                 0x961ec01e, 0x7800e000};
+  PacketBoundaries boundaries = ScanPacketBoundaries(words);
+  EXPECT_THAT(boundaries.packet_starts, ElementsAre(0, 2, 3, 4));
+  EXPECT_THAT(boundaries.duplexes, ElementsAre(1));
+}
+
+TEST(PacketBoundariesTest, SkipsPacketsLongerThanMaxWords) {
+  // Five words without an end-of-packet marker, followed by:
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint32_t> words = {0x0dea76c0, 0x0dea76c0, 0x0dea76c0,
+                                 0x0dea76c0, 0x0dea76c0, 0x7800e000,
+                                 0x7800e000};
+  PacketBoundaries boundaries = ScanPacketBoundaries(words);
+  EXPECT_THAT(boundaries.packet_starts, ElementsAre(6));
+  EXPECT_THAT(boundaries.duplexes, IsEmpty());
+}
+
+TEST(PacketBoundariesTest, SkipsIncompleteTrailingPacket) {
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  std::vector<uint32_t> words = {0x7800e000, 0x0dea76c0};
+  PacketBoundaries boundaries = ScanPacketBoundaries(words);
+  EXPECT_THAT(boundaries.packet_starts, ElementsAre(0));
+}
+
+TEST(PacketBoundariesTest, MatchesWordByWordScan) {
+  std::mt19937 rng(1);
+  // Sizes that are not multiples of the vector width exercise the tail.
+  for (size_t size : {0, 1, 3, 4, 63, 64, 65, 1000, 1027}) {
+    std::vector<uint32_t> words(size);
+    for (auto &word : words) {
+      word = rng();
+    }
+    std::vector<size_t> expected_starts;
+    std::vector<size_t> expected_duplexes;
+    size_t start = 0;
+    for (size_t i = 0; i < words.size(); i++) {
+      if (parse_bits(words[i]) == 0) {
+        expected_duplexes.push_back(i);
+      }
+      if (is_packet_end(words[i])) {
+        if (i - start < PACKET_WORDS_MAX) {
+          expected_starts.push_back(start);
+        }
+        start = i + 1;
+      }
+    }
+    PacketBoundaries boundaries = ScanPacketBoundaries(words);
+    EXPECT_EQ(boundaries.packet_starts, expected_starts) << size;
+    EXPECT_EQ(boundaries.duplexes, expected_duplexes) << size;
+  }
+}
+
+} // namespace
@@ -16,8 +16,9 @@
 
 #include "plugin/packet_context.h"
 
-#include "absl/memory/memory.h"
+#include "absl/container/inlined_vector.h"
 #include "plugin/hex_regs.h"
+#include "plugin/hex_regs_info.h"
 #include "third_party/qemu-hexagon/attribs.h"
 #include "third_party/qemu-hexagon/iclass.h"
 #include "third_party/qemu-hexagon/insn.h"
@@ -29,15 +30,50 @@ namespace {
 
 using namespace BinaryNinja;
 
-std::unique_ptr<TempReg> MakeTempReg(bool rw, int size, int reg,
-                                     LowLevelILFunction &il) {
-  if (rw) {
-    return absl::make_unique<DestReadWriteReg>(size, reg, il);
+// Adds an IL SetRegister expression that copies |reg| to |temp|.
+void CopyToTemp(LowLevelILFunction &il, int size, int reg, int temp) {
+  ExprId expr;
+  if (size == 1) {
+    expr = il.SetRegister(1, temp, il.Register(1, reg));
+  } else if (size == 4) {
+    expr = il.SetRegister(4, temp, il.Register(4, reg));
   } else {
-    return absl::make_unique<DestWriteOnlyReg>(size, reg);
+    CHECK_EQ(size, 8);
+    expr = il.SetRegister(8, temp, il.RegisterSplit(4, reg + 1, reg));
   }
+  il.AddInstruction(expr);
 }
 
+// Adds an IL SetRegister expression that copies |temp| to |reg|.
+void CopyFromTemp(LowLevelILFunction &il, int size, int reg, int temp) {
+  ExprId expr;
+  if (size == 1) {
+    expr = il.SetRegister(1, reg, il.Register(1, temp));
+  } else if (size == 4) {
+    expr = il.SetRegister(4, reg, il.Register(4, temp));
+  } else {
+    CHECK_EQ(size, 8);
+    expr = il.SetRegisterSplit(4, reg + 1, reg, il.Register(8, temp));
+  }
+  il.AddInstruction(expr);
+}
+
+// Returns true if |a| and |b| are the same register, or one is a sub
+// register of the other.
+bool RegsOverlap(int a, int b) {
+  return a == b || kHexRegs[a].full_width_reg == b ||
+         kHexRegs[b].full_width_reg == a;
+}
+
+// Registers read and written by an instruction.
+struct InsnRegs {
+  // Explicit single register dests that may be written directly.
+  absl::InlinedVector<int, 4> writes;
+  // Read-write operands among |writes|.
+  absl::InlinedVector<int, 2> read_writes;
+  absl::InlinedVector<int, 8> reads;
+};
+
 } // namespace
 
 int MapRegNum(char regtype, int regno) {
@@ -54,33 +90,141 @@ int MapRegNum(char regtype, int regno) {
   return -1;
 }
 
-void TempReg::CopyToTemp(BinaryNinja::LowLevelILFunction &il) {
-  ExprId expr;
-  if (size_ == 1) {
-    expr = il.SetRegister(1, Reg(), il.Register(1, reg_));
-  } else if (size_ == 4) {
-    expr = il.SetRegister(4, Reg(), il.Register(4, reg_));
-  } else {
-    CHECK_EQ(size_, 8);
-    expr = il.SetRegister(8, Reg(), il.RegisterSplit(4, reg_ + 1, reg_));
+HexRegSet FindDirectDestRegs(const Packet &pkt,
+                             const InsnRegAccess *reg_access) {
+  InsnRegs insn_regs[INSTRUCTIONS_MAX];
+  // Registers that must go through LLIL_TEMP registers.
+  HexRegSet temp_regs;
+  absl::InlinedVector<int, 8> fixed_writes;
+  for (int i = 0; i < pkt.num_insns; i++) {
+    const Insn &insn = pkt.insn[i];
+    const InsnRegAccess &access = reg_access[insn.opcode];
+    InsnRegs &regs = insn_regs[i];
+    for (int op = 0; op < REG_OPERANDS_MAX; op++) {
+      if (access.access[op] == RegAccess::kNone) {
+        continue;
+      }
+      const int reg = MapRegNum(access.regtype[op], insn.regno[op]);
+      switch (access.access[op]) {
+      case RegAccess::kRead:
+        regs.reads.push_back(reg);
+        break;
+      case RegAccess::kReadPair:
+        regs.reads.push_back(reg);
+        regs.reads.push_back(reg + 1);
+        break;
+      case RegAccess::kWrite:
+        regs.writes.push_back(reg);
+        break;
+      case RegAccess::kReadWrite:
+        regs.writes.push_back(reg);
+        regs.read_writes.push_back(reg);
+        break;
+      case RegAccess::kWritePair:
+      case RegAccess::kReadWritePair:
+        temp_regs.Add(reg);
+        temp_regs.Add(reg + 1);
+        break;
+      case RegAccess::kReadNew:
+        temp_regs.Add(reg);
+        break;
+      case RegAccess::kNone:
+        break;
+      }
+    }
+    for (int j = 0; j < access.num_fixed_reads; j++) {
+      regs.reads.push_back(access.fixed_reads[j]);
+    }
+    for (int j = 0; j < access.num_fixed_writes; j++) {
+      fixed_writes.push_back(access.fixed_writes[j]);
+    }
+    for (int p = 0; p < 4; p++) {
+      if (access.fixed_pred_writes & (1 << p)) {
+        temp_regs.Add(HEX_REG_P0 + p);
+      }
+    }
   }
-  il.AddInstruction(expr);
+
+  for (int i = 0; i < pkt.num_insns; i++) {
+    for (int reg : insn_regs[i].writes) {
+      for (int fixed : fixed_writes) {
+        if (RegsOverlap(reg, fixed)) {
+          temp_regs.Add(reg);
+        }
+      }
+      // This instruction's sources, and instructions lifted after it, must
+      // read the old value. A read-write operand reads its own old value
+      // before writing it.
+      for (int j = i; j < pkt.num_insns; j++) {
+        for (int read : insn_regs[j].reads) {
+          if (RegsOverlap(reg, read)) {
+            temp_regs.Add(reg);
+          }
+        }
+        for (int read : insn_regs[j].read_writes) {
+          if ((j != i || read != reg) && RegsOverlap(reg, read)) {
+            temp_regs.Add(reg);
+          }
+        }
+      }
+    }
+  }
+
+  HexRegSet direct_regs;
+  for (int i = 0; i < pkt.num_insns; i++) {
+    for (int reg : insn_regs[i].writes) {
+      if (!temp_regs.Contains(reg)) {
+        direct_regs.Add(reg);
+      }
+    }
+  }
+  return direct_regs;
 }
 
-void TempReg::CopyFromTemp(BinaryNinja::LowLevelILFunction &il) {
-  ExprId expr;
-  if (size_ == 1) {
-    expr = il.SetRegister(1, reg_, il.Register(1, Reg()));
-  } else if (size_ == 4) {
-    expr = il.SetRegister(4, reg_, il.Register(4, Reg()));
-  } else {
-    CHECK_EQ(size_, 8);
-    expr = il.SetRegisterSplit(4, reg_ + 1, reg_, il.Register(8, Reg()));
+bool PacketWritesReg(const Packet &pkt, int reg,
+                     const InsnRegAccess *reg_access) {
+  for (int i = 0; i < pkt.num_insns; i++) {
+    const Insn &insn = pkt.insn[i];
+    const InsnRegAccess &access = reg_access[insn.opcode];
+    for (int op = 0; op < REG_OPERANDS_MAX; op++) {
+      const RegAccess op_access = access.access[op];
+      const bool pair = op_access == RegAccess::kWritePair ||
+                        op_access == RegAccess::kReadWritePair;
+      if (!pair && op_access != RegAccess::kWrite &&
+          op_access != RegAccess::kReadWrite) {
+        continue;
+      }
+      const int op_reg = MapRegNum(access.regtype[op], insn.regno[op]);
+      if (RegsOverlap(reg, op_reg) || (pair && RegsOverlap(reg, op_reg + 1))) {
+        return true;
+      }
+    }
+    for (int j = 0; j < access.num_fixed_writes; j++) {
+      if (RegsOverlap(reg, access.fixed_writes[j])) {
+        return true;
+      }
+    }
+    for (int p = 0; p < 4; p++) {
+      if ((access.fixed_pred_writes & (1 << p)) &&
+          RegsOverlap(reg, HEX_REG_P0 + p)) {
+        return true;
+      }
+    }
   }
-  il.AddInstruction(expr);
+  return false;
+}
+
+void TempReg::CopyToTemp(BinaryNinja::LowLevelILFunction &il) {
+  ::CopyToTemp(il, size_, reg_, Reg());
+}
+
+void TempReg::CopyFromTemp(BinaryNinja::LowLevelILFunction &il) {
+  ::CopyFromTemp(il, size_, reg_, Reg());
 }
 
-PacketContext::PacketContext(BinaryNinja::LowLevelILFunction &il) : il_(il) {}
+PacketContext::PacketContext(BinaryNinja::LowLevelILFunction &il,
+                             HexRegSet direct_regs)
+    : il_(il), direct_regs_(direct_regs) {}
 
 PacketContext::~PacketContext() {}
 
@@ -109,11 +253,16 @@ int PacketContext::AddDestReadWritePredReg(int reg) {
 }
 
 int PacketContext::AddDestReg(bool rw, int size, int reg) {
-  auto it = regs_.find(reg);
-  if (it == regs_.end()) {
-    auto out = regs_.emplace(reg, MakeTempReg(rw, size, reg, il_));
-    DCHECK(out.second);
-    it = out.first;
+  CHECK(reg >= 0 && reg < NUM_HEX_REGS) << "Unexpected DestReg " << reg;
+  if (size != 8 && direct_regs_.Contains(reg)) {
+    return reg;
+  }
+  if (!dirty_.Contains(reg)) {
+    dirty_.Add(reg);
+    dest_regs_[reg].size = size;
+    if (rw) {
+      CopyToTemp(il_, size, reg, LLIL_TEMP(reg));
+    }
   } else {
     // TODO: handle the case where a dest register appears as a single 32b
     // register, and a 64b pair. For example,
@@ -122,17 +271,18 @@ int PacketContext::AddDestReg(bool rw, int size, int reg) {
     //      if (p0) r1 = #0
     //      if (!p0) r1:0 = memd(r3+#0) }
     //
-    if (size != it->second->Size()) {
+    if (size != dest_regs_[reg].size) {
       LOG(WARNING) << "Req to add DestReg " << reg << " of size " << size
                    << " when it is already registered with size "
-                   << it->second->Size();
+                   << dest_regs_[reg].size;
     }
   }
-  return it->second->Reg();
+  // Same LLIL_TEMP register as TempReg in subspace 0.
+  return LLIL_TEMP(reg);
 }
 
 void PacketContext::WriteClobberedRegs() {
-  for (auto &r : regs_) {
-    r.second->CopyFromTemp(il_);
-  }
+  dirty_.ForEach([&](int reg) {
+    CopyFromTemp(il_, dest_regs_[reg].size, reg, LLIL_TEMP(reg));
+  });
 }
@@ -18,14 +18,13 @@
 
 #pragma once
 
-#include <unordered_map>
-#include <vector>
+#include <cstdint>
 
-#include "absl/memory/memory.h"
 #include "absl/types/optional.h"
 #include "binaryninjaapi.h"
 #include "plugin/hex_regs.h"
 #include "third_party/qemu-hexagon/insn.h"
+#include "third_party/qemu-hexagon/opcodes.h"
 
 // Holds indirect branch destinations.
 #define BRANCHR_DEST_ARRAY LLIL_TEMP(200)
@@ -41,6 +40,75 @@
 //   MapRegNum('P', 1) ->  HEX_REG_P1
 int MapRegNum(char regtype, int regno);
 
+// Set of HEX_REG registers.
+class HexRegSet {
+public:
+  void Add(int reg) { words_[reg / 64] |= uint64_t{1} << (reg % 64); }
+  bool Contains(int reg) const {
+    return (words_[reg / 64] >> (reg % 64)) & 1;
+  }
+
+  // Calls |fn| with each register in the set, in increasing order.
+  template <typename Fn> void ForEach(Fn fn) const {
+    for (int i = 0; i < kNumWords; i++) {
+      for (uint64_t bits = words_[i]; bits != 0; bits &= bits - 1) {
+        fn(i * 64 + __builtin_ctzll(bits));
+      }
+    }
+  }
+
+private:
+  static constexpr int kNumWords = (NUM_HEX_REGS + 63) / 64;
+  uint64_t words_[kNumWords] = {};
+};
+
+// How an instruction's lifter accesses a register operand.
+enum class RegAccess : uint8_t {
+  kNone,
+  kRead,
+  kReadPair,
+  kWrite,
+  kWritePair,
+  kReadWrite,
+  kReadWritePair,
+  // Reads the '.new' value of a register produced in the same packet.
+  kReadNew,
+};
+
+// Registers accessed by an instruction's lifter.
+struct InsnRegAccess {
+  static constexpr int kMaxFixedRegs = 6;
+
+  // Indexed like Insn::regno.
+  RegAccess access[REG_OPERANDS_MAX];
+  char regtype[REG_OPERANDS_MAX];
+  // Registers read or written by name, like HEX_REG_SP.
+  uint8_t num_fixed_reads;
+  uint8_t fixed_reads[kMaxFixedRegs];
+  uint8_t num_fixed_writes;
+  uint8_t fixed_writes[kMaxFixedRegs];
+  // Bit N is set if the lifter writes PN as a fixed predicate, like
+  // compound compare-jumps do.
+  uint8_t fixed_pred_writes;
+};
+
+// Defined in il_funcs_generated.cc.
+extern const InsnRegAccess opcode_reg_access[XX_LAST_OPCODE];
+
+// Returns the dest registers of |pkt| that can be written directly, without
+// an LLIL_TEMP register: 32b or predicate registers that no instruction
+// reads after they are written, other than a read-write operand reading its
+// own value. Registers involved in '.new' reads, register pairs, fixed
+// predicates and fixed writes always go through LLIL_TEMP registers.
+// |pkt| is in lifting order, see PreparePacketForLifting().
+HexRegSet FindDirectDestRegs(
+    const Packet &pkt, const InsnRegAccess *reg_access = opcode_reg_access);
+
+// Returns true if an instruction in |pkt| writes |reg|, or a register that
+// overlaps it, like HEX_REG_P3_0 for HEX_REG_P0.
+bool PacketWritesReg(const Packet &pkt, int reg,
+                     const InsnRegAccess *reg_access = opcode_reg_access);
+
 // Temporary source/dest register.
 // Maps HEX_REG register to LLIL_TEMP register space:
 //   HEX_REG_R00 -> LLIL_TEMP(HEX_REG_R00).
@@ -97,42 +165,27 @@ public:
   SourcePairReg &operator=(const SourcePairReg &) = delete;
 };
 
-class DestWriteOnlyReg : public TempReg {
-public:
-  DestWriteOnlyReg(int size, int reg) : TempReg(size, reg, /*subspace=*/0) {}
-  ~DestWriteOnlyReg() override = default;
-  DestWriteOnlyReg(const DestWriteOnlyReg &) = delete;
-  DestWriteOnlyReg &operator=(const DestWriteOnlyReg &) = delete;
-};
-
-// Register value is copied on construction.
-// LLIL_TEMP register value is copied back to normal register space
-// when PacketContext.WriteClobberedRegs() is called.
-class DestReadWriteReg : public SourceReg {
-public:
-  DestReadWriteReg(int size, int reg, BinaryNinja::LowLevelILFunction &il)
-      : SourceReg(size, reg, il) {}
-  ~DestReadWriteReg() override = default;
-  DestReadWriteReg(const DestReadWriteReg &) = delete;
-  DestReadWriteReg &operator=(const DestReadWriteReg &) = delete;
-};
-
 // Holds all temporary dest registers in the packet.
+// Dest registers are assigned LLIL_TEMP registers as TempReg does, except
+// for |direct_regs|, which are written in place. Read-write dest registers
+// are copied to their LLIL_TEMP register when added.
 // Copies all dest registers back to original registers when
 // WriteClobberedRegs() is called on packet destruction.
 // Managing dest registers in LLIL_TEMP space helps implement the '.new'
 // semantics.
 class PacketContext {
 public:
-  PacketContext(BinaryNinja::LowLevelILFunction &il);
+  PacketContext(BinaryNinja::LowLevelILFunction &il,
+                HexRegSet direct_regs = HexRegSet());
   ~PacketContext();
   PacketContext(const PacketContext &) = delete;
   PacketContext &operator=(const PacketContext &) = delete;
 
   BinaryNinja::LowLevelILFunction &IL() { return il_; }
 
-  // Creates new DestReg and inserts it to |regs_| map if doesn't exist.
-  // Returns the register index in the LLIL_TEMP register space.
+  // Marks |reg| as a dest register if it isn't one already.
+  // Returns the register index in the LLIL_TEMP register space, or |reg| if
+  // it is written directly.
   int AddDestWriteOnlyRegPair(int reg);
   int AddDestReadWriteRegPair(int reg);
   int AddDestWriteOnlyReg(int reg);
@@ -140,12 +193,20 @@ public:
   int AddDestWriteOnlyPredReg(int reg);
   int AddDestReadWritePredReg(int reg);
 
-  // Adds IL instructions that write back all clobbered registers.
+  // Adds IL instructions that write back all clobbered registers, in
+  // increasing register order.
   void WriteClobberedRegs();
 
 private:
+  struct DestReg {
+    int size;
+  };
+
   int AddDestReg(bool rw, int size, int reg);
 
   BinaryNinja::LowLevelILFunction &il_;
-  std::unordered_map<int, std::unique_ptr<TempReg>> regs_;
+  const HexRegSet direct_regs_;
+  // Indexed by HEX_REG, valid for registers in |dirty_|.
+  DestReg dest_regs_[NUM_HEX_REGS];
+  HexRegSet dirty_;
 };
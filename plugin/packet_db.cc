@@ -16,14 +16,94 @@
 
 #include "plugin/packet_db.h"
 
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <thread>
+#include <vector>
+
+#include "absl/cleanup/cleanup.h"
+#include "absl/strings/str_cat.h"
 #include "absl/types/span.h"
 #include "glog/logging.h"
+#include "plugin/packet_boundaries.h"
 #include "plugin/status_macros.h"
 #include "third_party/abseil-cpp/absl/status/status.h"
 
+namespace {
+
+// Maximum number of packets decoded by a single Decoder::DecodePackets() call.
+constexpr size_t kDecodeBatchSize = 64;
+
+// Number of recently found packets each thread keeps.
+constexpr size_t kThreadCacheSize = 4;
+
+// Recently found packets of the calling thread, for a single database at a
+// time. Binary Ninja queries instruction info, text and IL for the same
+// address in a row, and then moves on to the next address in the packet.
+struct ThreadCache {
+  uint64_t db_id = 0;
+  uint64_t epoch = 0;
+  std::array<PacketDb::AddressInfo, kThreadCacheSize> packets;
+  // See PacketDb::MatchesSections().
+  std::array<bool, kThreadCacheSize> matches_sections;
+  size_t num_packets = 0;
+  // Next entry to replace.
+  size_t next = 0;
+};
+
+thread_local ThreadCache thread_cache;
+
+std::atomic<uint64_t> next_db_id{1};
+
+// Persisted packets file format: a header, followed by |num_records|
+// PacketRecord entries.
+constexpr char kPacketFileMagic[8] = {'H', 'E', 'X', 'P', 'K', 'T', 'D', 'B'};
+constexpr uint32_t kPacketFileFormatVersion = 2;
+
+struct PacketFileHeader {
+  char magic[8];
+  uint32_t format_version;
+  uint32_t decoder_version;
+  // Catches Packet layout and opcode changes that did not bump the version.
+  uint32_t record_size;
+  uint32_t num_opcodes;
+  uint64_t section_key;
+  uint64_t section_size;
+  uint64_t num_records;
+  // Hash of all records.
+  uint64_t checksum;
+};
+
+struct PacketRecord {
+  uint64_t start_addr;
+  uint32_t words[PACKET_WORDS_MAX];
+  Packet pkt;
+};
+
+// 64-bit FNV-1a. Unlike absl::Hash, stable across processes.
+uint64_t Fnv1a(const void *data, size_t size,
+               uint64_t hash = 0xcbf29ce484222325ULL) {
+  const auto *bytes = static_cast<const uint8_t *>(data);
+  for (size_t i = 0; i < size; i++) {
+    hash ^= bytes[i];
+    hash *= 0x100000001b3ULL;
+  }
+  return hash;
+}
+
+} // namespace
+
 bool operator==(const PacketDb::AddressInfo &lhs,
                 const PacketDb::AddressInfo &rhs) {
-  return (lhs.start_addr == rhs.start_addr && lhs.pkt == rhs.pkt);
+  return (lhs.start_addr == rhs.start_addr && lhs.pkt == rhs.pkt &&
+          lhs.words == rhs.words);
 }
 
 bool operator!=(const PacketDb::AddressInfo &lhs,
@@ -31,39 +111,731 @@ bool operator!=(const PacketDb::AddressInfo &lhs,
   return !(lhs == rhs);
 }
 
+PacketDb::PacketDb(size_t capacity) : id_(next_db_id++), capacity_(capacity) {}
+
 absl::Status PacketDb::AddBytes(absl::Span<const uint8_t> data, uint64_t addr) {
   if (data.size() < 4 || data.size() % 4 != 0) {
     return absl::FailedPreconditionError("Insufficient bytes in data");
   }
   auto words = absl::MakeConstSpan(
       reinterpret_cast<const uint32_t *>(data.data()), data.size() / 4);
-  int packets_added = 0;
+  auto packets = DecodeWords(words, addr, /*resync=*/false);
+  if (packets.empty()) {
+    return absl::FailedPreconditionError("Insufficient bytes in data");
+  }
+  AddPackets(packets);
+  return absl::OkStatus();
+}
+
+absl::Status PacketDb::AddSection(absl::Span<const uint8_t> data,
+                                  uint64_t addr, int num_threads) {
+  if (data.size() < 4 || data.size() % 4 != 0) {
+    return absl::FailedPreconditionError("Insufficient bytes in data");
+  }
+  auto words = absl::MakeConstSpan(
+      reinterpret_cast<const uint32_t *>(data.data()), data.size() / 4);
+
+  // Split words into chunks of consecutive packets, skipping data that can't
+  // be packets.
+  const PacketBoundaries boundaries = ScanPacketBoundaries(words);
+  num_threads = std::max(num_threads, 1);
+  const size_t chunk_size = std::max<size_t>(words.size() / num_threads, 1);
+  std::vector<std::pair<size_t, size_t>> bounds;
+  for (size_t start : boundaries.packet_starts) {
+    size_t end = start;
+    while (!is_packet_end(words[end])) {
+      end++;
+    }
+    end++;
+    if (!bounds.empty() && bounds.back().second == start &&
+        bounds.back().second - bounds.back().first < chunk_size) {
+      bounds.back().second = end;
+    } else {
+      bounds.emplace_back(start, end);
+    }
+  }
+
+  // Decode chunks in parallel.
+  std::vector<std::vector<AddressInfo>> chunks(bounds.size());
+  std::atomic<size_t> next_chunk = 0;
+  std::vector<std::thread> threads;
+  for (size_t i = 0; i < std::min<size_t>(num_threads, chunks.size()); i++) {
+    threads.emplace_back([&]() {
+      for (size_t j = next_chunk++; j < chunks.size(); j = next_chunk++) {
+        auto [begin, end] = bounds[j];
+        chunks[j] = DecodeWords(words.subspan(begin, end - begin),
+                                addr + begin * 4, /*resync=*/true);
+      }
+    });
+  }
+  for (auto &t : threads) {
+    t.join();
+  }
+
+  std::vector<AddressInfo> packets;
+  for (auto &chunk : chunks) {
+    packets.insert(packets.end(), chunk.begin(), chunk.end());
+  }
+  if (packets.empty()) {
+    return absl::FailedPreconditionError("No packets in section");
+  }
+  AddPackets(packets);
+  return absl::OkStatus();
+}
+
+std::vector<PacketDb::AddressInfo>
+PacketDb::DecodeWords(absl::Span<const uint32_t> words, uint64_t addr,
+                      bool resync) {
+  std::vector<AddressInfo> packets;
+  std::vector<Packet> batch(std::min(words.size(), kDecodeBatchSize));
   while (words.size() > 0) {
-    auto result = Decoder::Get().DecodePacket(words);
-    if (!result.ok()) {
+    auto result = Decoder::Get().DecodePackets(words, absl::MakeSpan(batch));
+    for (size_t i = 0; i < result.num_packets; i++) {
+      AddressInfo info = {};
+      info.start_addr = addr;
+      info.pkt = batch[i];
+      info.prepared_pkt = PreparePacketForLifting(info.pkt);
+      const size_t num_words = info.pkt.encod_pkt_size_in_bytes / 4;
+      std::copy_n(words.begin(), num_words, info.words.begin());
+      packets.push_back(info);
+      addr += num_words * 4;
+      words = words.subspan(num_words);
+    }
+    if (result.status.ok()) {
+      continue;
+    }
+    if (!resync) {
       break;
     }
-    auto pkt = result.value();
-    absl::MutexLock lock(&mu_);
-    map_.SetInterval(addr, addr + pkt.encod_pkt_size_in_bytes,
-                     AddressInfo{addr, pkt});
-    addr += pkt.encod_pkt_size_in_bytes;
-    words = words.subspan(pkt.encod_pkt_size_in_bytes / 4);
-    packets_added++;
+    // Resync at the next end-of-packet boundary.
+    size_t num_words = 0;
+    while (num_words < words.size() && !is_packet_end(words[num_words])) {
+      num_words++;
+    }
+    num_words = std::min(num_words + 1, words.size());
+    addr += num_words * 4;
+    words = words.subspan(num_words);
   }
-  if (packets_added == 0) {
-    return absl::FailedPreconditionError("Insufficient bytes in data");
+  return packets;
+}
+
+void PacketDb::AddPackets(const std::vector<AddressInfo> &packets) {
+  absl::MutexLock lock(&mu_);
+  bool replaced = false;
+  for (const auto &info : packets) {
+    const uint64_t end = info.start_addr + info.pkt.encod_pkt_size_in_bytes;
+    for (auto it = map_.find(info.start_addr);
+         !replaced && it != map_.end() && it.interval_begin() < end; ++it) {
+      replaced = it.value().pkt.encod_pkt_size_in_bytes != 0;
+    }
+    map_.SetInterval(info.start_addr, end, info);
+    Touch(info.start_addr, info.pkt.encod_pkt_size_in_bytes);
+  }
+  // The first packet is the one the caller asked for, keep it the most
+  // recently used.
+  Touch(packets[0].start_addr, packets[0].pkt.encod_pkt_size_in_bytes);
+  EvictIfNeeded();
+  // Packets added to empty intervals don't invalidate per-thread caches,
+  // which only hold packets that were found.
+  if (replaced) {
+    epoch_++;
+  }
+}
+
+uint64_t PacketDb::SectionKey(absl::Span<const uint8_t> data, uint64_t addr) {
+  const uint32_t version = Decoder::kVersion;
+  uint64_t hash = Fnv1a(&version, sizeof(version));
+  hash = Fnv1a(&addr, sizeof(addr), hash);
+  return Fnv1a(data.data(), data.size(), hash);
+}
+
+absl::Status PacketDb::SaveSection(absl::Span<const uint8_t> data,
+                                   uint64_t addr, const std::string &path) {
+  std::vector<PacketRecord> records;
+  {
+    absl::ReaderMutexLock lock(&mu_);
+    for (auto it = map_.find(addr);
+         it != map_.end() && it.interval_begin() < addr + data.size(); ++it) {
+      const AddressInfo info = it.value();
+      // Skip gaps, and packets that were partially overwritten.
+      if (info.pkt.encod_pkt_size_in_bytes == 0 ||
+          it.interval_begin() != info.start_addr ||
+          it.interval_end() !=
+              info.start_addr + info.pkt.encod_pkt_size_in_bytes ||
+          it.interval_end() > addr + data.size() ||
+          !MatchesBytes(info, data.subspan(info.start_addr - addr),
+                        info.start_addr)) {
+        continue;
+      }
+      PacketRecord record;
+      memset(&record, 0, sizeof(record));
+      record.start_addr = info.start_addr;
+      std::copy(info.words.begin(), info.words.end(), record.words);
+      record.pkt = info.pkt;
+      records.push_back(record);
+    }
+  }
+
+  PacketFileHeader header;
+  memset(&header, 0, sizeof(header));
+  memcpy(header.magic, kPacketFileMagic, sizeof(header.magic));
+  header.format_version = kPacketFileFormatVersion;
+  header.decoder_version = Decoder::kVersion;
+  header.record_size = sizeof(PacketRecord);
+  header.num_opcodes = XX_LAST_OPCODE;
+  header.section_key = SectionKey(data, addr);
+  header.section_size = data.size();
+  header.num_records = records.size();
+  header.checksum =
+      Fnv1a(records.data(), records.size() * sizeof(PacketRecord));
+
+  // Write to a temporary file first, so that concurrent readers never map
+  // a partially written file.
+  const std::string tmp_path = absl::StrCat(path, ".tmp", getpid());
+  {
+    std::ofstream out(tmp_path, std::ios::binary | std::ios::trunc);
+    out.write(reinterpret_cast<const char *>(&header), sizeof(header));
+    out.write(reinterpret_cast<const char *>(records.data()),
+              records.size() * sizeof(PacketRecord));
+    if (!out) {
+      std::remove(tmp_path.c_str());
+      return absl::InternalError(absl::StrCat("Failed to write ", tmp_path));
+    }
+  }
+  if (std::rename(tmp_path.c_str(), path.c_str()) != 0) {
+    std::remove(tmp_path.c_str());
+    return absl::InternalError(absl::StrCat("Failed to rename ", tmp_path));
+  }
+  return absl::OkStatus();
+}
+
+absl::Status PacketDb::LoadSection(absl::Span<const uint8_t> data,
+                                   uint64_t addr, const std::string &path) {
+  int fd = open(path.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return absl::NotFoundError(absl::StrCat("Failed to open ", path));
   }
+  auto close_fd = absl::MakeCleanup([fd] { close(fd); });
+  struct stat st;
+  if (fstat(fd, &st) != 0 ||
+      static_cast<size_t>(st.st_size) < sizeof(PacketFileHeader)) {
+    return absl::DataLossError(absl::StrCat("Truncated file ", path));
+  }
+  const size_t file_size = st.st_size;
+  void *mapped = mmap(nullptr, file_size, PROT_READ, MAP_PRIVATE, fd, 0);
+  if (mapped == MAP_FAILED) {
+    return absl::InternalError(absl::StrCat("Failed to mmap ", path));
+  }
+  auto unmap = absl::MakeCleanup([mapped, file_size] {
+    munmap(mapped, file_size);
+  });
+
+  PacketFileHeader header;
+  memcpy(&header, mapped, sizeof(header));
+  if (memcmp(header.magic, kPacketFileMagic, sizeof(header.magic)) != 0 ||
+      header.format_version != kPacketFileFormatVersion ||
+      header.decoder_version != Decoder::kVersion ||
+      header.record_size != sizeof(PacketRecord) ||
+      header.num_opcodes != XX_LAST_OPCODE) {
+    return absl::DataLossError(absl::StrCat("Stale file ", path));
+  }
+  if (header.section_size != data.size() ||
+      header.section_key != SectionKey(data, addr)) {
+    return absl::DataLossError(
+        absl::StrCat("File ", path, " was written for other section bytes"));
+  }
+  if (header.num_records !=
+      (file_size - sizeof(header)) / sizeof(PacketRecord)) {
+    return absl::DataLossError(absl::StrCat("Truncated file ", path));
+  }
+  const auto *records = reinterpret_cast<const PacketRecord *>(
+      static_cast<const uint8_t *>(mapped) + sizeof(header));
+  if (header.checksum !=
+      Fnv1a(records, header.num_records * sizeof(PacketRecord))) {
+    return absl::DataLossError(absl::StrCat("Corrupt file ", path));
+  }
+
+  std::vector<AddressInfo> packets;
+  packets.reserve(header.num_records);
+  for (size_t i = 0; i < header.num_records; i++) {
+    const PacketRecord &record = records[i];
+    AddressInfo info = {};
+    info.start_addr = record.start_addr;
+    std::copy_n(record.words, PACKET_WORDS_MAX, info.words.begin());
+    info.pkt = record.pkt;
+    // Guards against bugs that would otherwise read outside the section.
+    if (info.start_addr < addr ||
+        info.start_addr + info.pkt.encod_pkt_size_in_bytes >
+            addr + data.size() ||
+        info.pkt.encod_pkt_size_in_bytes == 0 ||
+        info.pkt.num_insns > INSTRUCTIONS_MAX) {
+      return absl::DataLossError(absl::StrCat("Corrupt record in ", path));
+    }
+    info.prepared_pkt = PreparePacketForLifting(info.pkt);
+    packets.push_back(info);
+  }
+  if (packets.empty()) {
+    return absl::DataLossError(absl::StrCat("No packets in ", path));
+  }
+  AddPackets(packets);
   return absl::OkStatus();
 }
 
 absl::StatusOr<PacketDb::InsnInfo> PacketDb::Lookup(uint64_t addr) {
+  auto result = FindPacket(addr);
+  if (!result.ok()) {
+    misses_++;
+    return result.status();
+  }
+  hits_++;
+  return FindInstructionInPacket(result.value(), addr);
+}
+
+absl::StatusOr<PacketDb::InsnInfo>
+PacketDb::LookupOrAddBytes(absl::Span<const uint8_t> data, uint64_t addr) {
+  bool matches_sections = false;
+  auto result = FindPacket(addr, &matches_sections);
+  std::vector<PacketBytes> starts;
+  if (result.ok() && MatchesBytes(result.value(), data, addr)) {
+    // Views hold other bytes at the packet's addresses. Keep the packet if a
+    // view that holds |data| has it, or if no such view is known.
+    if (!matches_sections) {
+      starts = ReadFromPacketStarts(data, addr);
+    }
+    if (matches_sections || starts.empty() ||
+        std::any_of(starts.begin(), starts.end(),
+                    [&](const PacketBytes &packet_bytes) {
+                      return HoldsPacket(packet_bytes, result.value());
+                    })) {
+      hits_++;
+      return FindInstructionInPacket(result.value(), addr);
+    }
+  } else if (result.ok()) {
+    mismatches_++;
+  }
+  misses_++;
+  if (starts.empty()) {
+    starts = ReadFromPacketStarts(data, addr);
+  }
+  if (!starts.empty()) {
+    if (starts[0].start_addr != addr) {
+      misaligned_lookups_++;
+    }
+    RETURN_IF_ERROR(AddBytes(starts[0].bytes, starts[0].start_addr));
+  } else {
+    RETURN_IF_ERROR(AddBytes(data, addr));
+  }
+  ASSIGN_OR_RETURN(AddressInfo addr_info, FindPacket(addr));
+  return FindInstructionInPacket(addr_info, addr);
+}
+
+void PacketDb::AddSectionBytes(uint64_t view_id,
+                               absl::Span<const uint8_t> data, uint64_t addr) {
+  if (addr % 4 != 0 || data.size() < 4) {
+    return;
+  }
   absl::MutexLock lock(&mu_);
-  const auto &addr_info = map_.find(addr).value();
+  const size_t num_words = data.size() / 4;
+  for (size_t i = 0; i < num_words;) {
+    const uint64_t word_addr = addr + i * 4;
+    const size_t slot = (word_addr % kSectionPageSize) / 4;
+    const size_t n = std::min(kSectionPageWords - slot, num_words - i);
+    const PageKey key(word_addr / kSectionPageSize, view_id);
+    auto [it, added] = pages_.try_emplace(key);
+    SectionPage &page = it->second;
+    if (capacity_ != 0) {
+      // Re-added pages are the newest.
+      if (!added) {
+        page_order_.erase(page.order);
+      }
+      page.order = page_order_.insert(page_order_.end(), key);
+    }
+    memcpy(&page.words[slot], data.data() + i * 4, n * 4);
+    for (size_t j = slot; j < slot + n; j++) {
+      page.valid.set(j);
+      page.section_starts.reset(j);
+    }
+    if (i == 0) {
+      page.section_starts.set(slot);
+    }
+    i += n;
+  }
+  EvictPagesIfNeeded();
+  epoch_++;
+}
+
+void PacketDb::UpdateSectionBytes(uint64_t view_id,
+                                  absl::Span<const uint8_t> data,
+                                  uint64_t addr) {
+  if (addr % 4 != 0) {
+    return;
+  }
+  absl::MutexLock lock(&mu_);
+  for (size_t i = 0; i < data.size() / 4; i++) {
+    const uint64_t word_addr = addr + i * 4;
+    auto it = pages_.find(PageKey(word_addr / kSectionPageSize, view_id));
+    if (it == pages_.end()) {
+      continue;
+    }
+    const size_t slot = (word_addr % kSectionPageSize) / 4;
+    if (it->second.valid.test(slot)) {
+      memcpy(&it->second.words[slot], data.data() + i * 4, 4);
+    }
+  }
+  epoch_++;
+}
+
+void PacketDb::RemoveSectionBytes(uint64_t view_id) {
+  absl::MutexLock lock(&mu_);
+  RemoveSectionPages(view_id);
+}
+
+void PacketDb::RemoveView(uint64_t view_id) {
+  absl::MutexLock lock(&mu_);
+  // Collect packets while the view's section bytes are still there.
+  std::vector<LruEntry> packets;
+  for (const auto &[key, page] : pages_) {
+    if (key.second != view_id) {
+      continue;
+    }
+    const uint64_t page_start = key.first * kSectionPageSize;
+    const uint64_t page_end = page_start + kSectionPageSize;
+    for (auto it = map_.find(page_start);
+         it != map_.end() && it.interval_begin() < page_end; ++it) {
+      const AddressInfo &info = it.value();
+      if (info.pkt.encod_pkt_size_in_bytes != 0 &&
+          (packets.empty() || packets.back().start_addr != info.start_addr) &&
+          SectionHoldsPacket(view_id, info) &&
+          !OtherSectionHoldsPacket(view_id, info)) {
+        packets.push_back(
+            LruEntry{info.start_addr, info.pkt.encod_pkt_size_in_bytes});
+      }
+    }
+  }
+  RemovePackets(packets);
+  RemoveSectionPages(view_id);
+}
+
+void PacketDb::RemoveSectionPages(uint64_t view_id) {
+  for (auto it = pages_.begin(); it != pages_.end();) {
+    if (it->first.second != view_id) {
+      ++it;
+      continue;
+    }
+    if (capacity_ != 0) {
+      page_order_.erase(it->second.order);
+    }
+    it = pages_.erase(it);
+  }
+  epoch_++;
+}
+
+void PacketDb::EvictPagesIfNeeded() {
+  if (capacity_ == 0) {
+    return;
+  }
+  while (page_order_.size() * kSectionPageWords >
+         capacity_ * PACKET_WORDS_MAX) {
+    pages_.erase(page_order_.front());
+    page_order_.pop_front();
+  }
+}
+
+bool PacketDb::ReadSectionWord(uint64_t view_id, uint64_t addr,
+                               uint32_t &word) {
+  auto it = pages_.find(PageKey(addr / kSectionPageSize, view_id));
+  if (it == pages_.end()) {
+    return false;
+  }
+  const size_t slot = (addr % kSectionPageSize) / 4;
+  if (!it->second.valid.test(slot)) {
+    return false;
+  }
+  word = it->second.words[slot];
+  return true;
+}
+
+bool PacketDb::IsSectionStart(uint64_t view_id, uint64_t addr) {
+  auto it = pages_.find(PageKey(addr / kSectionPageSize, view_id));
+  return it != pages_.end() &&
+         it->second.section_starts.test((addr % kSectionPageSize) / 4);
+}
+
+std::vector<PacketDb::PacketBytes>
+PacketDb::ReadFromPacketStarts(absl::Span<const uint8_t> data, uint64_t addr) {
+  std::vector<PacketBytes> starts;
+  if (addr % 4 != 0) {
+    return starts;
+  }
+  absl::ReaderMutexLock lock(&mu_);
+  const uint64_t index = addr / kSectionPageSize;
+  for (auto it = pages_.lower_bound(PageKey(index, 0));
+       it != pages_.end() && it->first.first == index; ++it) {
+    auto packet_bytes = ReadFromViewPacketStart(it->first.second, data, addr);
+    if (packet_bytes.ok()) {
+      starts.push_back(std::move(packet_bytes).value());
+    }
+  }
+  return starts;
+}
+
+absl::StatusOr<PacketDb::PacketBytes>
+PacketDb::ReadFromViewPacketStart(uint64_t view_id,
+                                  absl::Span<const uint8_t> data,
+                                  uint64_t addr) {
+  // Section bytes must match |data|, as far as the section goes.
+  std::vector<uint32_t> words;
+  for (size_t i = 0; i < data.size() / 4; i++) {
+    uint32_t word;
+    if (!ReadSectionWord(view_id, addr + i * 4, word)) {
+      break;
+    }
+    if (memcmp(&word, data.data() + i * 4, 4) != 0) {
+      return absl::NotFoundError("Section bytes differ");
+    }
+    words.push_back(word);
+  }
+  if (words.empty()) {
+    return absl::NotFoundError("Address not in a section");
+  }
+
+  // A packet starts after the closest preceding end-of-packet word.
+  uint64_t start = addr;
+  while (!IsSectionStart(view_id, start)) {
+    uint32_t word;
+    if (!ReadSectionWord(view_id, start - 4, word)) {
+      return absl::NotFoundError("No section bytes before address");
+    }
+    if (is_packet_end(word)) {
+      break;
+    }
+    if (addr - start == (PACKET_WORDS_MAX - 1) * 4) {
+      return absl::NotFoundError("No packet boundary in preceding words");
+    }
+    words.insert(words.begin(), word);
+    start -= 4;
+  }
+  PacketBytes packet_bytes;
+  packet_bytes.start_addr = start;
+  const auto *bytes = reinterpret_cast<const uint8_t *>(words.data());
+  packet_bytes.bytes.assign(bytes, bytes + words.size() * 4);
+  return packet_bytes;
+}
+
+PacketDb::Stats PacketDb::GetStats() {
+  return Stats{
+      .hits = hits_.load(),
+      .misses = misses_.load(),
+      .evictions = evictions_.load(),
+      .mismatches = mismatches_.load(),
+      .thread_cache_hits = thread_cache_hits_.load(),
+      .thread_cache_misses = thread_cache_misses_.load(),
+      .misaligned_lookups = misaligned_lookups_.load(),
+  };
+}
+
+bool PacketDb::MatchesBytes(const AddressInfo &addr_info,
+                            absl::Span<const uint8_t> data, uint64_t addr) {
+  const size_t offset = addr - addr_info.start_addr;
+  const size_t size =
+      std::min(addr_info.pkt.encod_pkt_size_in_bytes - offset, data.size());
+  const auto *bytes = reinterpret_cast<const uint8_t *>(addr_info.words.data());
+  return std::equal(data.begin(), data.begin() + size, bytes + offset);
+}
+
+bool PacketDb::HoldsPacket(const PacketBytes &packet_bytes,
+                           const AddressInfo &addr_info) {
+  const size_t size = std::min<size_t>(addr_info.pkt.encod_pkt_size_in_bytes,
+                                       packet_bytes.bytes.size());
+  return packet_bytes.start_addr == addr_info.start_addr &&
+         memcmp(packet_bytes.bytes.data(), addr_info.words.data(), size) == 0;
+}
+
+bool PacketDb::MatchesSections(const AddressInfo &addr_info) {
+  const uint64_t start = addr_info.start_addr;
+  const uint64_t end = start + addr_info.pkt.encod_pkt_size_in_bytes;
+  for (uint64_t index = start / kSectionPageSize;
+       index <= (end - 1) / kSectionPageSize; index++) {
+    for (auto it = pages_.lower_bound(PageKey(index, 0));
+         it != pages_.end() && it->first.first == index; ++it) {
+      if (!SectionHoldsPacket(it->first.second, addr_info)) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+bool PacketDb::SectionHoldsPacket(uint64_t view_id,
+                                  const AddressInfo &addr_info) {
+  const uint64_t start = addr_info.start_addr;
+  const uint64_t end = start + addr_info.pkt.encod_pkt_size_in_bytes;
+  for (uint64_t addr = start; addr < end; addr += 4) {
+    uint32_t word;
+    if (!ReadSectionWord(view_id, addr, word) ||
+        word != addr_info.words[(addr - start) / 4]) {
+      return false;
+    }
+  }
+  uint32_t prev_word;
+  return IsSectionStart(view_id, start) ||
+         (ReadSectionWord(view_id, start - 4, prev_word) &&
+          is_packet_end(prev_word));
+}
+
+bool PacketDb::OtherSectionHoldsPacket(uint64_t view_id,
+                                       const AddressInfo &addr_info) {
+  const uint64_t index = addr_info.start_addr / kSectionPageSize;
+  for (auto it = pages_.lower_bound(PageKey(index, 0));
+       it != pages_.end() && it->first.first == index; ++it) {
+    if (it->first.second != view_id &&
+        SectionHoldsPacket(it->first.second, addr_info)) {
+      return true;
+    }
+  }
+  return false;
+}
+
+absl::StatusOr<PacketDb::AddressInfo>
+PacketDb::FindPacket(uint64_t addr, bool *matches_sections) {
+  // Read before searching the map: a change made meanwhile invalidates the
+  // cached result.
+  const uint64_t epoch = epoch_.load();
+  ThreadCache &cache = thread_cache;
+  if (cache.db_id != id_ || cache.epoch != epoch) {
+    cache.db_id = id_;
+    cache.epoch = epoch;
+    cache.num_packets = 0;
+    cache.next = 0;
+  }
+  for (size_t i = 0; i < cache.num_packets; i++) {
+    const AddressInfo &info = cache.packets[i];
+    if (addr >= info.start_addr &&
+        addr < info.start_addr + info.pkt.encod_pkt_size_in_bytes) {
+      thread_cache_hits_++;
+      if (matches_sections != nullptr) {
+        *matches_sections = cache.matches_sections[i];
+      }
+      return info;
+    }
+  }
+  thread_cache_misses_++;
+
+  absl::StatusOr<AddressInfo> result;
+  bool matches = false;
+  if (capacity_ == 0) {
+    // Nothing to update on a hit, share the lock with other readers.
+    absl::ReaderMutexLock lock(&mu_);
+    result = FindPacketLocked(addr);
+    matches = result.ok() && MatchesSections(result.value());
+  } else {
+    absl::MutexLock lock(&mu_);
+    result = FindPacketLocked(addr);
+    if (result.ok()) {
+      Touch(result->start_addr, result->pkt.encod_pkt_size_in_bytes);
+      matches = MatchesSections(result.value());
+    }
+  }
+  if (matches_sections != nullptr) {
+    *matches_sections = matches;
+  }
+  if (result.ok()) {
+    cache.packets[cache.next] = result.value();
+    cache.matches_sections[cache.next] = matches;
+    cache.next = (cache.next + 1) % kThreadCacheSize;
+    cache.num_packets = std::min(cache.num_packets + 1, kThreadCacheSize);
+  }
+  return result;
+}
+
+absl::StatusOr<PacketDb::AddressInfo>
+PacketDb::FindPacketLocked(uint64_t addr) {
+  auto addr_info = map_.find(addr).value();
   if (addr_info.pkt.encod_pkt_size_in_bytes == 0) {
     return absl::NotFoundError("Packet not found in interval map");
   }
-  return FindInstructionInPacket(addr_info, addr);
+  return addr_info;
+}
+
+void PacketDb::Touch(uint64_t start_addr, uint32_t size) {
+  if (capacity_ == 0) {
+    return;
+  }
+  auto it = lru_index_.find(start_addr);
+  if (it != lru_index_.end()) {
+    it->second->size = size;
+    lru_.splice(lru_.begin(), lru_, it->second);
+    return;
+  }
+  lru_.push_front(LruEntry{start_addr, size});
+  lru_index_.emplace(start_addr, lru_.begin());
+}
+
+void PacketDb::EvictIfNeeded() {
+  if (capacity_ == 0) {
+    return;
+  }
+  while (lru_.size() > capacity_) {
+    const LruEntry entry = lru_.back();
+    lru_.pop_back();
+    lru_index_.erase(entry.start_addr);
+    if (ClearPacket(entry.start_addr, entry.size)) {
+      evictions_++;
+    }
+  }
+}
+
+void PacketDb::InvalidateRange(uint64_t view_id, uint64_t start,
+                               uint64_t end) {
+  absl::MutexLock lock(&mu_);
+  // Collect whole packets first, including those that straddle the range.
+  std::vector<LruEntry> packets;
+  for (auto it = map_.find(start); it != map_.end() && it.interval_begin() < end;
+       ++it) {
+    const AddressInfo &info = it.value();
+    if (info.pkt.encod_pkt_size_in_bytes != 0 &&
+        (packets.empty() || packets.back().start_addr != info.start_addr) &&
+        !OtherSectionHoldsPacket(view_id, info)) {
+      packets.push_back(
+          LruEntry{info.start_addr, info.pkt.encod_pkt_size_in_bytes});
+    }
+  }
+  RemovePackets(packets);
+}
+
+void PacketDb::RemovePackets(const std::vector<LruEntry> &packets) {
+  for (const auto &packet : packets) {
+    ClearPacket(packet.start_addr, packet.size);
+    auto it = lru_index_.find(packet.start_addr);
+    if (it != lru_index_.end()) {
+      lru_.erase(it->second);
+      lru_index_.erase(it);
+    }
+  }
+}
+
+bool PacketDb::ClearPacket(uint64_t start_addr, uint32_t size) {
+  // The packet may have been partially, or fully, overwritten by other
+  // packets since it was added. Only clear what is still owned by it.
+  std::vector<std::pair<uint64_t, uint64_t>> owned;
+  const uint64_t end = start_addr + size;
+  for (auto it = map_.find(start_addr); it != map_.end(); ++it) {
+    if (it.interval_begin() >= end) {
+      break;
+    }
+    if (it.value().start_addr == start_addr &&
+        it.value().pkt.encod_pkt_size_in_bytes != 0) {
+      owned.emplace_back(std::max(it.interval_begin(), start_addr),
+                         std::min(it.interval_end(), end));
+    }
+  }
+  for (const auto &range : owned) {
+    map_.SetInterval(range.first, range.second, AddressInfo());
+  }
+  if (!owned.empty()) {
+    epoch_++;
+  }
+  return !owned.empty();
 }
 
 PacketDb::InsnInfo
@@ -72,8 +844,10 @@ PacketDb::FindInstructionInPacket(const PacketDb::AddressInfo &addr_info,
   InsnInfo result = {
       .pc = addr_info.start_addr,
       .pkt = addr_info.pkt,
+      .prepared_pkt = addr_info.prepared_pkt,
       .insn_num = 0,
       .insn_addr = addr_info.start_addr,
+      .words = addr_info.words,
   };
   for (; result.insn_num < result.pkt.num_insns; result.insn_num++) {
     const Insn &insn = result.pkt.insn[result.insn_num];
@@ -18,29 +18,74 @@
 
 #pragma once
 
+#include <array>
+#include <atomic>
+#include <bitset>
+#include <list>
+#include <map>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
 #include "absl/status/statusor.h"
 #include "absl/synchronization/mutex.h"
 #include "absl/types/span.h"
 #include "plugin/decoder.h"
 #include "third_party/chromium/blink/interval_map.h"
+#include "third_party/qemu-hexagon/cpu_bits.h"
 
 // Manages an address -> Packet database.
 // Access is thread safe.
+// The database can optionally be bounded to a maximum number of packets, in
+// which case the least recently used packets are evicted first.
+// A single database is shared by all binary views using the architecture,
+// since architecture callbacks don't identify the calling view. Packets keep
+// the words they were decoded from. LookupOrAddBytes() checks them against
+// the bytes it is passed, and the packet words before the looked up address
+// against the section bytes of views that hold the passed bytes, see
+// AddSectionBytes(). Views that hold the same bytes at an address, but other
+// bytes before it in the packet, can't be told apart, nor views without
+// section bytes.
 class PacketDb {
 public:
   struct AddressInfo {
     uint64_t start_addr;
     Packet pkt;
+    // |pkt| prepared for lifting, see PreparePacketForLifting().
+    Packet prepared_pkt;
+    std::array<uint32_t, PACKET_WORDS_MAX> words;
   };
 
   struct InsnInfo {
     uint64_t pc;
     Packet pkt;
+    Packet prepared_pkt;
     uint32_t insn_num;
     uint64_t insn_addr;
+    // Words the packet was decoded from.
+    std::array<uint32_t, PACKET_WORDS_MAX> words;
+  };
+
+  struct Stats {
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t evictions;
+    // Cached packets that did not match the bytes passed to
+    // LookupOrAddBytes(), and were decoded again.
+    uint64_t mismatches;
+    // Packet searches answered by the calling thread's recently found
+    // packets, without locking the map, and searches that were not.
+    uint64_t thread_cache_hits;
+    uint64_t thread_cache_misses;
+    // Lookups inside packets that were not decoded yet, which were decoded
+    // from the packet start found in section bytes, instead of from the
+    // looked up address.
+    uint64_t misaligned_lookups;
   };
 
-  PacketDb() = default;
+  PacketDb() : PacketDb(0) {}
+  // Holds at most |capacity| packets. Zero means unbounded.
+  explicit PacketDb(size_t capacity);
   ~PacketDb() = default;
 
   // Decodes new input bytes and updates the map.
@@ -48,14 +93,220 @@ public:
   absl::Status AddBytes(absl::Span<const uint8_t> data, uint64_t addr)
       ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
 
+  // Linearly sweeps a whole code section, starting at |addr|, and adds all
+  // decoded packets to the map. The section is split at end-of-packet
+  // boundaries and the chunks are decoded on up to |num_threads| threads.
+  // Words that fail to decode are skipped up to the next end-of-packet
+  // boundary.
+  // Returns Ok if at least one new packet was added.
+  absl::Status AddSection(absl::Span<const uint8_t> data, uint64_t addr,
+                          int num_threads) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Keeps a copy of the code section |data| of view |view_id|, read at the
+  // word aligned |addr|, replacing bytes previously added for the view at the
+  // same addresses. LookupOrAddBytes() uses it to find where a packet starts,
+  // when looking up an address inside a packet that was not decoded yet.
+  // If the database is bounded, section bytes are bounded too, to the words
+  // |capacity| packets can hold, and the oldest bytes are dropped first.
+  void AddSectionBytes(uint64_t view_id, absl::Span<const uint8_t> data,
+                       uint64_t addr) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Overwrites section bytes of view |view_id| at the word aligned |addr|
+  // with |data|, e.g. after the view's bytes were patched. Bytes outside the
+  // view's sections are ignored.
+  void UpdateSectionBytes(uint64_t view_id, absl::Span<const uint8_t> data,
+                          uint64_t addr) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Drops all section bytes of view |view_id|.
+  void RemoveSectionBytes(uint64_t view_id) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Drops all section bytes of view |view_id|, e.g. when the view is closed,
+  // and the packets they hold that no other view's section bytes hold.
+  void RemoveView(uint64_t view_id) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Returns a key that identifies the section bytes |data|, read at |addr|,
+  // and the decoder version. Used to name persisted packet files.
+  static uint64_t SectionKey(absl::Span<const uint8_t> data, uint64_t addr);
+
+  // Writes all packets that were decoded from the section |data|, read at
+  // |addr|, to a versioned file at |path|.
+  absl::Status SaveSection(absl::Span<const uint8_t> data, uint64_t addr,
+                           const std::string &path) ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Memory maps a file previously written by SaveSection() and adds its
+  // packets to the map. Fails with NotFound if there is no such file, and
+  // with DataLoss if the file is corrupt, or was written for other section
+  // bytes or by another decoder version.
+  absl::Status LoadSection(absl::Span<const uint8_t> data, uint64_t addr,
+                           const std::string &path) ABSL_LOCKS_EXCLUDED(mu_);
+
   // Looks up a previously decoded instruction at |addr|.
   absl::StatusOr<InsnInfo> Lookup(uint64_t addr)
       ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
 
+  // Looks up the instruction at |addr|. On a miss, e.g. if the packet was
+  // never decoded, was evicted or was decoded from different bytes, decodes
+  // |data| and looks up again. If |addr| is inside a packet of a section
+  // added by AddSectionBytes(), decodes from the start of that packet
+  // instead. A packet found inside such a section must start where the
+  // section has a packet start, and hold the section bytes.
+  absl::StatusOr<InsnInfo> LookupOrAddBytes(absl::Span<const uint8_t> data,
+                                            uint64_t addr)
+      ABSL_LOCKS_EXCLUDED(mu_);
+
+  // Drops all packets that overlap [start, end), e.g. after the bytes of view
+  // |view_id| in that range changed. Keeps packets that the section bytes of
+  // another view hold. Dropped packets are decoded again by
+  // LookupOrAddBytes().
+  void InvalidateRange(uint64_t view_id, uint64_t start, uint64_t end)
+      ABSL_LOCKS_EXCLUDED(mu_);
+
+  Stats GetStats() ABSL_LOCKS_EXCLUDED(mu_);
+
 private:
   static InsnInfo FindInstructionInPacket(const AddressInfo &addr_info,
                                           uint64_t addr);
 
+  // Decodes consecutive packets from |words|, which are read at |addr|. If
+  // |resync| is set, skips words that fail to decode up to the next
+  // end-of-packet word, instead of stopping.
+  static std::vector<AddressInfo> DecodeWords(absl::Span<const uint32_t> words,
+                                              uint64_t addr, bool resync);
+
+  // Adds decoded |packets| to the map, and marks |packets[0]| as the most
+  // recently used packet.
+  void AddPackets(const std::vector<AddressInfo> &packets)
+      ABSL_LOCKS_EXCLUDED(mu_);
+
+  struct PacketBytes {
+    uint64_t start_addr;
+    std::vector<uint8_t> bytes;
+  };
+
+  // Finds the start of the packet holding |addr| in the section bytes of each
+  // view that holds |data| at |addr|, by going back over the parse bits of
+  // preceding section words. Returns the section bytes from each start
+  // through the end of |data|.
+  std::vector<PacketBytes> ReadFromPacketStarts(absl::Span<const uint8_t> data,
+                                                uint64_t addr)
+      ABSL_LOCKS_EXCLUDED(mu_);
+  // Same, in the section bytes of view |view_id|. Fails if the view has no
+  // section bytes at |addr|, they differ from |data|, or the packet start
+  // isn't known.
+  absl::StatusOr<PacketBytes>
+  ReadFromViewPacketStart(uint64_t view_id, absl::Span<const uint8_t> data,
+                          uint64_t addr) ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Returns true if |packet_bytes| start with the words of |addr_info|.
+  static bool HoldsPacket(const PacketBytes &packet_bytes,
+                          const AddressInfo &addr_info);
+
+  // Returns true if every view with section bytes at the words of
+  // |addr_info| holds these words, starting at a packet boundary.
+  bool MatchesSections(const AddressInfo &addr_info)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Returns true if the section bytes of view |view_id| hold the words of
+  // |addr_info|, starting at a packet boundary.
+  bool SectionHoldsPacket(uint64_t view_id, const AddressInfo &addr_info)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Returns true if the section bytes of a view other than |view_id| hold
+  // the words of |addr_info|, see SectionHoldsPacket().
+  bool OtherSectionHoldsPacket(uint64_t view_id, const AddressInfo &addr_info)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Section words are kept in pages of |kSectionPageWords| words, aligned to
+  // the page size.
+  static constexpr size_t kSectionPageWords = 256;
+  static constexpr uint64_t kSectionPageSize = kSectionPageWords * 4;
+
+  // Page index and view id.
+  using PageKey = std::pair<uint64_t, uint64_t>;
+
+  // Section words of a single view in a page.
+  struct SectionPage {
+    std::array<uint32_t, kSectionPageWords> words;
+    // Words read from a section.
+    std::bitset<kSectionPageWords> valid;
+    // Words at the start of a section.
+    std::bitset<kSectionPageWords> section_starts;
+    // Position in |page_order_|, if the database is bounded.
+    std::list<PageKey>::iterator order;
+  };
+
+  // Reads the section word of view |view_id| at |addr| into |word|. Returns
+  // false if the view has no section bytes at |addr|.
+  bool ReadSectionWord(uint64_t view_id, uint64_t addr, uint32_t &word)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Returns true if a section of view |view_id| starts at |addr|.
+  bool IsSectionStart(uint64_t view_id, uint64_t addr)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Drops all section pages of view |view_id|.
+  void RemoveSectionPages(uint64_t view_id) ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
+  // Drops the oldest section pages until they fit |capacity_| packets.
+  void EvictPagesIfNeeded() ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
+  // Returns true if |data|, read at |addr|, holds the same bytes |addr_info|
+  // was decoded from.
+  static bool MatchesBytes(const AddressInfo &addr_info,
+                           absl::Span<const uint8_t> data, uint64_t addr);
+
+  // Finds the packet that holds |addr|, and marks it as most recently used.
+  // Each thread first checks the packets it found last, which are only
+  // marked as used when they are found in the map. Sets |matches_sections|
+  // to MatchesSections() of the packet, if given.
+  absl::StatusOr<AddressInfo> FindPacket(uint64_t addr,
+                                         bool *matches_sections = nullptr)
+      ABSL_LOCKS_EXCLUDED(mu_);
+  absl::StatusOr<AddressInfo> FindPacketLocked(uint64_t addr)
+      ABSL_SHARED_LOCKS_REQUIRED(mu_);
+
+  // Marks the packet at |start_addr| as most recently used.
+  void Touch(uint64_t start_addr, uint32_t size)
+      ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
+  // Evicts least recently used packets until the map fits |capacity_|.
+  void EvictIfNeeded() ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
+  // Clears the parts of the map still owned by the packet at |start_addr|.
+  // Returns true if anything was cleared.
+  bool ClearPacket(uint64_t start_addr, uint32_t size)
+      ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
+  struct LruEntry {
+    uint64_t start_addr;
+    uint32_t size;
+  };
+
+  // Clears |packets| from the map and the LRU list.
+  void RemovePackets(const std::vector<LruEntry> &packets)
+      ABSL_EXCLUSIVE_LOCKS_REQUIRED(mu_);
+
   absl::Mutex mu_;
   media::IntervalMap<uint64_t, AddressInfo> map_ ABSL_GUARDED_BY(mu_);
+  std::map<PageKey, SectionPage> pages_ ABSL_GUARDED_BY(mu_);
+  // Oldest section page first. Only maintained if |capacity_| is set.
+  std::list<PageKey> page_order_ ABSL_GUARDED_BY(mu_);
+  // Identifies this database in per-thread caches.
+  const uint64_t id_;
+  // Bumped whenever packets are removed from or replaced in |map_|, or
+  // |pages_| change, invalidating per-thread caches.
+  std::atomic<uint64_t> epoch_{0};
+  const size_t capacity_ = 0;
+  // Most recently used packet first. Only maintained if |capacity_| is set.
+  std::list<LruEntry> lru_ ABSL_GUARDED_BY(mu_);
+  std::unordered_map<uint64_t, std::list<LruEntry>::iterator>
+      lru_index_ ABSL_GUARDED_BY(mu_);
+  // Updated under a shared lock.
+  std::atomic<uint64_t> hits_{0};
+  std::atomic<uint64_t> misses_{0};
+  std::atomic<uint64_t> evictions_{0};
+  std::atomic<uint64_t> mismatches_{0};
+  std::atomic<uint64_t> thread_cache_hits_{0};
+  std::atomic<uint64_t> thread_cache_misses_{0};
+  std::atomic<uint64_t> misaligned_lookups_{0};
 };
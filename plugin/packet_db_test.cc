@@ -16,6 +16,9 @@
 
 #include "plugin/packet_db.h"
 
+#include <cstdio>
+#include <fstream>
+
 #include "absl/status/status.h"
 #include "plugin/status_matchers.h"
 #include "gtest/gtest.h"
@@ -28,6 +31,7 @@ using testing::Eq;
 using testing::Not;
 
 constexpr uint64_t kAddress = 0x1000;
+constexpr uint64_t kViewId = 1;
 
 TEST(PacketDbTest, FailsIfDataLessThanFour) {
   PacketDb db;
@@ -138,6 +142,10 @@ TEST(PacketDbTest, AddsAndLookupsSinglePacketTwoInstructions) {
   EXPECT_THAT(i5.insn_addr, kAddress + 4);
   EXPECT_THAT(i6.insn_addr, kAddress + 6);
   EXPECT_THAT(i7.insn_addr, kAddress + 6);
+  EXPECT_THAT(i0.words[0], 0x0dea76c0);
+  EXPECT_THAT(i0.words[1], 0x28b32811);
+  EXPECT_THAT(i0.words[2], 0);
+  EXPECT_THAT(i7.words, Eq(i0.words));
 }
 
 TEST(PacketDbTest, AddsAndLookupsTwoAdjacentPackets) {
@@ -276,4 +284,529 @@ TEST(PacketDbTest, PacketWithEndLoop) {
   EXPECT_THAT(i7.insn_num, 1);
 }
 
+TEST(PacketDbTest, CountsHitsAndMisses) {
+  PacketDb db;
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data = {0x00, 0xe0, 0x00, 0x78};
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  EXPECT_THAT(db.AddBytes(data, kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress + 2), IsOk());
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.hits, 2);
+  EXPECT_EQ(stats.misses, 1);
+  EXPECT_EQ(stats.evictions, 0);
+}
+
+TEST(PacketDbTest, EvictsLeastRecentlyUsedPacket) {
+  constexpr uint64_t kAddress1 = 0x1000;
+  constexpr uint64_t kAddress2 = 0x2000;
+  constexpr uint64_t kAddress3 = 0x3000;
+  PacketDb db(/*capacity=*/2);
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  std::vector<uint8_t> data3 = {0x00, 0xe0, 0x00, 0x78};
+  EXPECT_THAT(db.AddBytes(data1, kAddress1), IsOk());
+  EXPECT_THAT(db.AddBytes(data2, kAddress2), IsOk());
+  // Makes kAddress2 the least recently used packet.
+  EXPECT_THAT(db.Lookup(kAddress1), IsOk());
+  EXPECT_THAT(db.AddBytes(data3, kAddress3), IsOk());
+
+  EXPECT_THAT(db.Lookup(kAddress1), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress2),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  EXPECT_THAT(db.Lookup(kAddress3), IsOk());
+  EXPECT_EQ(db.GetStats().evictions, 1);
+}
+
+TEST(PacketDbTest, KeepsRequestedPacketWhenAddingMany) {
+  PacketDb db(/*capacity=*/1);
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data = {0x5c, 0xff, 0xff, 0x5b, 0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddBytes(data, kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress + 4),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+}
+
+TEST(PacketDbTest, LookupOrAddBytesRedecodesEvictedPacket) {
+  constexpr uint64_t kAddress1 = 0x1000;
+  constexpr uint64_t kAddress2 = 0x2000;
+  PacketDb db(/*capacity=*/1);
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(data1, kAddress1));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1,
+                       db.LookupOrAddBytes(data2, kAddress2));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i2,
+                       db.LookupOrAddBytes(data1, kAddress1));
+  EXPECT_THAT(i0.pkt, Eq(i2.pkt));
+  EXPECT_THAT(i0.pkt, Not(Eq(i1.pkt)));
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.hits, 0);
+  EXPECT_EQ(stats.misses, 3);
+  EXPECT_EQ(stats.evictions, 2);
+}
+
+TEST(PacketDbTest, EvictsOnlyWhatPacketStillOwns) {
+  PacketDb db(/*capacity=*/1);
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data1 = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddBytes(data1, kAddress), IsOk());
+  // Overwrites the second half of the first packet, then evicts it.
+  EXPECT_THAT(db.AddBytes(data2, kAddress + 4), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress + 4);
+}
+
+TEST(PacketDbTest, LookupOrAddBytesDecodesAgainOnDifferentBytes) {
+  PacketDb db;
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(data1, kAddress));
+  // Same address in another binary view.
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1,
+                       db.LookupOrAddBytes(data2, kAddress));
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i2,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data2).subspan(2), kAddress + 2));
+  EXPECT_THAT(i0.pkt, Not(Eq(i1.pkt)));
+  EXPECT_THAT(i1.pkt, Eq(i2.pkt));
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.hits, 1);
+  EXPECT_EQ(stats.misses, 2);
+  EXPECT_EQ(stats.mismatches, 1);
+}
+
+TEST(PacketDbTest, AnswersRepeatedLookupsFromThreadCache) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  EXPECT_THAT(db.AddBytes(data, kAddress), IsOk());
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1, db.Lookup(kAddress));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i2, db.Lookup(kAddress + 4));
+  EXPECT_THAT(i0.pkt, Eq(i1.pkt));
+  EXPECT_THAT(i0.pkt, Eq(i2.pkt));
+  EXPECT_THAT(i2.insn_num, 1);
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.thread_cache_hits, 2);
+  EXPECT_EQ(stats.thread_cache_misses, 1);
+}
+
+TEST(PacketDbTest, ThreadCacheIsInvalidatedByChanges) {
+  PacketDb db;
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddBytes(data1, kAddress), IsOk());
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress));
+  EXPECT_THAT(db.AddBytes(data2, kAddress), IsOk());
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1, db.Lookup(kAddress));
+  EXPECT_THAT(i0.pkt.insn[0].opcode, J2_call);
+  EXPECT_THAT(i1.pkt.insn[0].opcode, L4_return);
+  EXPECT_EQ(db.GetStats().thread_cache_hits, 0);
+}
+
+TEST(PacketDbTest, ThreadCacheIsKeptWhenPacketsAreAdded) {
+  PacketDb db;
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddBytes(data1, kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress), IsOk());
+  EXPECT_THAT(db.AddBytes(data2, kAddress + 4), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress), IsOk());
+  EXPECT_EQ(db.GetStats().thread_cache_hits, 1);
+}
+
+TEST(PacketDbTest, ThreadCacheIsNotSharedBetweenDatabases) {
+  PacketDb db1;
+  PacketDb db2;
+  // 00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data = {0x00, 0xe0, 0x00, 0x78};
+  EXPECT_THAT(db1.AddBytes(data, kAddress), IsOk());
+  EXPECT_THAT(db1.Lookup(kAddress), IsOk());
+  EXPECT_THAT(db2.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+}
+
+TEST(PacketDbTest, InvalidateRangeDropsOverlappingPackets) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28,
+                               0xb3, 0x28, 0x5c, 0xff, 0xff, 0x5b,
+                               0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddBytes(data, kAddress), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress), IsOk());
+  // Straddles the first and second packets.
+  db.InvalidateRange(kViewId, kAddress + 6, kAddress + 9);
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  EXPECT_THAT(db.Lookup(kAddress + 4),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  EXPECT_THAT(db.Lookup(kAddress + 8),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress + 12));
+  EXPECT_THAT(i0.pkt.insn[0].opcode, L4_return);
+}
+
+TEST(PacketDbTest, LookupOrAddBytesDecodesInvalidatedPacket) {
+  PacketDb db(/*capacity=*/2);
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  EXPECT_THAT(db.LookupOrAddBytes(data, kAddress), IsOk());
+  // Patch the first word into a packet of its own:
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  data[0] = 0x00;
+  data[1] = 0xe0;
+  data[2] = 0x00;
+  data[3] = 0x78;
+  db.InvalidateRange(kViewId, kAddress, kAddress + 4);
+  // Bytes of the second word did not change, but its packet did.
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i1,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4), kAddress + 4));
+  EXPECT_THAT(i1.pc, kAddress + 4);
+  EXPECT_THAT(i1.pkt.num_insns, 2);
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(data, kAddress));
+  EXPECT_THAT(i0.pkt.insn[0].opcode, A2_tfrsi);
+}
+
+TEST(PacketDbTest, InvalidateRangeKeepsPacketsOfOtherViews) {
+  PacketDb db;
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data2 = {0x00, 0xe0, 0x00, 0x78};
+  db.AddSectionBytes(/*view_id=*/1, data1, kAddress);
+  db.AddSectionBytes(/*view_id=*/2, data1, kAddress);
+  EXPECT_THAT(db.LookupOrAddBytes(data1, kAddress), IsOk());
+  // View 2 is patched, view 1 still holds the packet.
+  db.UpdateSectionBytes(/*view_id=*/2, data2, kAddress);
+  db.InvalidateRange(/*view_id=*/2, kAddress, kAddress + 4);
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress));
+  EXPECT_THAT(i0.pkt.insn[0].opcode, J2_call);
+  // Patched in both views.
+  db.UpdateSectionBytes(/*view_id=*/1, data2, kAddress);
+  db.InvalidateRange(/*view_id=*/1, kAddress, kAddress + 4);
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+}
+
+TEST(PacketDbTest, RemoveViewDropsPacketsOnlyItHolds) {
+  PacketDb db;
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data = {0x5c, 0xff, 0xff, 0x5b, 0x00, 0xe0, 0x00, 0x78};
+  db.AddSectionBytes(/*view_id=*/1, data, kAddress);
+  db.AddSectionBytes(/*view_id=*/2, absl::MakeConstSpan(data).subspan(4),
+                     kAddress + 4);
+  ASSERT_THAT(db.AddBytes(data, kAddress), IsOk());
+  db.RemoveView(/*view_id=*/1);
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  // View 2 still holds the second packet.
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1, db.Lookup(kAddress + 4));
+  EXPECT_THAT(i1.pkt.insn[0].opcode, A2_tfrsi);
+  db.RemoveView(/*view_id=*/2);
+  EXPECT_THAT(db.Lookup(kAddress + 4),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+}
+
+TEST(PacketDbTest, LookupOrAddBytesDecodesFromPacketStartInSection) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28,
+                               0xb3, 0x28, 0x5c, 0xff, 0xff, 0x5b};
+  db.AddSectionBytes(kViewId, data, kAddress);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i1,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4), kAddress + 4));
+  EXPECT_THAT(i1.pc, kAddress);
+  EXPECT_THAT(i1.pkt.num_insns, 3);
+  // The real packet is found at its start.
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(data, kAddress));
+  EXPECT_THAT(i0.pkt, Eq(i1.pkt));
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.misaligned_lookups, 1);
+  EXPECT_EQ(stats.misses, 1);
+}
+
+TEST(PacketDbTest, LookupOrAddBytesDecodesFromAddressIfSectionDiffers) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  db.AddSectionBytes(kViewId, data, kAddress);
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> other = {0x1e, 0xc0, 0x1e, 0x96};
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(other, kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress + 4);
+  EXPECT_THAT(i0.pkt.insn[0].opcode, L4_return);
+  EXPECT_EQ(db.GetStats().misaligned_lookups, 0);
+}
+
+TEST(PacketDbTest, UpdateSectionBytesChangesPacketStart) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  db.AddSectionBytes(kViewId, data, kAddress);
+  // Patch the first word into a packet of its own:
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> patch = {0x00, 0xe0, 0x00, 0x78};
+  db.UpdateSectionBytes(kViewId, patch, kAddress);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i0,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4), kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress + 4);
+  EXPECT_EQ(db.GetStats().misaligned_lookups, 0);
+}
+
+TEST(PacketDbTest, FindsPacketStartInSectionOfMatchingView) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data1 = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  //            00 e0 00 78 7800e000    r0 = ##3735924736 }
+  std::vector<uint8_t> data2 = {0xc0, 0x76, 0xea, 0x0d, 0x00, 0xe0, 0x00, 0x78};
+  db.AddSectionBytes(/*view_id=*/1, data1, kAddress);
+  db.AddSectionBytes(/*view_id=*/2, data2, kAddress);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i0,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data2).subspan(4), kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress);
+  EXPECT_THAT(i0.words[1], 0x7800e000);
+  db.RemoveSectionBytes(/*view_id=*/1);
+  db.RemoveSectionBytes(/*view_id=*/2);
+  db.InvalidateRange(kViewId, kAddress, kAddress + 8);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i1,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data1).subspan(4), kAddress + 4));
+  EXPECT_THAT(i1.pc, kAddress + 4);
+}
+
+TEST(PacketDbTest, DecodesAgainPacketWithOtherPrefixInView) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data1 = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  // 13c:       c1 76 ea 0d 0dea76c1 {  immext(#3735924800)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924811;      r1 = #1 }
+  std::vector<uint8_t> data2 = {0xc1, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  db.AddSectionBytes(/*view_id=*/1, data1, kAddress);
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0,
+                       db.LookupOrAddBytes(data1, kAddress));
+  EXPECT_THAT(i0.words[0], 0x0dea76c0);
+  // The bytes at the looked up address match, but view 2 holds another
+  // packet start.
+  db.RemoveSectionBytes(/*view_id=*/1);
+  db.AddSectionBytes(/*view_id=*/2, data2, kAddress);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i1,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data2).subspan(4), kAddress + 4));
+  EXPECT_THAT(i1.pc, kAddress);
+  EXPECT_THAT(i1.words[0], 0x0dea76c1);
+  // Kept once it matches the view.
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i2,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data2).subspan(4), kAddress + 4));
+  EXPECT_THAT(i2.words[0], 0x0dea76c1);
+  PacketDb::Stats stats = db.GetStats();
+  EXPECT_EQ(stats.hits, 1);
+  EXPECT_EQ(stats.misses, 2);
+}
+
+TEST(PacketDbTest, BoundsSectionBytesWithCapacity) {
+  // Holds as many section words as 64 packets can.
+  PacketDb db(/*capacity=*/64);
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  db.AddSectionBytes(kViewId, data, kAddress);
+  // Drops the oldest section bytes.
+  db.AddSectionBytes(kViewId, data, kAddress + 0x10000);
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i0,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4), kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress + 4);
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1,
+                       db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4),
+                                           kAddress + 0x10004));
+  EXPECT_THAT(i1.pc, kAddress + 0x10000);
+}
+
+TEST(PacketDbTest, AddSectionDecodesAllPackets) {
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  //            00 e0 00 78 7800e000 {  r0 = #256 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3,
+                               0x28, 0x5c, 0xff, 0xff, 0x5b, 0x1e, 0xc0,
+                               0x1e, 0x96, 0x00, 0xe0, 0x00, 0x78};
+  for (int num_threads : {1, 2, 3, 8}) {
+    PacketDb db;
+    EXPECT_THAT(db.AddSection(data, kAddress, num_threads), IsOk());
+    ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress + 4));
+    ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1, db.Lookup(kAddress + 8));
+    ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i2, db.Lookup(kAddress + 12));
+    ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i3, db.Lookup(kAddress + 16));
+    EXPECT_THAT(i0.pc, kAddress);
+    EXPECT_THAT(i0.pkt.num_insns, 3);
+    EXPECT_THAT(i1.pc, kAddress + 8);
+    EXPECT_THAT(i1.pkt.insn[0].opcode, J2_call);
+    EXPECT_THAT(i2.pc, kAddress + 12);
+    EXPECT_THAT(i2.pkt.insn[0].opcode, L4_return);
+    EXPECT_THAT(i3.pc, kAddress + 16);
+    EXPECT_THAT(i3.pkt.insn[0].opcode, A2_tfrsi);
+  }
+}
+
+TEST(PacketDbTest, AddSectionSkipsInvalidWords) {
+  PacketDb db;
+  // ASCII string: "ub-ID:%d", followed by:
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data = {0x75, 0x62, 0x2d, 0x49, 0x44, 0x3a,
+                               0x25, 0x64, 0x1e, 0xc0, 0x1e, 0x96};
+  EXPECT_THAT(db.AddSection(data, kAddress, /*num_threads=*/1), IsOk());
+  EXPECT_THAT(db.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress + 8));
+  EXPECT_THAT(i0.pc, kAddress + 8);
+  EXPECT_THAT(i0.pkt.insn[0].opcode, L4_return);
+}
+
+TEST(PacketDbTest, FindsSectionPacketInsideIt) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  db.AddSectionBytes(kViewId, data, kAddress);
+  EXPECT_THAT(db.AddSection(data, kAddress, /*num_threads=*/1), IsOk());
+  // A lookup at the second word finds the swept packet, with its immext.
+  ASSERT_OK_AND_ASSIGN(
+      PacketDb::InsnInfo i0,
+      db.LookupOrAddBytes(absl::MakeConstSpan(data).subspan(4), kAddress + 4));
+  EXPECT_THAT(i0.pc, kAddress);
+  EXPECT_THAT(i0.pkt.num_insns, 3);
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1,
+                       db.LookupOrAddBytes(data, kAddress));
+  EXPECT_THAT(i0.pkt, Eq(i1.pkt));
+  EXPECT_EQ(db.GetStats().misses, 0);
+}
+
+TEST(PacketDbTest, SavesAndLoadsSection) {
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28,
+                               0xb3, 0x28, 0x5c, 0xff, 0xff, 0x5b};
+  const std::string path = testing::TempDir() + "/saves_and_loads.pktdb";
+  PacketDb db1;
+  EXPECT_THAT(db1.AddSection(data, kAddress, /*num_threads=*/1), IsOk());
+  EXPECT_THAT(db1.SaveSection(data, kAddress, path), IsOk());
+
+  PacketDb db2;
+  EXPECT_THAT(db2.LoadSection(data, kAddress, path), IsOk());
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db1.Lookup(kAddress + 4));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i1, db2.Lookup(kAddress + 4));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i2, db1.Lookup(kAddress + 8));
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i3, db2.Lookup(kAddress + 8));
+  EXPECT_THAT(i0.pc, i1.pc);
+  EXPECT_THAT(i0.pkt, Eq(i1.pkt));
+  EXPECT_THAT(i2.pc, i3.pc);
+  EXPECT_THAT(i2.pkt, Eq(i3.pkt));
+  std::remove(path.c_str());
+}
+
+TEST(PacketDbTest, LoadSectionFailsIfFileIsMissing) {
+  PacketDb db;
+  std::vector<uint8_t> data = {0x5c, 0xff, 0xff, 0x5b};
+  EXPECT_THAT(
+      db.LoadSection(data, kAddress, testing::TempDir() + "/missing.pktdb"),
+      absl::StatusIs(absl::StatusCode::kNotFound));
+}
+
+TEST(PacketDbTest, LoadSectionFailsOnOtherBytes) {
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  //   c:       1e c0 1e 96 961ec01e {  dealloc_return }
+  std::vector<uint8_t> data1 = {0x5c, 0xff, 0xff, 0x5b};
+  std::vector<uint8_t> data2 = {0x1e, 0xc0, 0x1e, 0x96};
+  const std::string path = testing::TempDir() + "/other_bytes.pktdb";
+  PacketDb db1;
+  EXPECT_THAT(db1.AddSection(data1, kAddress, /*num_threads=*/1), IsOk());
+  EXPECT_THAT(db1.SaveSection(data1, kAddress, path), IsOk());
+
+  PacketDb db2;
+  EXPECT_THAT(db2.LoadSection(data2, kAddress, path),
+              absl::StatusIs(absl::StatusCode::kDataLoss));
+  EXPECT_THAT(db2.LoadSection(data1, kAddress + 4, path),
+              absl::StatusIs(absl::StatusCode::kDataLoss));
+  std::remove(path.c_str());
+}
+
+TEST(PacketDbTest, LoadSectionFailsOnCorruptFile) {
+  // 148:       5c ff ff 5b 5bffff5c {  call 0x0 <init> }
+  std::vector<uint8_t> data = {0x5c, 0xff, 0xff, 0x5b};
+  const std::string path = testing::TempDir() + "/corrupt.pktdb";
+  PacketDb db1;
+  EXPECT_THAT(db1.AddSection(data, kAddress, /*num_threads=*/1), IsOk());
+  EXPECT_THAT(db1.SaveSection(data, kAddress, path), IsOk());
+  {
+    std::fstream file(path, std::ios::binary | std::ios::in | std::ios::out);
+    file.seekp(-1, std::ios::end);
+    file.put('\x5a');
+  }
+
+  PacketDb db2;
+  EXPECT_THAT(db2.LoadSection(data, kAddress, path),
+              absl::StatusIs(absl::StatusCode::kDataLoss));
+  EXPECT_THAT(db2.Lookup(kAddress),
+              absl::StatusIs(absl::StatusCode::kNotFound));
+  std::remove(path.c_str());
+}
+
+TEST(PacketDbTest, StoresPacketPreparedForLifting) {
+  PacketDb db;
+  // 13c:       c0 76 ea 0d 0dea76c0 {  immext(#3735924736)
+  // 140:       11 28 b3 28 28b32811    r3 = ##3735924747;      r1 = #1 }
+  std::vector<uint8_t> data = {0xc0, 0x76, 0xea, 0x0d, 0x11, 0x28, 0xb3, 0x28};
+  EXPECT_THAT(db.AddBytes(data, kAddress), IsOk());
+  ASSERT_OK_AND_ASSIGN(PacketDb::InsnInfo i0, db.Lookup(kAddress));
+  EXPECT_THAT(i0.pkt.num_insns, 3);
+  EXPECT_THAT(i0.prepared_pkt.num_insns, 2);
+  EXPECT_THAT(i0.prepared_pkt, Eq(PreparePacketForLifting(i0.pkt)));
+}
+
 } // namespace
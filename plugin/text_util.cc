@@ -17,270 +17,170 @@
  */
 #include "plugin/text_util.h"
 
+#include <cstring>
+
 #include "absl/strings/str_cat.h"
 #include "glog/logging.h"
 #include "plugin/hex_regs.h"
+#include "plugin/hex_regs_info.h"
 
 namespace {
 
-std::string GeneralRegisterName(uint32_t reg) {
-  switch (reg) {
-  case HEX_REG_R00 ... HEX_REG_R28:
-    return absl::StrCat("R", reg - HEX_REG_R00);
-  case HEX_REG_SP: // R29
-    return "SP";
-  case HEX_REG_FP: // R30
-    return "FP";
-  case HEX_REG_LR: // R31
-    return "LR";
-  default:
-    LOG(FATAL) << "Unexpected general register reg " << reg;
+// Returns the name of register |regno| of |reg_type|, or an empty string for
+// register types without named registers.
+absl::string_view NamedRegister(absl::string_view reg_type, int regno) {
+  absl::string_view name;
+  if (reg_type == "R" || reg_type == "N") {
+    CHECK(regno >= 0 && regno < 32) << "Unexpected general register " << regno;
+    name = kHexRegs[HEX_REG_R00 + regno].name;
+  } else if (reg_type == "C") {
+    CHECK(regno >= 0 && regno < 32) << "Unexpected control register " << regno;
+    name = kHexRegs[HEX_REG_C00 + regno].name;
+  } else if (reg_type == "P") {
+    CHECK(regno >= 0 && regno < 4) << "Unexpected predicate register " << regno;
+    name = kHexRegs[HEX_REG_P0 + regno].name;
+  } else if (reg_type == "S") {
+    CHECK(regno >= 0 && regno < kHexSystemRegNames.size())
+        << "Unexpected system register " << regno;
+    name = kHexSystemRegNames[regno];
+    CHECK(!name.empty()) << "Unexpected system register " << regno;
   }
-  return "";
+  return name;
 }
 
-std::string ControlRegisterName(uint32_t reg) {
-  switch (reg) {
-  case HEX_REG_SA0: // C00
-    return "SA0";
-  case HEX_REG_LC0: // C01
-    return "LC0";
-  case HEX_REG_SA1: // C02
-    return "SA1";
-  case HEX_REG_LC1: // C03
-    return "LC1";
-  case HEX_REG_P3_0: // C04
-    return "P3:0";
-  case HEX_REG_C05:
-    return "C5";
-  case HEX_REG_M0: // C06
-    return "M0";
-  case HEX_REG_M1: // C07
-    return "M1";
-  case HEX_REG_USR: // C08
-    return "USR";
-  case HEX_REG_PC: // C09
-    return "PC";
-  case HEX_REG_UGP: // C10
-    return "UGP";
-  case HEX_REG_GP: // C11
-    return "GP";
-  case HEX_REG_CS0: // C12
-    return "CS0";
-  case HEX_REG_CS1: // C13
-    return "CS1";
-  case HEX_REG_C14 ... HEX_REG_C31:
-    return absl::StrCat("C", reg - HEX_REG_C00);
-  default:
-    LOG(FATAL) << "Unexpected control register reg " << reg;
+} // namespace
+
+std::string GetRegisterName(absl::string_view reg_type,
+                            absl::string_view hi_low_modifier, int regno) {
+  absl::string_view name = NamedRegister(reg_type, regno);
+  std::string out =
+      name.empty() ? absl::StrCat(reg_type, regno) : std::string(name);
+  if (!hi_low_modifier.empty()) {
+    absl::StrAppend(&out, ".", hi_low_modifier);
   }
-  return "";
+  return out;
 }
 
-std::string PredicateRegisterName(uint32_t reg) {
-  switch (reg) {
-  case HEX_REG_P0:
-    return "P0";
-  case HEX_REG_P1:
-    return "P1";
-  case HEX_REG_P2:
-    return "P2";
-  case HEX_REG_P3:
-    return "P3";
-  default:
-    LOG(FATAL) << "Unexpected predicate register reg " << reg;
+absl::string_view InsnTextToken::text() const {
+  if (is_inline_) {
+    return absl::string_view(text_, size_);
   }
-  return "";
+  const char *static_text;
+  memcpy(&static_text, text_, sizeof(static_text));
+  return absl::string_view(static_text, size_);
 }
 
-std::string SystemRegisterName(uint32_t reg) {
-  switch (reg) {
-  case HEX_SREG_SGP0:
-    return "SGP0";
-  case HEX_SREG_SGP1:
-    return "SGP1";
-  case HEX_SREG_STID:
-    return "STID";
-  case HEX_SREG_ELR:
-    return "ELR";
-  case HEX_SREG_BADVA0:
-    return "BADVA0";
-  case HEX_SREG_BADVA1:
-    return "BADVA1";
-  case HEX_SREG_SSR:
-    return "SSR";
-  case HEX_SREG_CCR:
-    return "CCR";
-  case HEX_SREG_HTID:
-    return "HTID";
-  case HEX_SREG_BADVA:
-    return "BADVA";
-  case HEX_SREG_IMASK:
-    return "IMASK";
-  case HEX_SREG_GEVB:
-    return "GEVB";
-  case HEX_SREG_EVB:
-    return "EVB";
-  case HEX_SREG_MODECTL:
-    return "MODECTL";
-  case HEX_SREG_SYSCFG:
-    return "SYSCFG";
-  case HEX_SREG_IPENDAD:
-    return "IPENDAD";
-  case HEX_SREG_VID:
-    return "VID";
-  case HEX_SREG_VID1:
-    return "VID1";
-  case HEX_SREG_BESTWAIT:
-    return "BESTWAIT";
-  case HEX_SREG_IEL:
-    return "IEL";
-  case HEX_SREG_SCHEDCFG:
-    return "SCHEDCFG";
-  case HEX_SREG_IAHL:
-    return "IAHL";
-  case HEX_SREG_CFGBASE:
-    return "CFGBASE";
-  case HEX_SREG_DIAG:
-    return "DIAG";
-  case HEX_SREG_REV:
-    return "REV";
-  case HEX_SREG_PCYCLELO:
-    return "PCYCLELO";
-  case HEX_SREG_PCYCLEHI:
-    return "PCYCLEHI";
-  case HEX_SREG_ISDBST:
-    return "ISDBST";
-  case HEX_SREG_ISDBCFG0:
-    return "ISDBCFG0";
-  case HEX_SREG_ISDBCFG1:
-    return "ISDBCFG1";
-  case HEX_SREG_LIVELOCK:
-    return "LIVELOCK";
-  case HEX_SREG_BRKPTPC0:
-    return "BRKPTPC0";
-  case HEX_SREG_BRKPTCFG0:
-    return "BRKPTCFG0";
-  case HEX_SREG_BRKPTPC1:
-    return "BRKPTPC1";
-  case HEX_SREG_BRKPTCFG1:
-    return "BRKPTCFG1";
-  case HEX_SREG_ISDBMBXIN:
-    return "ISDBMBXIN";
-  case HEX_SREG_ISDBMBXOUT:
-    return "ISDBMBXOUT";
-  case HEX_SREG_ISDBEN:
-    return "ISDBEN";
-  case HEX_SREG_ISDBGPR:
-    return "ISDBGPR";
-  case HEX_SREG_PMUCNT4:
-    return "PMUCNT4";
-  case HEX_SREG_PMUCNT5:
-    return "PMUCNT5";
-  case HEX_SREG_PMUCNT6:
-    return "PMUCNT6";
-  case HEX_SREG_PMUCNT7:
-    return "PMUCNT7";
-  case HEX_SREG_PMUCNT0:
-    return "PMUCNT0";
-  case HEX_SREG_PMUCNT1:
-    return "PMUCNT1";
-  case HEX_SREG_PMUCNT2:
-    return "PMUCNT2";
-  case HEX_SREG_PMUCNT3:
-    return "PMUCNT3";
-  case HEX_SREG_PMUEVTCFG:
-    return "PMUEVTCFG";
-  case HEX_SREG_PMUSTID0:
-    return "PMUSTID0";
-  case HEX_SREG_PMUEVTCFG1:
-    return "PMUEVTCFG1";
-  case HEX_SREG_PMUSTID1:
-    return "PMUSTID1";
-  case HEX_SREG_TIMERLO:
-    return "TIMERLO";
-  case HEX_SREG_TIMERHI:
-    return "TIMERHI";
-  case HEX_SREG_PMUCFG:
-    return "PMUCFG";
-  case HEX_SREG_S59:
-    return "S59";
-  case HEX_SREG_S60:
-    return "S60";
-  case HEX_SREG_S61:
-    return "S61";
-  case HEX_SREG_S62:
-    return "S62";
-  case HEX_SREG_S63:
-    return "S63";
-  case HEX_SREG_COMMIT1T:
-    return "COMMIT1T";
-  case HEX_SREG_COMMIT2T:
-    return "COMMIT2T";
-  case HEX_SREG_COMMIT3T:
-    return "COMMIT3T";
-  case HEX_SREG_COMMIT4T:
-    return "COMMIT4T";
-  case HEX_SREG_COMMIT5T:
-    return "COMMIT5T";
-  case HEX_SREG_COMMIT6T:
-    return "COMMIT6T";
-  case HEX_SREG_PCYCLE1T:
-    return "PCYCLE1T";
-  case HEX_SREG_PCYCLE2T:
-    return "PCYCLE2T";
-  case HEX_SREG_PCYCLE3T:
-    return "PCYCLE3T";
-  case HEX_SREG_PCYCLE4T:
-    return "PCYCLE4T";
-  case HEX_SREG_PCYCLE5T:
-    return "PCYCLE5T";
-  case HEX_SREG_PCYCLE6T:
-    return "PCYCLE6T";
-  case HEX_SREG_STFINST:
-    return "STFINST";
-  case HEX_SREG_ISDBCMD:
-    return "ISDBCMD";
-  case HEX_SREG_ISDBVER:
-    return "ISDBVER";
-  case HEX_SREG_BRKPTINFO:
-    return "BRKPTINFO";
-  case HEX_SREG_RGDR3:
-    return "RGDR3";
-  case HEX_SREG_COMMIT7T:
-    return "COMMIT7T";
-  case HEX_SREG_COMMIT8T:
-    return "COMMIT8T";
-  case HEX_SREG_PCYCLE7T:
-    return "PCYCLE7T";
-  case HEX_SREG_PCYCLE8T:
-    return "PCYCLE8T";
-  case HEX_SREG_S85:
-    return "S85";
-  default:
-    LOG(FATAL) << "Unexpected system register reg " << reg;
-  }
-  return "";
+void InsnTextTokens::AddStatic(InsnTextTokenType type, absl::string_view text,
+                               uint64_t value) {
+  static_assert(sizeof(InsnTextToken::text_) >= sizeof(const char *));
+  CHECK_LE(text.size(), UINT8_MAX);
+  InsnTextToken &token = tokens_.emplace_back();
+  token.value_ = value;
+  token.type_ = type;
+  token.size_ = text.size();
+  token.is_inline_ = false;
+  const char *static_text = text.data();
+  memcpy(token.text_, &static_text, sizeof(static_text));
 }
 
-} // namespace
+void InsnTextTokens::AddCopy(InsnTextTokenType type, absl::string_view text,
+                             uint64_t value) {
+  CHECK_LE(text.size(), InsnTextToken::kMaxInlineSize);
+  InsnTextToken &token = tokens_.emplace_back();
+  token.value_ = value;
+  token.type_ = type;
+  token.size_ = text.size();
+  token.is_inline_ = true;
+  memcpy(token.text_, text.data(), text.size());
+}
 
-std::string GetRegisterName(absl::string_view reg_type,
-                            absl::string_view hi_low_modifier, int regno) {
-  std::string out;
-  if (reg_type == "R" || reg_type == "N") {
-    out = GeneralRegisterName(HEX_REG_R00 + regno);
-  } else if (reg_type == "C") {
-    out = ControlRegisterName(HEX_REG_C00 + regno);
-  } else if (reg_type == "P") {
-    out = PredicateRegisterName(HEX_REG_P0 + regno);
-  } else if (reg_type == "S") {
-    out = SystemRegisterName(HEX_SREG_SGP0 + regno);
+void InsnTextTokens::AddRegister(absl::string_view reg_type,
+                                 absl::string_view hi_low_modifier,
+                                 int regno) {
+  absl::string_view name = NamedRegister(reg_type, regno);
+  if (!name.empty() && hi_low_modifier.empty()) {
+    // Points into kHexRegs or kHexSystemRegNames.
+    AddStatic(InsnTextTokenType::kRegister, name);
+    return;
+  }
+  char buf[InsnTextToken::kMaxInlineSize];
+  size_t size = 0;
+  auto append = [&](absl::string_view piece) {
+    CHECK_LE(size + piece.size(), sizeof(buf));
+    memcpy(buf + size, piece.data(), piece.size());
+    size += piece.size();
+  };
+  if (name.empty()) {
+    append(reg_type);
+    append(absl::AlphaNum(regno).Piece());
   } else {
-    out = absl::StrCat(reg_type, regno);
+    append(name);
   }
   if (!hi_low_modifier.empty()) {
-    absl::StrAppend(&out, ".", hi_low_modifier);
+    append(".");
+    append(hi_low_modifier);
+  }
+  AddCopy(InsnTextTokenType::kRegister, absl::string_view(buf, size));
+}
+
+void InsnTextTokens::AddHex64(InsnTextTokenType type, uint64_t x,
+                              uint64_t value) {
+  char buf[InsnTextToken::kMaxInlineSize];
+  char *end = buf + sizeof(buf);
+  char *p = end;
+  do {
+    *--p = "0123456789abcdef"[x & 0xf];
+    x >>= 4;
+  } while (x != 0);
+  *--p = 'x';
+  *--p = '0';
+  AddCopy(type, absl::string_view(p, end - p), value);
+}
+
+std::string InsnTextTokens::ToString() const {
+  std::string out;
+  for (const auto &token : tokens_) {
+    absl::StrAppend(&out, token.text());
   }
   return out;
 }
+
+void RenderInsnText(const InsnTextOp *ops, const absl::string_view *literals,
+                    uint64_t pc, const Insn &insn, InsnTextTokens &result) {
+  for (const InsnTextOp *op = ops; op->kind != InsnTextOpKind::kEnd; op++) {
+    switch (op->kind) {
+    case InsnTextOpKind::kEnd:
+      break;
+    case InsnTextOpKind::kLiteral:
+      result.AddStatic(op->type, literals[op->arg]);
+      break;
+    case InsnTextOpKind::kExtLiteral:
+      result.AddStatic(op->type, literals[insn.extension_valid ? op->arg
+                                                               : op->arg2]);
+      break;
+    case InsnTextOpKind::kGpRegister:
+      if (insn.extension_valid) {
+        result.AddStatic(InsnTextTokenType::kInteger, "0", 0);
+      } else {
+        result.AddStatic(InsnTextTokenType::kRegister, literals[op->arg]);
+      }
+      break;
+    case InsnTextOpKind::kRegister:
+      result.AddRegister(absl::string_view(&op->reg_type, 1),
+                         absl::string_view(&op->modifier, op->modifier != 0),
+                         insn.regno[op->arg] + op->arg2);
+      break;
+    case InsnTextOpKind::kImmediate:
+      result.AddHex(op->type, insn.immed[op->arg], insn.immed[op->arg]);
+      break;
+    case InsnTextOpKind::kPcRelative:
+      result.AddHex(op->type, pc + insn.immed[op->arg],
+                    pc + insn.immed[op->arg]);
+      break;
+    case InsnTextOpKind::kConstant:
+      // Printed as 32-bit, like the immediates.
+      result.AddHex(op->type, int32_t{op->arg}, int32_t{op->arg});
+      break;
+    }
+  }
+}
@@ -18,7 +18,13 @@
 
 #pragma once
 
+#include <cstdint>
+#include <string>
+#include <type_traits>
+
+#include "absl/container/inlined_vector.h"
 #include "absl/strings/string_view.h"
+#include "third_party/qemu-hexagon/insn.h"
 
 // Instruction text tokenizer helper.
 // Returns register name for disassembly listing.
@@ -28,3 +34,112 @@
 //  ('Rd.L', 4) -> "R04.L"
 std::string GetRegisterName(absl::string_view reg_type,
                             absl::string_view hi_low_modifier, int regno);
+
+enum class InsnTextTokenType : uint8_t {
+  kText,
+  kInstruction,
+  kRegister,
+  kInteger,
+  kCodeRelativeAddress,
+};
+
+// Instruction text token that owns no heap memory. Its text either points to
+// a string with static storage duration, or is stored inline.
+class InsnTextToken {
+public:
+  // Max. length of inline text. Fits "0x" and 16 hex digits.
+  static constexpr size_t kMaxInlineSize = 21;
+
+  InsnTextTokenType type() const { return type_; }
+  absl::string_view text() const;
+  uint64_t value() const { return value_; }
+
+private:
+  friend class InsnTextTokens;
+
+  uint64_t value_;
+  InsnTextTokenType type_;
+  uint8_t size_;
+  bool is_inline_;
+  // Inline text, or the pointer to static text.
+  char text_[kMaxInlineSize];
+};
+
+// Instruction text tokens of a disassembly line. Lines of up to
+// |kInlineTokens| tokens don't allocate.
+class InsnTextTokens {
+public:
+  static constexpr size_t kInlineTokens = 48;
+
+  // Adds a token for |text|, which must have static storage duration.
+  void AddStatic(InsnTextTokenType type, absl::string_view text,
+                 uint64_t value = 0);
+
+  // Adds a token with a copy of |text|, of up to
+  // InsnTextToken::kMaxInlineSize chars.
+  void AddCopy(InsnTextTokenType type, absl::string_view text,
+               uint64_t value = 0);
+
+  // Adds a register token, see GetRegisterName().
+  void AddRegister(absl::string_view reg_type,
+                   absl::string_view hi_low_modifier, int regno);
+
+  // Adds a token for |x| in hex with a "0x" prefix. Signed values are printed
+  // as their unsigned counterpart, like absl::Hex does.
+  template <typename Int>
+  void AddHex(InsnTextTokenType type, Int x, uint64_t value) {
+    AddHex64(type, static_cast<std::make_unsigned_t<Int>>(x), value);
+  }
+
+  size_t size() const { return tokens_.size(); }
+  bool empty() const { return tokens_.empty(); }
+  const InsnTextToken &operator[](size_t i) const { return tokens_[i]; }
+  auto begin() const { return tokens_.begin(); }
+  auto end() const { return tokens_.end(); }
+  void clear() { tokens_.clear(); }
+
+  // Returns the concatenated text of all tokens.
+  std::string ToString() const;
+
+private:
+  void AddHex64(InsnTextTokenType type, uint64_t x, uint64_t value);
+
+  absl::InlinedVector<InsnTextToken, kInlineTokens> tokens_;
+};
+
+// Instruction text template operations, as generated by
+// gen_insn_text_funcs.py. A template is a sequence of ops terminated by
+// kEnd, and refers to text literals by their index in a literal table.
+enum class InsnTextOpKind : uint8_t {
+  kEnd,
+  // Literal |arg| of token |type|.
+  kLiteral,
+  // Literal |arg| if the instruction is extended, literal |arg2| otherwise.
+  kExtLiteral,
+  // Integer "0" if the instruction is extended, register literal |arg|
+  // otherwise. See fREAD_GP().
+  kGpRegister,
+  // Register |reg_type| of operand |arg| plus |arg2|, with optional .L/.H
+  // |modifier|. See GetRegisterName().
+  kRegister,
+  // Immediate |arg|.
+  kImmediate,
+  // pc plus immediate |arg|.
+  kPcRelative,
+  // Constant |arg|.
+  kConstant,
+};
+
+struct InsnTextOp {
+  InsnTextOpKind kind;
+  InsnTextTokenType type;
+  char reg_type;
+  char modifier;
+  int16_t arg;
+  int16_t arg2;
+};
+
+// Appends the tokens of template |ops| for |insn| at |pc|, looking up
+// literals in |literals|.
+void RenderInsnText(const InsnTextOp *ops, const absl::string_view *literals,
+                    uint64_t pc, const Insn &insn, InsnTextTokens &result);
@@ -0,0 +1,149 @@
+// Copyright (C) 2020 Google LLC
+//
+// This program is free software; you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation; either version 2 of the License, or
+// (at your option) any later version.
+//
+// This program is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License along
+// with this program; if not, write to the Free Software Foundation, Inc.,
+// 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#include "plugin/text_util.h"
+
+#include <string>
+
+#include "gmock/gmock.h"
+#include "gtest/gtest.h"
+#include "plugin/hex_regs.h"
+
+namespace {
+
+TEST(TextUtilTest, GetRegisterName) {
+  EXPECT_EQ(GetRegisterName("R", "", 10), "R10");
+  EXPECT_EQ(GetRegisterName("R", "", 29), "SP");
+  EXPECT_EQ(GetRegisterName("R", "L", 4), "R4.L");
+  EXPECT_EQ(GetRegisterName("C", "", 4), "P3:0");
+  EXPECT_EQ(GetRegisterName("P", "", 3), "P3");
+  EXPECT_EQ(GetRegisterName("S", "", 85), "S85");
+  EXPECT_EQ(GetRegisterName("V", "", 31), "V31");
+}
+
+TEST(TextUtilTest, InsnTextTokensRegister) {
+  InsnTextTokens tokens;
+  tokens.AddRegister("R", "", 30);
+  tokens.AddRegister("R", "H", 30);
+  tokens.AddRegister("S", "", HEX_SREG_BRKPTCFG1);
+  tokens.AddRegister("Q", "", 2);
+  ASSERT_EQ(tokens.size(), 4);
+  EXPECT_EQ(tokens[0].type(), InsnTextTokenType::kRegister);
+  EXPECT_EQ(tokens[0].text(), "FP");
+  EXPECT_EQ(tokens[1].text(), "FP.H");
+  EXPECT_EQ(tokens[2].text(), "BRKPTCFG1");
+  EXPECT_EQ(tokens[3].text(), "Q2");
+}
+
+TEST(TextUtilTest, InsnTextTokensHex) {
+  InsnTextTokens tokens;
+  tokens.AddHex(InsnTextTokenType::kInteger, int32_t{-4}, int32_t{-4});
+  tokens.AddHex(InsnTextTokenType::kCodeRelativeAddress,
+                uint64_t{0xfedcba9876543210}, 0);
+  tokens.AddHex(InsnTextTokenType::kInteger, 0, 0);
+  ASSERT_EQ(tokens.size(), 3);
+  EXPECT_EQ(tokens[0].type(), InsnTextTokenType::kInteger);
+  EXPECT_EQ(tokens[0].text(), "0xfffffffc");
+  EXPECT_EQ(tokens[0].value(), static_cast<uint64_t>(-4));
+  EXPECT_EQ(tokens[1].type(), InsnTextTokenType::kCodeRelativeAddress);
+  EXPECT_EQ(tokens[1].text(), "0xfedcba9876543210");
+  EXPECT_EQ(tokens[2].text(), "0x0");
+}
+
+TEST(TextUtilTest, InsnTextTokensText) {
+  InsnTextTokens tokens;
+  static const char kText[] = "memw";
+  tokens.AddStatic(InsnTextTokenType::kInstruction, kText);
+  {
+    std::string copied = "(";
+    tokens.AddCopy(InsnTextTokenType::kText, copied);
+  }
+  tokens.AddRegister("R", "", 29);
+  tokens.AddStatic(InsnTextTokenType::kText, ")");
+  ASSERT_EQ(tokens.size(), 4);
+  // Static text is referenced, not copied.
+  EXPECT_EQ(tokens[0].text().data(), kText);
+  EXPECT_EQ(tokens[1].text(), "(");
+  EXPECT_EQ(tokens[2].type(), InsnTextTokenType::kRegister);
+  EXPECT_EQ(tokens[2].text(), "SP");
+  EXPECT_EQ(tokens.ToString(), "memw(SP)");
+  tokens.clear();
+  EXPECT_TRUE(tokens.empty());
+}
+
+TEST(TextUtilTest, RenderInsnText) {
+  // "memw(Rs32+#s11:2)=Rt32"
+  static const absl::string_view kLiterals[] = {"memw", "(", "+", "##", "#",
+                                                ") = "};
+  static const InsnTextOp kOps[] = {
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kInstruction, 0, 0, 0, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 1, 0},
+      {InsnTextOpKind::kRegister, InsnTextTokenType::kRegister, 'R', 0, 0, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 2, 0},
+      {InsnTextOpKind::kExtLiteral, InsnTextTokenType::kText, 0, 0, 3, 4},
+      {InsnTextOpKind::kImmediate, InsnTextTokenType::kInteger, 0, 0, 0, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 5, 0},
+      {InsnTextOpKind::kRegister, InsnTextTokenType::kRegister, 'R', 'H', 1,
+       0},
+      {InsnTextOpKind::kEnd},
+  };
+  Insn insn = {};
+  insn.regno[0] = 29;
+  insn.regno[1] = 3;
+  insn.immed[0] = -8;
+  InsnTextTokens tokens;
+  RenderInsnText(kOps, kLiterals, 0x1000, insn, tokens);
+  EXPECT_EQ(tokens.ToString(), "memw(SP+#0xfffffff8) = R3.H");
+  ASSERT_EQ(tokens.size(), 8);
+  EXPECT_EQ(tokens[5].type(), InsnTextTokenType::kInteger);
+  EXPECT_EQ(tokens[5].value(), static_cast<uint64_t>(-8));
+
+  insn.extension_valid = 1;
+  tokens.clear();
+  RenderInsnText(kOps, kLiterals, 0x1000, insn, tokens);
+  EXPECT_EQ(tokens.ToString(), "memw(SP+##0xfffffff8) = R3.H");
+}
+
+TEST(TextUtilTest, RenderInsnTextAddresses) {
+  // "jump #r22:2", and GP-relative "memw(GP+#u16:2)".
+  static const absl::string_view kLiterals[] = {"jump", " ", "GP", "+#"};
+  static const InsnTextOp kOps[] = {
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kInstruction, 0, 0, 0, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 1, 0},
+      {InsnTextOpKind::kPcRelative, InsnTextTokenType::kCodeRelativeAddress, 0,
+       0, 0, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 1, 0},
+      {InsnTextOpKind::kGpRegister, InsnTextTokenType::kRegister, 0, 0, 2, 0},
+      {InsnTextOpKind::kLiteral, InsnTextTokenType::kText, 0, 0, 3, 0},
+      {InsnTextOpKind::kConstant, InsnTextTokenType::kInteger, 0, 0, -1, 0},
+      {InsnTextOpKind::kEnd},
+  };
+  Insn insn = {};
+  insn.immed[0] = -0x10;
+  InsnTextTokens tokens;
+  RenderInsnText(kOps, kLiterals, 0x1000, insn, tokens);
+  EXPECT_EQ(tokens.ToString(), "jump 0xff0 GP+#0xffffffff");
+  EXPECT_EQ(tokens[2].type(), InsnTextTokenType::kCodeRelativeAddress);
+  EXPECT_EQ(tokens[2].value(), 0xff0);
+
+  insn.extension_valid = 1;
+  tokens.clear();
+  RenderInsnText(kOps, kLiterals, 0x1000, insn, tokens);
+  EXPECT_EQ(tokens.ToString(), "jump 0xff0 0+#0xffffffff");
+  EXPECT_EQ(tokens[4].type(), InsnTextTokenType::kInteger);
+}
+
+} // namespace
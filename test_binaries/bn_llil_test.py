@@ -74,20 +74,17 @@ class TestPluginIl(unittest.TestCase):
 { LR:FP = dealloc_return(FP):raw }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp29.d = SP {arg_0}
-1: temp100.d = temp29.d - 8
-2: [temp100.d {var_8}].q = LR:FP
-3: FP = temp100.d
-4: temp29.d = temp100.d - 8 {var_10}
-5: SP = temp29.d
-6: temp0.d = 0x100
-7: R0 = temp0.d
-8: temp100.d = FP {var_8}
-9: temp101.q = [temp100.d {var_8}].q
-10: temp30.q = temp101.q
-11: SP = temp100.d + 8
-12: LR:FP = temp30.q
-13: <return> jump(LR)''')
+0: temp100.d = SP - 8
+1: [temp100.d {var_8}].q = LR:FP
+2: FP = temp100.d
+3: SP = temp100.d - 8
+4: R0 = 0x100
+5: temp100.d = FP {var_8}
+6: temp101.q = [temp100.d {var_8}].q
+7: temp30.q = temp101.q
+8: SP = temp100.d + 8
+9: LR:FP = temp30.q
+10: <return> jump(LR)''')
 
   # Source pair operations use temporary 64b registers.
   def test_pair_operations(self):
@@ -105,8 +102,8 @@ class TestPluginIl(unittest.TestCase):
 4: temp200.d = LR
 5: <return> jump(LR)''')
 
-  # Tests writes to P0 predicate register go to a temporary register.
-  # Result is written back at the end of the packet.
+  # Tests writes to P0 predicate register that no other instruction in the
+  # packet reads are written directly, without a temporary register.
   def test_cmp_to_predicate(self):
     func = self.get_function('test_cmp_to_predicate')
     self.assertEqual(
@@ -115,10 +112,9 @@ class TestPluginIl(unittest.TestCase):
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp90.b = R0 == 1
-1: P0 = temp90.b
-2: temp200.d = LR
-3: <return> jump(LR)''')
+0: P0 = R0 == 1
+1: temp200.d = LR
+2: <return> jump(LR)''')
 
   def test_memory_load(self):
     func = self.get_function('test_memory_load')
@@ -130,13 +126,11 @@ R1 = ##0x30400 }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp1.d = 0x30400
-1: R1 = temp1.d
-2: temp100.d = R1 + 1
-3: temp2.d = sx.d([temp100.d {0x30401}].b)
-4: R2 = temp2.d
-5: temp200.d = LR
-6: <return> jump(LR)''')
+0: R1 = 0x30400
+1: temp100.d = R1 + 1
+2: R2 = sx.d([temp100.d {0x30401}].b)
+3: temp200.d = LR
+4: <return> jump(LR)''')
 
   def test_memory_store(self):
     func = self.get_function('test_memory_store')
@@ -179,13 +173,12 @@ memw(R5+#0x0) = R3.new }
     self.assertEqual(
         self.list_llil(func), '''
 0: if (P0) then 1 else 3
-1: temp0.d = 1
+1: R0 = 1
 2: goto 5
-3: temp0.d = 0
+3: R0 = 0
 4: goto 5
-5: R0 = temp0.d
-6: temp200.d = LR
-7: <return> jump(LR)''')
+5: temp200.d = LR
+6: <return> jump(LR)''')
 
   def test_tstbit(self):
     func = self.get_function('test_tstbit')
@@ -195,10 +188,9 @@ memw(R5+#0x0) = R3.new }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp90.b = (R0 & 1 << 0) != 0
-1: P0 = temp90.b
-2: temp200.d = LR
-3: <return> jump(LR)''')
+0: P0 = (R0 & 1 << 0) != 0
+1: temp200.d = LR
+2: <return> jump(LR)''')
 
   def test_dualjump_direct_jump(self):
     func = self.get_function('test_dualjump_direct_jump')
@@ -212,9 +204,8 @@ jump 0x20174 }
 0: temp1.d = R1 + R1
 1: R1 = temp1.d
 2: jump(0x20174 => 3 @ 0x20174)
-3: temp0.d = 1
-4: R0 = temp0.d
-5: <return> jump(LR)''')
+3: R0 = 1
+4: <return> jump(LR)''')
 
   def test_dualjump_cond_jump(self):
     func = self.get_function('test_dualjump_cond_jump')
@@ -226,21 +217,15 @@ if (P0) jump:t 0x20184 }
 { R0 = #0x0; jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp211.b = 0
-1: temp1.d = R1 + R1
-2: if (P0) then 3 else 5
-3: temp211.b = 1
-4: goto 5
-5: R1 = temp1.d
-6: if (temp211.b == 1) then 7 else 8
-7: jump(0x20184 => 9 @ 0x20184)
-8: goto 12 @ 0x20180
-9: temp0.d = 1
-10: R0 = temp0.d
-11: <return> jump(LR)
-12: temp0.d = 0
-13: R0 = temp0.d
-14: <return> jump(LR)''')
+0: temp1.d = R1 + R1
+1: R1 = temp1.d
+2: if (P0 & 1) then 3 else 4
+3: jump(0x20184 => 5 @ 0x20184)
+4: goto 7 @ 0x20180
+5: R0 = 1
+6: <return> jump(LR)
+7: R0 = 0
+8: <return> jump(LR)''')
 
   def test_dualjump_cond_jump_with_direct_jump(self):
     func = self.get_function('test_dualjump_cond_jump_with_direct_jump')
@@ -260,14 +245,12 @@ R1 = add(R1,R1) }
 4: temp1.d = R1 + R1
 5: R1 = temp1.d
 6: if (temp210.b == 1) then 7 else 8
-7: jump(0x20194 => 9 @ 0x20194, 12 @ 0x20198)
+7: jump(0x20194 => 9 @ 0x20194, 11 @ 0x20198)
 8: jump(0x20198)
-9: temp0.d = 1
-10: R0 = temp0.d
-11: <return> jump(LR)
-12: temp0.d = 2
-13: R0 = temp0.d
-14: <return> jump(LR)''')
+9: R0 = 1
+10: <return> jump(LR)
+11: R0 = 2
+12: <return> jump(LR)''')
 
   def test_dualjump_two_cond_jumps(self):
     func = self.get_function('test_dualjump_two_cond_jumps')
@@ -292,19 +275,16 @@ R1 = add(R1,R1) }
 8: temp1.d = R1 + R1
 9: R1 = temp1.d
 10: if (temp210.b == 1) then 11 else 12
-11: jump(0x201ac => 13 @ 0x201ac, 16 @ 0x201b0)
-12: if (temp211.b == 1) then 19 else 20
-13: temp0.d = 1
-14: R0 = temp0.d
-15: <return> jump(LR)
-16: temp1.d = 2
-17: R1 = temp1.d
-18: <return> jump(LR)
-19: jump(0x201b0)
-20: goto 21 @ 0x201a8
-21: temp0.d = 0
-22: R0 = temp0.d
-23: <return> jump(LR)''')
+11: jump(0x201ac => 13 @ 0x201ac, 15 @ 0x201b0)
+12: if (temp211.b == 1) then 17 else 18
+13: R0 = 1
+14: <return> jump(LR)
+15: R1 = 2
+16: <return> jump(LR)
+17: jump(0x201b0)
+18: goto 19 @ 0x201a8
+19: R0 = 0
+20: <return> jump(LR)''')
 
   def test_dualjump_direct_call(self):
     func = self.get_function('test_dualjump_direct_call')
@@ -349,18 +329,13 @@ R1 = add(R1,R1) }
 { R0 = #0x0; jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp210.b = 0
-1: if (P0) then 2 else 4
-2: temp210.b = 1
-3: goto 4
-4: temp1.d = R1 + R1
-5: R1 = temp1.d
-6: if (temp210.b == 1) then 7 else 9 @ 0x201e4
-7: call(0x201e8)
-8: goto 9 @ 0x201e4
-9: temp0.d = 0
-10: R0 = temp0.d
-11: <return> jump(LR)''')
+0: temp1.d = R1 + R1
+1: R1 = temp1.d
+2: if (P0 & 1) then 3 else 5 @ 0x201e4
+3: call(0x201e8)
+4: goto 5 @ 0x201e4
+5: R0 = 0
+6: <return> jump(LR)''')
 
   def test_dualjump_cond_call_with_direct_jump(self):
     func = self.get_function('test_dualjump_cond_call_with_direct_jump')
@@ -383,9 +358,8 @@ R1 = add(R1,R1) }
 8: goto 10
 9: jump(0x201fc => 11 @ 0x201fc)
 10: <return> tailcall(0x201f8)
-11: temp0.d = 2
-12: R0 = temp0.d
-13: <return> jump(LR)''')
+11: R0 = 2
+12: <return> jump(LR)''')
 
   def test_dualjump_cmp_jump(self):
     func = self.get_function('test_dualjump_cmp_jump')
@@ -397,24 +371,18 @@ P0 = cmp.eq(R3,#0x2);if (P0.new) jump:t 0x2020c }
 { R0 = #0x0; jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp212.b = 0
-1: temp90.b = P0
-2: temp90.b = R3 == 2
-3: temp1.d = R1 + R1
-4: if (temp90.b & 1) then 5 else 7
-5: temp212.b = 1
-6: goto 7
-7: R1 = temp1.d
-8: P0 = temp90.b
-9: if (temp212.b == 1) then 10 else 11
-10: jump(0x2020c => 12 @ 0x2020c)
-11: goto 15 @ 0x20208
-12: temp0.d = 1
-13: R0 = temp0.d
-14: <return> jump(LR)
-15: temp0.d = 0
-16: R0 = temp0.d
-17: <return> jump(LR)''')
+0: temp90.b = P0
+1: temp90.b = R3 == 2
+2: temp1.d = R1 + R1
+3: R1 = temp1.d
+4: P0 = temp90.b
+5: if (P0 & 1) then 6 else 7
+6: jump(0x2020c => 8 @ 0x2020c)
+7: goto 10 @ 0x20208
+8: R0 = 1
+9: <return> jump(LR)
+10: R0 = 0
+11: <return> jump(LR)''')
 
   def test_dualjump_cmp_jump_with_direct_jump(self):
     func = self.get_function('test_dualjump_cmp_jump_with_direct_jump')
@@ -437,14 +405,12 @@ R1 = add(R1,R1) }
 7: R1 = temp1.d
 8: P0 = temp90.b
 9: if (temp211.b == 1) then 10 else 11
-10: jump(0x2021c => 12 @ 0x2021c, 15 @ 0x20220)
+10: jump(0x2021c => 12 @ 0x2021c, 14 @ 0x20220)
 11: jump(0x20220)
-12: temp0.d = 1
-13: R0 = temp0.d
-14: <return> jump(LR)
-15: temp0.d = 2
-16: R0 = temp0.d
-17: <return> jump(LR)''')
+12: R0 = 1
+13: <return> jump(LR)
+14: R0 = 2
+15: <return> jump(LR)''')
 
   def test_dualjump_two_cmp_jumps(self):
     func = self.get_function('test_dualjump_two_cmp_jumps')
@@ -475,19 +441,16 @@ R1 = add(R1,R1) }
 14: P0 = temp90.b
 15: P1 = temp91.b
 16: if (temp212.b == 1) then 17 else 18
-17: jump(0x20234 => 19 @ 0x20234, 22 @ 0x20238)
-18: if (temp213.b == 1) then 25 else 26
-19: temp0.d = 1
-20: R0 = temp0.d
-21: <return> jump(LR)
-22: temp0.d = 2
-23: R0 = temp0.d
-24: <return> jump(LR)
-25: jump(0x20238)
-26: goto 27 @ 0x20230
-27: temp0.d = 0
-28: R0 = temp0.d
-29: <return> jump(LR)''')
+17: jump(0x20234 => 19 @ 0x20234, 21 @ 0x20238)
+18: if (temp213.b == 1) then 23 else 24
+19: R0 = 1
+20: <return> jump(LR)
+21: R0 = 2
+22: <return> jump(LR)
+23: jump(0x20238)
+24: goto 25 @ 0x20230
+25: R0 = 0
+26: <return> jump(LR)''')
 
   def test_dualjump_newval_cmp_jump(self):
     func = self.get_function('test_dualjump_newval_cmp_jump')
@@ -507,13 +470,11 @@ if (cmp.eq(R1.new,R2)) jump:t 0x20248 }
 5: R1 = temp1.d
 6: if (temp211.b == 1) then 7 else 8
 7: jump(0x20248 => 9 @ 0x20248)
-8: goto 12 @ 0x20244
-9: temp0.d = 1
-10: R0 = temp0.d
-11: <return> jump(LR)
-12: temp0.d = 0
-13: R0 = temp0.d
-14: <return> jump(LR)''')
+8: goto 11 @ 0x20244
+9: R0 = 1
+10: <return> jump(LR)
+11: R0 = 0
+12: <return> jump(LR)''')
 
   def test_dualjump_indirect_jump(self):
     func = self.get_function('test_dualjump_indirect_jump')
@@ -557,9 +518,8 @@ if (P0) jumpr:nt R0 }
 6: R1 = temp1.d
 7: if (temp211.b == 1) then 8 else 9 @ 0x20264
 8: jump(temp201.d)
-9: temp0.d = 0
-10: R0 = temp0.d
-11: <return> jump(LR)''')
+9: R0 = 0
+10: <return> jump(LR)''')
 
   def test_dualjump_indirect_call(self):
     func = self.get_function('test_dualjump_indirect_call')
@@ -594,9 +554,8 @@ if (P0) callr R0 }
 7: if (temp211.b == 1) then 8 else 10 @ 0x20278
 8: call(temp201.d)
 9: goto 10 @ 0x20278
-10: temp0.d = 0
-11: R0 = temp0.d
-12: <return> jump(LR)''')
+10: R0 = 0
+11: <return> jump(LR)''')
 
   def test_dualjump_cond_return(self):
     func = self.get_function('test_dualjump_cond_return')
@@ -623,9 +582,8 @@ if (P0) callr R0 }
 14: R1 = temp1.d
 15: if (temp211.b == 1) then 16 else 17 @ 0x20280
 16: <return> jump(LR)
-17: temp0.d = 0
-18: R0 = temp0.d
-19: <return> jump(LR)''')
+17: R0 = 0
+18: <return> jump(LR)''')
 
   def test_control_regs(self):
     func = self.get_function('test_control_regs')
@@ -636,12 +594,10 @@ if (P0) callr R0 }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp90.b = R0 == 1
-1: P0 = temp90.b
-2: temp1.d = P3:0
-3: R1 = temp1.d
-4: temp200.d = LR
-5: <return> jump(LR)''')
+0: P0 = R0 == 1
+1: R1 = P3:0
+2: temp200.d = LR
+3: <return> jump(LR)''')
 
   def test_halfwords(self):
     func = self.get_function('test_halfwords')
@@ -652,14 +608,10 @@ R1.L = #0x22 }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp0.d = R0
-1: temp0.d = (temp0.d & not.d(0xffff << 0x10)) | (0xc & 0xffff) << 0x10
-2: temp1.d = R1
-3: temp1.d = (temp1.d & not.d(0xffff << 0)) | (0x22 & 0xffff) << 0
-4: R1 = temp1.d
-5: R0 = temp0.d
-6: temp200.d = LR
-7: <return> jump(LR)''')
+0: R0 = (R0 & not.d(0xffff << 0x10)) | (0xc & 0xffff) << 0x10
+1: R1 = (R1 & not.d(0xffff << 0)) | (0x22 & 0xffff) << 0
+2: temp200.d = LR
+3: <return> jump(LR)''')
 
   def test_insert(self):
     func = self.get_function('test_insert')
@@ -669,14 +621,12 @@ R1.L = #0x22 }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp1.d = R1
-1: temp104.q = 1
-2: temp105.q = 6
-3: temp1.d = temp1.d & not.q(((sx.q(1) << temp104.q) - 1) << temp105.q)
-4: temp1.d = temp1.d | (R0 & ((sx.q(1) << temp104.q) - 1)) << temp105.q
-5: R1 = temp1.d
-6: temp200.d = LR
-7: <return> jump(LR)''')
+0: temp104.q = 1
+1: temp105.q = 6
+2: R1 = R1 & not.q(((sx.q(1) << temp104.q) - 1) << temp105.q)
+3: R1 = R1 | (R0 & ((sx.q(1) << temp104.q) - 1)) << temp105.q
+4: temp200.d = LR
+5: <return> jump(LR)''')
 
   def test_extract(self):
     func = self.get_function('test_extract')
@@ -688,10 +638,9 @@ R1.L = #0x22 }
         self.list_llil(func), '''
 0: temp104.q = 2
 1: temp105.q = 0x14
-2: temp1.d = R0 u>> temp105.q & ((1 << temp104.q) - 1)
-3: R1 = temp1.d
-4: temp200.d = LR
-5: <return> jump(LR)''')
+2: R1 = R0 u>> temp105.q & ((1 << temp104.q) - 1)
+3: temp200.d = LR
+4: <return> jump(LR)''')
 
   def test_global_pointer_relative_offset(self):
     func = self.get_function('test_global_pointer_relative_offset')
@@ -702,10 +651,9 @@ R1.L = #0x22 }
     self.assertEqual(
         self.list_llil(func), '''
 0: temp100.d = GP + 0x10
-1: temp1.d = [temp100.d].d
-2: R1 = temp1.d
-3: temp200.d = LR
-4: <return> jump(LR)''')
+1: R1 = [temp100.d].d
+2: temp200.d = LR
+3: <return> jump(LR)''')
 
   def test_global_pointer_relative_imm(self):
     func = self.get_function('test_global_pointer_relative_imm')
@@ -716,10 +664,9 @@ R1.L = #0x22 }
     self.assertEqual(
         self.list_llil(func), '''
 0: temp100.d = GP + 0x10
-1: temp1.d = [temp100.d].d
-2: R1 = temp1.d
-3: temp200.d = LR
-4: <return> jump(LR)''')
+1: R1 = [temp100.d].d
+2: temp200.d = LR
+3: <return> jump(LR)''')
 
   def test_global_pointer_relative_immext(self):
     func = self.get_function('test_global_pointer_relative_immext')
@@ -731,10 +678,9 @@ R1 = memw(0+##0x123450) }
     self.assertEqual(
         self.list_llil(func), '''
 0: temp100.d = 0x123450
-1: temp1.d = [temp100.d {0x123450}].d
-2: R1 = temp1.d
-3: temp200.d = LR
-4: <return> jump(LR)''')
+1: R1 = [temp100.d {0x123450}].d
+2: temp200.d = LR
+3: <return> jump(LR)''')
 
   def test_swiz(self):
     func = self.get_function('test_swiz')
@@ -743,10 +689,9 @@ R1 = memw(0+##0x123450) }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp1.d = (R0 & 0xff) << 0x18 | (R0 & 0xff00) << 8 | (R0 & 0xff0000) u>> 8 | (R0 & 0xff000000) u>> 0x18
-1: R1 = temp1.d
-2: temp200.d = LR
-3: <return> jump(LR)''')
+0: R1 = (R0 & 0xff) << 0x18 | (R0 & 0xff00) << 8 | (R0 & 0xff0000) u>> 8 | (R0 & 0xff000000) u>> 0x18
+1: temp200.d = LR
+2: <return> jump(LR)''')
 
   def test_combine_zero_and_reg(self):
     func = self.get_function('test_combine_zero_and_reg')
@@ -757,13 +702,12 @@ R1 = memw(0+##0x123450) }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp0.d = 1
-1: R0 = temp0.d
-2: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | (R0 & 0xffffffff) << 0
-3: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | 0 << 0x20
-4: R3:R2 = temp2.q
-5: temp200.d = LR
-6: <return> jump(LR)''')
+0: R0 = 1
+1: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | (R0 & 0xffffffff) << 0
+2: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | 0 << 0x20
+3: R3:R2 = temp2.q
+4: temp200.d = LR
+5: <return> jump(LR)''')
 
   def test_combine_reg_and_zero(self):
     func = self.get_function('test_combine_reg_and_zero')
@@ -774,13 +718,12 @@ R1 = memw(0+##0x123450) }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp0.d = 1
-1: R0 = temp0.d
-2: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | 0 << 0
-3: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | (R0 & 0xffffffff) << 0x20
-4: R3:R2 = temp2.q
-5: temp200.d = LR
-6: <return> jump(LR)''')
+0: R0 = 1
+1: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | 0 << 0
+2: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | (R0 & 0xffffffff) << 0x20
+3: R3:R2 = temp2.q
+4: temp200.d = LR
+5: <return> jump(LR)''')
 
   def test_combine_imms(self):
     func = self.get_function('test_combine_imms')
@@ -806,15 +749,13 @@ R3:R2 = combine(#0x1,##0x30400) }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp0.d = 1
-1: temp1.d = 2
-2: R1 = temp1.d
-3: R0 = temp0.d
-4: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | (R1 & 0xffffffff) << 0
-5: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | (R0 & 0xffffffff) << 0x20
-6: R3:R2 = temp2.q
-7: temp200.d = LR
-8: <return> jump(LR)''')
+0: R0 = 1
+1: R1 = 2
+2: temp2.q = (temp2.q & not.q(0xffffffff << 0)) | (R1 & 0xffffffff) << 0
+3: temp2.q = (temp2.q & not.q(0xffffffff << 0x20)) | (R0 & 0xffffffff) << 0x20
+4: R3:R2 = temp2.q
+5: temp200.d = LR
+6: <return> jump(LR)''')
 
   def test_rol(self):
     func = self.get_function('test_rol')
@@ -824,10 +765,9 @@ R3:R2 = combine(#0x1,##0x30400) }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp5.d = rol.d(R1, 0x1c)
-1: R5 = temp5.d
-2: temp200.d = LR
-3: <return> jump(LR)''')
+0: R5 = rol.d(R1, 0x1c)
+1: temp200.d = LR
+2: <return> jump(LR)''')
 
   def test_rol_pair(self):
     func = self.get_function('test_rol_pair')
@@ -877,20 +817,16 @@ if (P0.new) R1 = #0x3 }
 { jumpr LR }''')
     self.assertEqual(
         self.list_llil(func), '''
-0: temp0.d = 2
-1: R0 = temp0.d
-2: temp1.d = 5
-3: R1 = temp1.d
-4: temp90.b = R0.b
-5: if (temp90.b & 1) then 6 else 8
-6: temp1.d = 3
-7: goto 8
-8: R1 = temp1.d
-9: P0 = temp90.b
-10: temp0.d = R1
-11: R0 = temp0.d
-12: temp200.d = LR
-13: <return> jump(LR)''')
+0: R0 = 2
+1: R1 = 5
+2: temp90.b = R0.b
+3: if (temp90.b & 1) then 4 else 6
+4: R1 = 3
+5: goto 6
+6: P0 = temp90.b
+7: R0 = R1
+8: temp200.d = LR
+9: <return> jump(LR)''')
     self.assertEqual(
         self.list_hlil(func), '''
 int32_t P3:0
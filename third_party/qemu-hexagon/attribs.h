@@ -27,7 +27,8 @@ enum {
 #undef DEF_ATTRIB
 };
 
-#define GET_ATTRIB(opcode, attrib) test_bit(attrib, opcode_attribs[opcode])
+#define GET_ATTRIB(opcode, attrib)                                             \
+  ((opcode_attribs[opcode][(attrib) / 64] >> ((attrib) % 64)) & 1)
 
 #ifdef __cplusplus
 }
@@ -160,17 +160,19 @@ static const DectreeTable dectree_table_DECODE_EXT_EXT_noext = {
         {.type = DECTREE_ENTRY_INVALID, .opcode = XX_LAST_OPCODE},
     }};
 
-static const DectreeTable *ext_trees[XX_LAST_EXT_IDX];
-
-static void decode_ext_init(void) {
-  int i;
-  for (i = EXT_IDX_noext; i < EXT_IDX_noext_AFTER; i++) {
-    ext_trees[i] = &dectree_table_DECODE_EXT_EXT_noext;
-  }
-  for (i = EXT_IDX_mmvec; i < EXT_IDX_mmvec_AFTER; i++) {
-    ext_trees[i] = &dectree_table_DECODE_EXT_EXT_mmvec;
-  }
-}
+static const DectreeTable *const ext_trees[XX_LAST_EXT_IDX] = {
+    [EXT_IDX_noext + 0] = &dectree_table_DECODE_EXT_EXT_noext,
+    [EXT_IDX_noext + 1] = &dectree_table_DECODE_EXT_EXT_noext,
+    [EXT_IDX_noext + 2] = &dectree_table_DECODE_EXT_EXT_noext,
+    [EXT_IDX_noext + 3] = &dectree_table_DECODE_EXT_EXT_noext,
+    [EXT_IDX_mmvec + 0] = &dectree_table_DECODE_EXT_EXT_mmvec,
+    [EXT_IDX_mmvec + 1] = &dectree_table_DECODE_EXT_EXT_mmvec,
+    [EXT_IDX_mmvec + 2] = &dectree_table_DECODE_EXT_EXT_mmvec,
+    [EXT_IDX_mmvec + 3] = &dectree_table_DECODE_EXT_EXT_mmvec,
+};
+_Static_assert(EXT_IDX_noext_AFTER - EXT_IDX_noext == 4 &&
+                   EXT_IDX_mmvec_AFTER - EXT_IDX_mmvec == 4,
+               "ext_trees initializer is out of date");
 
 typedef struct {
   uint32_t mask;
@@ -223,8 +225,6 @@ static const DecodeITableEntry decode_legacy_itable[XX_LAST_OPCODE] = {
 #undef DECODE_NEW_TABLE
 #undef DECODE_SEPARATOR_BITS
 
-void decode_init(void) { decode_ext_init(); }
-
 void decode_send_insn_to(Packet *packet, int start, int newloc) {
   Insn tmpinsn;
   int direction;
@@ -602,3 +602,29 @@ int decode_packet_safe(int max_words, const uint32_t *words, Packet *pkt,
   }
   return decode_packet(max_words, words, pkt, disas_only);
 }
+
+int decode_packets_safe(int max_words, const uint32_t *words, Packet *pkts,
+                        int max_pkts, bool disas_only, int *words_read,
+                        int *res) {
+  /* Modified after setjmp, must survive longjmp. */
+  volatile int num_pkts = 0;
+  volatile int num_words = 0;
+  if (setjmp(decode_jmp_buf) != 0) {
+    *words_read = num_words;
+    *res = -1;
+    return num_pkts;
+  }
+  *res = 1;
+  while (num_pkts < max_pkts && num_words < max_words) {
+    int n = decode_packet(max_words - num_words, words + num_words,
+                          &pkts[num_pkts], disas_only);
+    if (n == 0) {
+      *res = 0;
+      break;
+    }
+    num_words += n;
+    num_pkts++;
+  }
+  *words_read = num_words;
+  return num_pkts;
+}
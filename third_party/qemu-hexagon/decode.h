@@ -24,13 +24,36 @@
 extern "C" {
 #endif
 
-extern void decode_init(void);
+typedef enum {
+  /* Walks the decode tree tables. */
+  DECODE_BACKEND_TABLEWALK,
+  /* Runs the decode trees generated as nested switch statements. */
+  DECODE_BACKEND_SWITCH,
+} DecodeBackend;
+
+/*
+ * Selects the instruction decoder, DECODE_DEFAULT_BACKEND unless set.
+ * Must not be called while decoding.
+ */
+extern void decode_set_backend(DecodeBackend backend);
+extern DecodeBackend decode_get_backend(void);
 
 extern void decode_send_insn_to(Packet *packet, int start, int newloc);
 
 extern int decode_packet_safe(int max_words, const uint32_t *words, Packet *pkt,
                               bool disas_only);
 
+/*
+ * Decodes up to max_pkts consecutive packets into pkts, returning the number
+ * of decoded packets. Stops at the first packet that fails to decode.
+ * *words_read is set to the number of words in the decoded packets, and *res
+ * to the decode_packet_safe result of the packet that stopped decoding, or 1
+ * if none did.
+ */
+extern int decode_packets_safe(int max_words, const uint32_t *words,
+                               Packet *pkts, int max_pkts, bool disas_only,
+                               int *words_read, int *res);
+
 extern void decode_remove_extenders(Packet *packet);
 extern void decode_shuffle_for_execution(Packet *packet);
 extern void decode_split_cmpjump(Packet *pkt);
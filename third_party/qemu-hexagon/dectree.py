@@ -17,6 +17,8 @@
 ##  along with this program; if not, see <http://www.gnu.org/licenses/>.
 ##
 
+import argparse
+import copy
 import io
 import re
 
@@ -84,41 +86,75 @@ for (tag, enc) in iset.enc_ext_spaces.items():
 faketags |= set(subinsn_groupings.keys())
 
 
-def every_bit_counts(bitset):
-  for i in range(1, len(next(iter(bitset)))):
-    if len(set([bits[:i] + bits[i + 1:] for bits in bitset])) == len(bitset):
+def encoding_bits(enc):
+  """Returns (mask, value) of the 0 and 1 bits of an LSB-first encoding."""
+  mask = 0
+  value = 0
+  for (i, bit) in enumerate(enc):
+    if bit in '01':
+      mask |= 1 << i
+    if bit == '1':
+      value |= 1 << i
+  return (mask, value)
+
+
+# The fixed-bit masks and values of all encodings, so that the separator
+# searches work on whole words instead of encoding strings.
+enc_masks = {}
+enc_values = {}
+for (tag, enc) in encs.items():
+  (enc_masks[tag], enc_values[tag]) = encoding_bits(enc)
+
+
+def field_mask(lsb, width):
+  return ((1 << width) - 1) << lsb
+
+
+def field_values(tags, lsb, width):
+  return set([(enc_values[tag] >> lsb) & ((1 << width) - 1) for tag in tags])
+
+
+def every_bit_counts(values, width):
+  for i in range(1, width):
+    low = (1 << i) - 1
+    if len(set([((value >> (i + 1)) << i) | (value & low)
+                for value in values])) == len(values):
       return False
   return True
 
 
+def differentiator_bits(tags):
+  """Returns the mask of the bits that are 0 or 1 in all tags, but not the
+  same in all tags."""
+  opcode_bit_for_all = ~0
+  opcode_bit_is_1_for_all = ~0
+  opcode_bit_is_1_for_any = 0
+  for tag in tags:
+    opcode_bit_for_all &= enc_masks[tag]
+    opcode_bit_is_1_for_all &= enc_values[tag]
+    opcode_bit_is_1_for_any |= enc_values[tag]
+  enc_width = len(encs[next(iter(tags))])
+  return opcode_bit_for_all & opcode_bit_is_1_for_any & \
+      ~opcode_bit_is_1_for_all & field_mask(0, enc_width)
+
+
 def auto_separate(node):
   tags = node['leaves']
   if len(tags) <= 1:
     return
   enc_width = len(encs[next(iter(tags))])
-  opcode_bit_for_all = \
-      [all([encs[tag][i] in '01' \
-          for tag in tags]) for i in range(enc_width)]
-  opcode_bit_is_0_for_all = \
-      [opcode_bit_for_all[i] and all([encs[tag][i] == '0' \
-          for tag in tags]) for i in range(enc_width)]
-  opcode_bit_is_1_for_all = \
-      [opcode_bit_for_all[i] and all([encs[tag][i] == '1' \
-          for tag in tags]) for i in range(enc_width)]
-  differentiator_opcode_bit = \
-      [opcode_bit_for_all[i] and \
-       not (opcode_bit_is_0_for_all[i] or \
-       opcode_bit_is_1_for_all[i]) \
-          for i in range(enc_width)]
+  differentiator_opcode_bits = differentiator_bits(tags)
   best_width = 0
   for width in range(4, 0, -1):
     for lsb in range(enc_width - width, -1, -1):
-      bitset = set([encs[tag][lsb:lsb + width] for tag in tags])
-      if all(differentiator_opcode_bit[lsb:lsb+width]) and \
-          (len(bitset) == len(tags) or every_bit_counts(bitset)):
+      mask = field_mask(lsb, width)
+      if differentiator_opcode_bits & mask != mask:
+        continue
+      values = field_values(tags, lsb, width)
+      if len(values) == len(tags) or every_bit_counts(values, width):
         best_width = width
         best_lsb = lsb
-        caught_all_tags = len(bitset) == len(tags)
+        caught_all_tags = len(values) == len(tags)
         break
     if best_width != 0:
       break
@@ -128,9 +164,9 @@ def auto_separate(node):
   if caught_all_tags:
     for width in range(1, best_width):
       for lsb in range(enc_width - width, -1, -1):
-        bitset = set([encs[tag][lsb:lsb + width] for tag in tags])
-        if all(differentiator_opcode_bit[lsb:lsb+width]) and \
-            len(bitset) == len(tags):
+        mask = field_mask(lsb, width)
+        if differentiator_opcode_bits & mask == mask and \
+            len(field_values(tags, lsb, width)) == len(tags):
           best_width = width
           best_lsb = lsb
           break
@@ -139,18 +175,20 @@ def auto_separate(node):
       break
   node['separator_lsb'] = best_lsb
   node['separator_width'] = best_width
-  node['children'] = []
-  for value in range(2**best_width):
-    child = {}
-    bits = ''.join(reversed('{:0{}b}'.format(value, best_width)))
-    child['leaves'] = \
-        set([tag for tag in tags \
-            if encs[tag][best_lsb:best_lsb+best_width] == bits])
-    node['children'].append(child)
+  node['children'] = [{'leaves': child} \
+      for child in split_tags(tags, best_lsb, best_width)]
   for child in node['children']:
     auto_separate(child)
 
 
+def split_tags(tags, lsb, width):
+  """Returns the tags for each value of the field at lsb."""
+  children = [set() for value in range(2**width)]
+  for tag in tags:
+    children[(enc_values[tag] >> lsb) & ((1 << width) - 1)].add(tag)
+  return children
+
+
 auto_separate(dectree_normal)
 auto_separate(dectree_16bit)
 if subinsn_groupings:
@@ -160,8 +198,160 @@ for dectree_subinsn in dectree_subinsns.values():
 for dectree_ext in dectree_extensions.values():
   auto_separate(dectree_ext)
 
-for tag in faketags:
-  del encs[tag]
+
+def all_trees():
+  """Returns the decode trees, in the order in which they are printed."""
+  trees = [dectree_normal, dectree_16bit]
+  if subinsn_groupings:
+    trees.append(dectree_subinsn_groupings)
+  trees += [tree for (name, tree) in sorted(dectree_subinsns.items())]
+  trees += [tree for (name, tree) in sorted(dectree_extensions.items())]
+  return trees
+
+
+# Widest separator field that optimize_separate() considers.
+max_separator_width = 8
+
+# The cost of a decode table entry, relative to the cost of a lookup of an
+# opcode with average weight.
+table_entry_cost = (1, 16)
+
+
+def optimize_separate(node, weights):
+  """Separates the leaves of node like auto_separate(), minimizing a cost.
+
+  The cost of a tree is the expected number of table lookups to decode an
+  opcode, where weights[tag] is proportional to the frequency of tag, plus
+  table_entry_cost for each table entry. All fields of differentiating bits
+  up to max_separator_width bits wide are searched, with the costs of
+  subtrees memoized by their leaves.
+  """
+  tags = node['leaves']
+  total_weight = sum(weights[tag] for tag in tags)
+  # Scale the costs to integers, so that ties break the same way in every
+  # run.
+  (entry_num, entry_den) = table_entry_cost
+  lookup_scale = len(tags) * entry_den
+  entry_scale = total_weight * entry_num
+  memo = {}
+
+  def best_separator(tags):
+    if len(tags) <= 1:
+      return (0, None)
+    key = frozenset(tags)
+    if key in memo:
+      return memo[key]
+    differentiator_opcode_bits = differentiator_bits(tags)
+    enc_width = len(encs[next(iter(tags))])
+    weight = sum(weights[tag] for tag in tags)
+    best = None
+    seen = set()
+    for width in range(1, max_separator_width + 1):
+      for lsb in range(enc_width - width + 1):
+        mask = field_mask(lsb, width)
+        if differentiator_opcode_bits & mask != mask:
+          continue
+        children = split_tags(tags, lsb, width)
+        partition = frozenset(
+            frozenset(child) for child in children if child)
+        if partition in seen:
+          continue
+        seen.add(partition)
+        cost = weight * lookup_scale + 2**width * entry_scale
+        for child in children:
+          if best is not None and cost >= best[0]:
+            break
+          cost += best_separator(child)[0]
+        if best is None or cost < best[0]:
+          best = (cost, (lsb, width))
+    if best is None:
+      raise Exception('Could not find a way to differentiate the encodings ' +
+                      'of the following tags:\n{}'.format('\n'.join(tags)))
+    memo[key] = best
+    return best
+
+  def separate(node):
+    if len(node['leaves']) <= 1:
+      node.pop('children', None)
+      return
+    (cost, (lsb, width)) = best_separator(node['leaves'])
+    node['separator_lsb'] = lsb
+    node['separator_width'] = width
+    node['children'] = [{'leaves': child} \
+        for child in split_tags(node['leaves'], lsb, width)]
+    for child in node['children']:
+      separate(child)
+
+  separate(node)
+
+
+def read_profile(path):
+  """Reads an opcode profile, with a line "<tag> <count>" per opcode."""
+  profile = {}
+  with open(path) as f:
+    for line in f:
+      fields = line.split()
+      if len(fields) == 2:
+        profile[fields[0]] = int(fields[1])
+  return profile
+
+
+def tree_weights(tree, profile):
+  """Returns the weights of the leaves of tree under profile.
+
+  Every tag counts once more than in the profile, so that opcodes missing
+  from the profile still take part in the cost. An extension space weighs
+  as much as all the tags of its extension.
+  """
+  weights = {}
+  for tag in tree['leaves']:
+    if tag in iset.enc_ext_spaces:
+      # For now, HVX will be the only coproc.
+      ext_tags = dectree_extensions['EXT_mmvec']['leaves']
+      weights[tag] = sum(profile.get(t, 0) + 1 for t in ext_tags)
+    else:
+      weights[tag] = profile.get(tag, 0) + 1
+  return weights
+
+
+def tree_stats(tree, weights):
+  """Returns (expected depth, max depth, tables, entries) of tree."""
+  total_weight = sum(weights.values())
+  stats = [0, 0, 0, 0]
+
+  def visit(node, depth):
+    if len(node['leaves']) <= 1:
+      for tag in node['leaves']:
+        stats[0] += weights[tag] * depth
+        stats[1] = max(stats[1], depth)
+      return
+    stats[2] += 1
+    stats[3] += len(node['children'])
+    for child in node['children']:
+      visit(child, depth + 1)
+
+  visit(tree, 0)
+  stats[0] /= total_weight
+  return tuple(stats)
+
+
+def print_report(f, trees_before, trees_after, profile):
+  print('{:<32} {:^17} {:^11} {:^13} {:^15}'.format(
+      'tree', 'expected depth', 'max depth', 'tables', 'entries').rstrip(),
+        file=f)
+  for (before, after) in zip(trees_before, trees_after):
+    if len(after['leaves']) <= 1:
+      continue
+    weights = tree_weights(after, profile)
+    (depth_before, max_before, tables_before, entries_before) = \
+        tree_stats(before, weights)
+    (depth_after, max_after, tables_after, entries_after) = \
+        tree_stats(after, weights)
+    print('{:<32} {:>7.3f} -> {:<6.3f} {:>3} -> {:<4} {:>4} -> {:<4} '
+          '{:>5} -> {:<5}'.format(
+              table_name([], after), depth_before, depth_after, max_before,
+              max_after, tables_before, tables_after, entries_before,
+              entries_after).rstrip(), file=f)
 
 
 def table_name(parents, node):
@@ -239,11 +429,16 @@ def print_tree(f, tree):
   print_node(f, tree, [])
 
 
+def match_info(tag):
+  enc = ''.join(reversed(encs[tag]))
+  mask = int(re.sub(r'[^1]', r'0', enc.replace('0', '1')), 2)
+  match = int(re.sub(r'[^01]', r'0', enc), 2)
+  return (mask, match)
+
+
 def print_match_info(f):
-  for tag in sorted(encs.keys(), key=iset.tags.index):
-    enc = ''.join(reversed(encs[tag]))
-    mask = int(re.sub(r'[^1]', r'0', enc.replace('0', '1')), 2)
-    match = int(re.sub(r'[^01]', r'0', enc), 2)
+  for tag in sorted(encs.keys() - faketags, key=iset.tags.index):
+    (mask, match) = match_info(tag)
     suffix = ''
     print('DECODE{}_MATCH_INFO({},0x{:x}U,0x{:x}U)'.\
         format(suffix, tag, mask, match), file=f)
@@ -263,100 +458,329 @@ implicit_registers = {'SP': 29, 'FP': 30, 'LR': 31}
 num_registers = {'R': 32, 'V': 32}
 
 
+def op_info(tag):
+  """Returns the operand decoding macros of tag."""
+  lines = []
+  enc = encs[tag]
+  regs = ordered_unique(regre.findall(iset.iset[tag]['syntax']))
+  imms = ordered_unique(immre.findall(iset.iset[tag]['syntax']))
+  regno = 0
+  for reg in regs:
+    reg_type = reg[0]
+    reg_letter = reg[1][0]
+    reg_num_choices = int(reg[3].rstrip('S'))
+    reg_mapping = reg[0] + ''.join(['_' for letter in reg[1]]) + reg[3]
+    reg_enc_fields = re.findall(reg_letter + '+', enc)
+    if len(reg_enc_fields) == 0:
+      raise Exception('Tag "{}" missing register field!'.format(tag))
+    if len(reg_enc_fields) > 1:
+      raise Exception('Tag "{}" has split register field!'.\
+          format(tag))
+    reg_enc_field = reg_enc_fields[0]
+    if 2**len(reg_enc_field) != reg_num_choices:
+      raise Exception('Tag "{}" has incorrect register field width!'.\
+          format(tag))
+    lines.append('DECODE_REG({},{},{})'.\
+        format(regno, len(reg_enc_field), enc.index(reg_enc_field)))
+    if reg_type in num_registers and \
+        reg_num_choices != num_registers[reg_type]:
+      lines.append('DECODE_MAPPED_REG({},{})'.format(regno, reg_mapping))
+    regno += 1
+
+  def implicit_register_key(reg):
+    return implicit_registers[reg]
+
+  for reg in sorted(
+      set([r for r in (iset.iset[tag]['rregs'].split(',') + \
+          iset.iset[tag]['wregs'].split(',')) \
+              if r in implicit_registers]), key=implicit_register_key):
+    lines.append('DECODE_IMPL_REG({},{})'.\
+        format(regno, implicit_registers[reg]))
+    regno += 1
+  if imms and imms[0][0].isupper():
+    imms = reversed(imms)
+  for imm in imms:
+    if imm[0].isupper():
+      immno = 1
+    else:
+      immno = 0
+    imm_type = imm[0]
+    imm_width = int(imm[1])
+    imm_shift = imm[2]
+    if imm_shift:
+      imm_shift = int(imm_shift)
+    else:
+      imm_shift = 0
+    if imm_type.islower():
+      imm_letter = 'i'
+    else:
+      imm_letter = 'I'
+    remainder = imm_width
+    for m in reversed(list(re.finditer(imm_letter + '+', enc))):
+      remainder -= m.end() - m.start()
+      lines.append('DECODE_IMM({},{},{},{})'.\
+          format(immno, m.end() - m.start(), m.start(), remainder))
+    if remainder != 0:
+      if imm[2]:
+        imm[2] = ':' + imm[2]
+      raise Exception('Tag "{}" has an incorrect number of ' + \
+          'encoding bits for immediate "{}"'.\
+          format(tag, ''.join(imm)))
+    if imm_type.lower() in 'sr':
+      lines.append('DECODE_IMM_SXT({},{})'.format(immno, imm_width))
+    if imm_type.lower() == 'n':
+      lines.append('DECODE_IMM_NEG({},{})'.format(immno, imm_width))
+    if imm_shift:
+      lines.append('DECODE_IMM_SHIFT({},{})'.format(immno, imm_shift))
+  return lines
+
+
 def print_op_info(f):
-  for tag in sorted(encs.keys(), key=iset.tags.index):
-    enc = encs[tag]
+  for tag in sorted(encs.keys() - faketags, key=iset.tags.index):
     print(file=f)
     print('DECODE_OPINFO({},'.format(tag), file=f)
-    regs = ordered_unique(regre.findall(iset.iset[tag]['syntax']))
-    imms = ordered_unique(immre.findall(iset.iset[tag]['syntax']))
-    regno = 0
-    for reg in regs:
-      reg_type = reg[0]
-      reg_letter = reg[1][0]
-      reg_num_choices = int(reg[3].rstrip('S'))
-      reg_mapping = reg[0] + ''.join(['_' for letter in reg[1]]) + reg[3]
-      reg_enc_fields = re.findall(reg_letter + '+', enc)
-      if len(reg_enc_fields) == 0:
-        raise Exception('Tag "{}" missing register field!'.format(tag))
-      if len(reg_enc_fields) > 1:
-        raise Exception('Tag "{}" has split register field!'.\
-            format(tag))
-      reg_enc_field = reg_enc_fields[0]
-      if 2**len(reg_enc_field) != reg_num_choices:
-        raise Exception('Tag "{}" has incorrect register field width!'.\
-            format(tag))
-      print('        DECODE_REG({},{},{})'.\
-          format(regno, len(reg_enc_field), enc.index(reg_enc_field)),
-                 file=f)
-      if reg_type in num_registers and \
-          reg_num_choices != num_registers[reg_type]:
-        print('        DECODE_MAPPED_REG({},{})'.\
-            format(regno, reg_mapping), file=f)
-      regno += 1
-
-    def implicit_register_key(reg):
-      return implicit_registers[reg]
-
-    for reg in sorted(
-        set([r for r in (iset.iset[tag]['rregs'].split(',') + \
-            iset.iset[tag]['wregs'].split(',')) \
-                if r in implicit_registers]), key=implicit_register_key):
-      print('        DECODE_IMPL_REG({},{})'.\
-          format(regno, implicit_registers[reg]), file=f)
-      regno += 1
-    if imms and imms[0][0].isupper():
-      imms = reversed(imms)
-    for imm in imms:
-      if imm[0].isupper():
-        immno = 1
-      else:
-        immno = 0
-      imm_type = imm[0]
-      imm_width = int(imm[1])
-      imm_shift = imm[2]
-      if imm_shift:
-        imm_shift = int(imm_shift)
-      else:
-        imm_shift = 0
-      if imm_type.islower():
-        imm_letter = 'i'
-      else:
-        imm_letter = 'I'
-      remainder = imm_width
-      for m in reversed(list(re.finditer(imm_letter + '+', enc))):
-        remainder -= m.end() - m.start()
-        print('        DECODE_IMM({},{},{},{})'.\
-            format(immno, m.end() - m.start(), m.start(), remainder),
-                file=f)
-      if remainder != 0:
-        if imm[2]:
-          imm[2] = ':' + imm[2]
-        raise Exception('Tag "{}" has an incorrect number of ' + \
-            'encoding bits for immediate "{}"'.\
-            format(tag, ''.join(imm)))
-      if imm_type.lower() in 'sr':
-        print('        DECODE_IMM_SXT({},{})'.\
-            format(immno, imm_width), file=f)
-      if imm_type.lower() == 'n':
-        print('        DECODE_IMM_NEG({},{})'.\
-            format(immno, imm_width), file=f)
-      if imm_shift:
-        print('        DECODE_IMM_SHIFT({},{})'.\
-            format(immno, imm_shift), file=f)
+    for line in op_info(tag):
+      print('        ' + line, file=f)
     print(')', file=f)
 
 
+def switch_function_name(tree):
+  return 'decode_switch_' + table_name([], tree)
+
+
+def print_switch_leaf(f, tag, indent):
+  """Prints the statements that decode a tree leaf with a single tag."""
+  pad = '  ' * indent
+  if tag in iset.enc_ext_spaces:
+    # For now, HVX will be the only coproc.
+    print(pad + 'return decode_switch_DECODE_EXT_EXT_mmvec(insn, encoding);',
+          file=f)
+  else:
+    (mask, match) = match_info(tag)
+    print(pad + 'if ((encoding & 0x{:x}U) != 0x{:x}U) {{'.format(mask, match),
+          file=f)
+    print(pad + '  return 0;', file=f)
+    print(pad + '}', file=f)
+    print(pad + 'decode_op_start(insn, {});'.format(tag), file=f)
+    for line in op_info(tag):
+      print(pad + line, file=f)
+    print(pad + 'insn->iclass = iclass_bits(encoding);', file=f)
+    print(pad + 'return 1;', file=f)
+
+
+def print_switch_node(f, node, indent):
+  """Prints node as nested switch statements on its separator bits."""
+  pad = '  ' * indent
+  if len(node['leaves']) == 0:
+    print(pad + 'return 0;', file=f)
+    return
+  if len(node['leaves']) == 1:
+    (tag,) = node['leaves']
+    print_switch_leaf(f, tag, indent)
+    return
+  print(pad + 'switch (extract32(encoding, {}, {})) {{'.\
+      format(node['separator_lsb'], node['separator_width']), file=f)
+  for (value, child) in enumerate(node['children']):
+    if len(child['leaves']) == 0:
+      continue
+    print(pad + 'case {}:'.format(value), file=f)
+    print_switch_node(f, child, indent + 1)
+    if len(child['leaves']) > 1:
+      print(pad + '  break;', file=f)
+  print(pad + '}', file=f)
+  if indent == 1:
+    print(pad + 'return 0;', file=f)
+
+
+def switch_trees():
+  """Returns the trees of the switch decoder.
+
+  Duplexes are decoded with the direct-index tables of
+  print_subinsn_tables() instead.
+  """
+  trees = [dectree_normal]
+  trees += [tree for (name, tree) in sorted(dectree_extensions.items())]
+  return [tree for tree in trees if tree['leaves']]
+
+
+def print_switch_decoder(f):
+  """Prints a decoder function for each decode tree.
+
+  Each function decodes an instruction with switch statements on the
+  separator bits, and extracts operands inline. Returns the number of
+  decoded instructions, or 0 on failure.
+  """
+  for tree in switch_trees():
+    print('static inline unsigned int {}(Insn *insn, uint32_t encoding);'.\
+        format(switch_function_name(tree)), file=f)
+  for tree in switch_trees():
+    print(file=f)
+    print('static inline unsigned int {}(Insn *insn, uint32_t encoding) {{'.\
+        format(switch_function_name(tree)), file=f)
+    print_switch_node(f, tree, 1)
+    print('}', file=f)
+
+
+def walk_tree(node, encoding):
+  """Returns the leaf tag that the tree walk of node reaches for encoding.
+
+  Returns None if the walk reaches an invalid entry.
+  """
+  while len(node['leaves']) > 1:
+    lsb = node['separator_lsb']
+    width = node['separator_width']
+    node = node['children'][(encoding >> lsb) & ((1 << width) - 1)]
+  if not node['leaves']:
+    return None
+  (tag,) = node['leaves']
+  return tag
+
+
+subinsn_width = 13
+
+
+def subinsn_table(tree):
+  """Returns (tags, index) for the sub-instructions of tree.
+
+  index[encoding] is the position in tags of the sub-instruction that
+  decodes from encoding, or 0 for invalid encodings. tags[0] is None.
+  """
+  tags = [None] + sorted(tree['leaves'], key=iset.tags.index)
+  index = []
+  for encoding in range(2**subinsn_width):
+    tag = walk_tree(tree, encoding)
+    if tag is not None:
+      (mask, match) = match_info(tag)
+      if (encoding & mask) != match:
+        tag = None
+    index.append(tags.index(tag))
+  return (tags, index)
+
+
+def grouping_enc(tag):
+  return ''.join(reversed(subinsn_groupings[tag]['enc'].replace(' ', '')))
+
+
+def subinsn_grouping_bits():
+  """Returns the encoding bits that select a duplex grouping.
+
+  These are the bits that are 0 or 1 in every grouping encoding, as a
+  list of (lsb, width) fields, most significant first.
+  """
+  grouping_encs = [grouping_enc(tag) for tag in subinsn_groupings]
+  fixed = [all(enc[i] in '01' for enc in grouping_encs) for i in range(32)]
+  fields = []
+  i = 0
+  while i < 32:
+    if fixed[i]:
+      lsb = i
+      while i < 32 and fixed[i]:
+        i += 1
+      fields.append((lsb, i - lsb))
+    else:
+      i += 1
+  return list(reversed(fields))
+
+
+def grouping_index(enc, fields):
+  index = 0
+  for (lsb, width) in fields:
+    index = (index << width) | int(''.join(reversed(enc[lsb:lsb + width])), 2)
+  return index
+
+
+def print_subinsn_tables(f):
+  """Prints direct-index tables for duplex decoding.
+
+  Each sub-instruction class gets a table with an entry for every 13-bit
+  sub-instruction encoding, and the groupings get a table indexed by the
+  grouping bits. A duplex then decodes with three lookups, instead of
+  walking the grouping tree and two sub-instruction trees.
+  """
+  for (name, tree) in sorted(dectree_subinsns.items()):
+    (tags, index) = subinsn_table(tree)
+    print('static const Opcode decode_subinsn_opcodes_{}[{}] = {{'.\
+        format(name, len(tags)), file=f)
+    for tag in tags:
+      print('  {},'.format(tag or 'XX_LAST_OPCODE'), file=f)
+    print('};', file=f)
+    print('static const uint8_t decode_subinsn_index_{}[{}] = {{'.\
+        format(name, len(index)), file=f)
+    for i in range(0, len(index), 32):
+      print('  ' + ','.join(str(j) for j in index[i:i + 32]) + ',', file=f)
+    print('};', file=f)
+    print('static const DecodeSubinsnTable decode_subinsn_table_{} = {{'.\
+        format(name), file=f)
+    print('  decode_subinsn_index_{0}, decode_subinsn_opcodes_{0}'.\
+        format(name), file=f)
+    print('};', file=f)
+    print(file=f)
+
+  fields = subinsn_grouping_bits()
+  groupings = [None] * 2**sum(width for (lsb, width) in fields)
+  for tag in subinsn_groupings:
+    if 'RESERVED' not in tag:
+      groupings[grouping_index(grouping_enc(tag), fields)] = tag
+  print('static inline unsigned int ' +
+        'decode_subinsn_grouping_index(uint32_t encoding) {', file=f)
+  index = []
+  shift = 0
+  for (lsb, width) in reversed(fields):
+    if shift:
+      index.append('(extract32(encoding, {}, {}) << {})'.\
+          format(lsb, width, shift))
+    else:
+      index.append('extract32(encoding, {}, {})'.format(lsb, width))
+    shift += width
+  print('  return {};'.format(' | '.join(reversed(index))), file=f)
+  print('}', file=f)
+  print(file=f)
+  print('static const DecodeSubinsnTable *const ' +
+        'decode_subinsn_groupings[{}][2] = {{'.format(len(groupings)), file=f)
+  for tag in groupings:
+    if tag is None:
+      print('  {NULL, NULL},', file=f)
+    else:
+      print('  {{&decode_subinsn_table_{}, &decode_subinsn_table_{}}},'.\
+          format(subinsn_groupings[tag]['class_a'],
+                 subinsn_groupings[tag]['class_b']) + ' /* {} */'.format(tag),
+          file=f)
+  print('};', file=f)
+
+
 if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('dectree_header')
+  parser.add_argument('switch_header', nargs='?')
+  parser.add_argument('subinsn_header', nargs='?')
+  parser.add_argument('--greedy', action='store_true',
+                      help='keep the trees of auto_separate()')
+  parser.add_argument('--profile',
+                      help='opcode profile to weigh the opcodes with')
+  parser.add_argument('--report',
+                      help='file to write the depths of the trees to')
+  args = parser.parse_args()
+
+  profile = read_profile(args.profile) if args.profile else {}
+  trees_before = copy.deepcopy(all_trees())
+  if not args.greedy:
+    for tree in all_trees():
+      optimize_separate(tree, tree_weights(tree, profile))
+  if args.report:
+    with open(args.report, 'w') as f:
+      print_report(f, trees_before, all_trees(), profile)
+
   f = io.StringIO()
-  print_tree(f, dectree_normal)
-  print_tree(f, dectree_16bit)
-  if subinsn_groupings:
-    print_tree(f, dectree_subinsn_groupings)
-  for (name, dectree_subinsn) in sorted(dectree_subinsns.items()):
-    print_tree(f, dectree_subinsn)
-  for (name, dectree_ext) in sorted(dectree_extensions.items()):
-    print_tree(f, dectree_ext)
+  for tree in all_trees():
+    print_tree(f, tree)
   print_match_info(f)
   print_op_info(f)
-  open(sys.argv[1], 'w').write(f.getvalue())
+  open(args.dectree_header, 'w').write(f.getvalue())
+  if args.switch_header:
+    f = io.StringIO()
+    print_switch_decoder(f)
+    open(args.switch_header, 'w').write(f.getvalue())
+  if args.subinsn_header:
+    f = io.StringIO()
+    print_subinsn_tables(f)
+    open(args.subinsn_header, 'w').write(f.getvalue())
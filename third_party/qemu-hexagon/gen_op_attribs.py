@@ -36,6 +36,9 @@ def main():
   ##
   f = StringIO()
   for tag in tags:
+    # opcodes.c builds the attribute bitmaps for up to 16 attributes.
+    if len(attribdict[tag]) > 16:
+      raise Exception('Tag "{}" has more than 16 attributes'.format(tag))
     f.write('OP_ATTRIB(%s,ATTRIBS(%s))\n' % \
         (tag, ','.join(sorted(attribdict[tag]))))
   realf = open(sys.argv[3], 'wt')
@@ -26,7 +26,6 @@
 
 #include <ctype.h>
 #include <setjmp.h>
-#include <stdarg.h>
 #include <string.h>
 
 #include "third_party/qemu-hexagon/decode.h"
@@ -80,16 +79,39 @@ const char *const opcode_short_semantics[] = {
 #undef DEF_SHORTCODE
     NULL};
 
-DECLARE_BITMAP(opcode_attribs[XX_LAST_OPCODE], A_ZZ_LASTATTRIB);
-
-static void init_attribs(int tag, ...) {
-  va_list ap;
-  int attr;
-  va_start(ap, tag);
-  while ((attr = va_arg(ap, int)) != 0) {
-    set_bit(attr, opcode_attribs[tag]);
-  }
-}
+/*
+ * ATTRIB_WORD(W, ...) ORs the bits of the attributes in word W of an
+ * attribute bitmap. The attributes are padded with ATTRIB_NONE, which is in
+ * no word, up to the 16 attributes per opcode that gen_op_attribs.py allows.
+ */
+#define ATTRIB_NONE (64 * OPCODE_ATTRIB_WORDS)
+#define ATTRIB_BIT(W, A) ((A) / 64 == (W) ? UINT64_C(1) << ((A) % 64) : 0)
+#define ATTRIB_WORD(W, ...)                                                    \
+  ATTRIB_WORD_(W, __VA_ARGS__, ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE,          \
+               ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE,             \
+               ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE,             \
+               ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE, ATTRIB_NONE,             \
+               ATTRIB_NONE)
+#define ATTRIB_WORD_(W, A0, A1, A2, A3, A4, A5, A6, A7, A8, A9, A10, A11, A12, \
+                     A13, A14, A15, A16, ...)                                  \
+  (ATTRIB_BIT(W, A0) | ATTRIB_BIT(W, A1) | ATTRIB_BIT(W, A2) |                 \
+   ATTRIB_BIT(W, A3) | ATTRIB_BIT(W, A4) | ATTRIB_BIT(W, A5) |                 \
+   ATTRIB_BIT(W, A6) | ATTRIB_BIT(W, A7) | ATTRIB_BIT(W, A8) |                 \
+   ATTRIB_BIT(W, A9) | ATTRIB_BIT(W, A10) | ATTRIB_BIT(W, A11) |               \
+   ATTRIB_BIT(W, A12) | ATTRIB_BIT(W, A13) | ATTRIB_BIT(W, A14) |              \
+   ATTRIB_BIT(W, A15) | ATTRIB_BIT(W, A16))
+
+_Static_assert(A_ZZ_LASTATTRIB <= 64 * OPCODE_ATTRIB_WORDS,
+               "OPCODE_ATTRIB_WORDS is too small");
+
+const uint64_t opcode_attribs[XX_LAST_OPCODE][OPCODE_ATTRIB_WORDS] = {
+#define ATTRIBS(...) , ##__VA_ARGS__
+#define OP_ATTRIB(TAG, ARGS)                                                   \
+  [TAG] = {ATTRIB_WORD(0, ATTRIB_NONE ARGS), ATTRIB_WORD(1, ATTRIB_NONE ARGS)},
+#include "op_attribs_generated.h"
+#undef OP_ATTRIB
+#undef ATTRIBS
+};
 
 const OpcodeEncoding opcode_encodings[] = {
 #define DEF_ENC32(OPCODE, ENCSTR) [OPCODE] = {.encoding = ENCSTR},
@@ -107,18 +129,6 @@ const OpcodeEncoding opcode_encodings[] = {
 #undef DEF_EXT_ENC
 };
 
-void opcode_init(void) {
-  init_attribs(0, 0);
-
-#define ATTRIBS(...) , ##__VA_ARGS__, 0
-#define OP_ATTRIB(TAG, ARGS) init_attribs(TAG ARGS);
-#include "op_attribs_generated.h"
-#undef OP_ATTRIB
-#undef ATTRIBS
-
-  decode_init();
-}
-
 #define NEEDLE "IMMEXT("
 
 int opcode_which_immediate_is_extended(Opcode opcode) {
@@ -61,9 +61,9 @@ typedef struct {
 
 extern const OpcodeEncoding opcode_encodings[XX_LAST_OPCODE];
 
-extern DECLARE_BITMAP(opcode_attribs[XX_LAST_OPCODE], A_ZZ_LASTATTRIB);
-
-extern void opcode_init(void);
+/* Attribute bitmaps of the opcodes, see GET_ATTRIB */
+#define OPCODE_ATTRIB_WORDS 2
+extern const uint64_t opcode_attribs[XX_LAST_OPCODE][OPCODE_ATTRIB_WORDS];
 
 extern int opcode_which_immediate_is_extended(Opcode opcode);
 
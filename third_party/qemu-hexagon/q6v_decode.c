@@ -63,13 +63,17 @@
  * with the macros defined above, we'll fill in a switch statement
  * where each case is an opcode tag.
  */
-static void decode_op(Insn *insn, Opcode tag, uint32_t encoding) {
+static inline void decode_op_start(Insn *insn, Opcode tag) {
   insn->immed[0] = 0;
   insn->immed[1] = 0;
   insn->opcode = tag;
   if (insn->extension_valid) {
     insn->which_extended = opcode_which_immediate_is_extended(tag);
   }
+}
+
+static void decode_op(Insn *insn, Opcode tag, uint32_t encoding) {
+  decode_op_start(insn, tag);
 
   switch (tag) {
 #include "dectree_generated.h"
@@ -80,6 +84,32 @@ static void decode_op(Insn *insn, Opcode tag, uint32_t encoding) {
   insn->iclass = iclass_bits(encoding);
 }
 
+/*
+ * dectree_switch_generated.h has the decode trees as nested switch
+ * statements, with the operand decoding of each opcode inlined, e.g.
+ *     case 11:
+ *       if ((encoding & 0xf0000000U) != 0xb0000000U) {
+ *         return 0;
+ *       }
+ *       decode_op_start(insn, A2_addi);
+ *       DECODE_REG(0,5,0)
+ *       ...
+ */
+#include "dectree_switch_generated.h"
+
+/*
+ * dectree_subinsn_generated.h has a direct-index table for each
+ * sub-instruction class, mapping every 13-bit encoding to its opcode, and
+ * decode_subinsn_groupings, mapping the grouping bits of a duplex to the
+ * classes of its two sub-instructions.
+ */
+typedef struct {
+  const uint8_t *index;
+  const Opcode *opcodes;
+} DecodeSubinsnTable;
+
+#include "dectree_subinsn_generated.h"
+
 #undef DECODE_REG
 #undef DECODE_IMPL_REG
 #undef DECODE_IMM
@@ -170,8 +200,54 @@ static unsigned int decode_insns_tablewalk(Insn *insn,
   }
 }
 
+static inline unsigned int
+decode_subinsn_direct(Insn *insn, const DecodeSubinsnTable *table,
+                      uint32_t encoding) {
+  Opcode opc = table->opcodes[table->index[encoding]];
+  if (opc == XX_LAST_OPCODE) {
+    return 0;
+  }
+  decode_op(insn, opc, encoding);
+  return 1;
+}
+
+/*
+ * Decodes a duplex with three table lookups, in the same order as
+ * decode_insns_tablewalk
+ */
+static unsigned int decode_subinsns_direct(Insn *insn, uint32_t encoding) {
+  const DecodeSubinsnTable *const *classes =
+      decode_subinsn_groupings[decode_subinsn_grouping_index(encoding)];
+  unsigned int a, b;
+  if (classes[0] == NULL) {
+    return 0;
+  }
+  b = decode_subinsn_direct(insn, classes[1], get_insn_b(encoding));
+  a = decode_subinsn_direct(insn + 1, classes[0], get_insn_a(encoding));
+  if ((a == 0) || (b == 0)) {
+    return 0;
+  }
+  return 2;
+}
+
+#ifndef DECODE_DEFAULT_BACKEND
+#define DECODE_DEFAULT_BACKEND DECODE_BACKEND_SWITCH
+#endif
+
+static DecodeBackend decode_backend = DECODE_DEFAULT_BACKEND;
+
+void decode_set_backend(DecodeBackend backend) { decode_backend = backend; }
+
+DecodeBackend decode_get_backend(void) { return decode_backend; }
+
 static unsigned int decode_insns(Insn *insn, uint32_t encoding) {
   const DectreeTable *table;
+  if (decode_backend == DECODE_BACKEND_SWITCH) {
+    if (parse_bits(encoding) != 0) {
+      return decode_switch_DECODE_ROOT_32(insn, encoding);
+    }
+    return decode_subinsns_direct(insn, encoding);
+  }
   if (parse_bits(encoding) != 0) {
     /* Start with PP table - 32 bit instructions */
     table = &dectree_table_DECODE_ROOT_32;